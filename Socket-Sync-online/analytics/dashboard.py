@@ -1,20 +1,17 @@
 import streamlit as st
 import matplotlib.pyplot as plt
 import pandas as pd
-import sys
-import mysql.connector
+import requests
+import os
 import altair as alt
-import warnings
-
-# Suppress pandas SQLALCHEMY warning
-warnings.filterwarnings('ignore', category=UserWarning, module='pandas')
 
-# Ensure we can import from backend
-import os
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-backend_path = os.path.join(base_dir, 'backend')
-sys.path.append(backend_path)
-from database import Database
+# A thin client of the backend's read-only analytics API (/analytics/* in
+# server.py): every chart is drawn from a few hundred aggregated numbers,
+# never from message rows, and the server keeps the only copy of the data.
+API_URL = os.environ.get("ANALYTICS_API_URL", "http://localhost:5000").rstrip("/")
+API_HEADERS = {"X-Admin-Token": os.environ.get("ADMIN_TOKEN", "")}
+PROBE_TTL = int(os.environ.get("ANALYTICS_PROBE_TTL", 30))
+TOP_USERS = 50
 
 # Page Config
 st.set_page_config(
@@ -23,59 +20,72 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize Database
-@st.cache_resource
-def get_db():
-    return Database()
-
-try:
-    db = get_db()
-except Exception as e:
-    st.error(f"Failed to connect to database: {e}")
-    st.stop()
-
 # Helper Functions
-def get_all_messages():
-    conn = db.get_connection()
-    try:
-        query = "SELECT sender, receiver, timestamp, file_type FROM messages"
-        df = pd.read_sql(query, conn)
-        return df
-    finally:
-        conn.close()
-
-def get_users_dict():
-    conn = db.get_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT user_id, name FROM users")
-        return {u['user_id']: u['name'] for u in cur.fetchall()}
-    finally:
-        conn.close()
+def api(path, method="GET", **params):
+    response = requests.request(method, f"{API_URL}/analytics/{path}", params=params,
+                                headers=API_HEADERS, timeout=30)
+    response.raise_for_status()
+    return response
+
+# Loaders are cached on the API's data version (the ETag of every response):
+# widget reruns (e.g. the sender filter) reuse the frames, and a new version
+# -- something was ingested -- is the only thing that refetches them. Two
+# versions are kept so a session still on the previous one doesn't evict
+# the current.
+@st.cache_data(ttl=PROBE_TTL, show_spinner=False)
+def data_version():
+    # Re-probed at most every PROBE_TTL seconds
+    return api("summary").headers.get("ETag")
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_views(version):
+    def series(rows, key="user_id"):
+        return pd.Series({r[key]: r["count"] for r in rows}, dtype="int64")
+    summary = api("summary").json()
+    counts = api("counts", bucket="day").json()
+    latest = api("counts", bucket="hour", start=summary["last"][:10]).json() if summary["last"] else None
+    return {
+        "totals": summary,
+        "sent": series(api("top-senders", limit=TOP_USERS).json()["senders"]),
+        "shared": series(api("top-senders", limit=TOP_USERS, files_only=1).json()["senders"]),
+        "daily": pd.DataFrame({"date": pd.to_datetime(counts["t"]), "Count": counts["count"]}),
+        "hourly": pd.DataFrame({"hour": range(24), "Count": api("hours").json()["hours"]}),
+        "categories": pd.Series(api("file-types").json()["types"], dtype="int64"),
+        "latest": pd.DataFrame({"hour": pd.to_datetime(latest["t"]), "messages": latest["count"]})
+                  if latest else pd.DataFrame(columns=["hour", "messages"]),
+    }
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_recent_files(version, sender=None, limit=1000):
+    # The file log, newest first: the only row-level data, capped server-side
+    df = pd.DataFrame(api("recent-files", sender=sender, limit=limit).json()["files"],
+                      columns=["timestamp", "sender", "receiver", "file_type", "category"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_users_dict(version):
+    return api("users").json()["users"]
 
 # Load Data
 st.sidebar.title("Socket-Sync 📊")
-if st.sidebar.button("Refresh Data 🔄"):
-    st.cache_data.clear()
-
-users_map = get_users_dict()
+st.sidebar.caption(f"API: {API_URL}")
 try:
-    df = get_all_messages()
-    
-    # Preprocessing
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['sender_name'] = df['sender'].map(users_map).fillna("Unknown")
-        df['receiver_name'] = df['receiver'].map(users_map).fillna("Unknown")
-        df['hour'] = df['timestamp'].dt.hour
-        # specific fix: use normalize to keep it as a timestamp (datetime64) instead of object (date)
-        df['date'] = df['timestamp'].dt.normalize()
-
-except Exception as e:
-    st.error(f"Error loading data: {e}")
+    # The server ingests new messages on its own; Refresh asks for it now
+    if st.sidebar.button("Refresh Data 🔄"):
+        api("refresh", method="POST")
+        data_version.clear()
+    version = data_version()
+    users_map = get_users_dict(version)
+    views = get_views(version)
+except requests.RequestException as e:
+    st.error(f"Error loading data from the analytics API: {e}")
     st.stop()
 
-if df.empty:
+def names(user_ids):
+    return user_ids.map(users_map).fillna("Unknown")
+
+if not views["totals"]["messages"]:
     st.warning("No messages found in the database. Send some messages to see analytics!")
     st.stop()
 
@@ -86,24 +96,26 @@ tab1, tab2, tab3, tab4 = st.tabs(["Overview 🌍", "User Activity 👤", "Time T
 with tab1:
     st.title("Global Overview")
     
+    totals = views["totals"]
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Users", len(users_map))
-    col2.metric("Total Messages", len(df))
-    col3.metric("Files Shared", df['file_type'].notna().sum())
+    col2.metric("Total Messages", totals["messages"])
+    col3.metric("Files Shared", totals["files"])
     
     st.divider()
     
-    st.subheader("Data Preview")
-    # Updated API
-    st.dataframe(df.head(), width="stretch")
+    st.subheader("Latest Activity")
+    # Hourly counts for the most recent day with messages
+    st.dataframe(views["latest"].tail(5), hide_index=True, width="stretch")
 
 # --- TAB 2: USER ACTIVITY ---
 with tab2:
     st.title("User Activity")
     
     # Messages Sent per User
-    msg_counts = df['sender_name'].value_counts().reset_index()
-    msg_counts.columns = ['User', 'Messages Sent']
+    sent = views["sent"]
+    msg_counts = pd.DataFrame({'User': names(sent.index.to_series()).values,
+                               'Messages Sent': sent.values})
     
     if not msg_counts.empty:
         # Altair Chart
@@ -144,7 +156,7 @@ with tab3:
     
     # Daily Activity
     st.subheader("Messages per Day")
-    daily_counts = df.groupby('date').size().reset_index(name='Count')
+    daily_counts = views["daily"]
     
     if not daily_counts.empty:
         # Enforce Temporal type for date (:T)
@@ -159,7 +171,7 @@ with tab3:
     
     # Hourly Activity
     st.subheader("Activity by Hour of Day")
-    hourly_counts = df.groupby('hour').size().reset_index(name='Count')
+    hourly_counts = views["hourly"]
     
     if not hourly_counts.empty:
         # Enforce Ordinal (:O) or Quantitative (:Q) for hour
@@ -176,28 +188,16 @@ with tab3:
 with tab4:
     st.title("File Sharing Deep Dive")
     
-    # Filter for file messages only
-    file_df = df[df['file_type'].notna()].copy()
-    
-    if file_df.empty:
+    if not totals["files"]:
         st.info("No files have been shared yet.")
     else:
-        # Simplify file types
-        def simplify_type(t):
-            t = t.lower()
-            if 'image' in t: return 'Image'
-            if 'video' in t: return 'Video'
-            if 'audio' in t: return 'Audio'
-            return 'Document'
-            
-        file_df['category'] = file_df['file_type'].apply(simplify_type)
-        
         # Stats
         col1, col2 = st.columns(2)
         with col1:
-            st.metric("Total Files", len(file_df))
+            st.metric("Total Files", totals["files"])
             st.write("### File Type Distribution")
-            type_counts = file_df['category'].value_counts()
+            type_counts = views["categories"]
+            type_counts.index = type_counts.index.astype(str)
             
             # Sub-tabs
             chart_tab1, chart_tab2 = st.tabs(["Bar Chart 📊", "Pie Chart 🥧"])
@@ -211,7 +211,9 @@ with tab4:
             
         with col2:
             st.write("### Top File Sharers")
-            sharer_counts = file_df['sender_name'].value_counts()
+            shared = views["shared"]
+            sharer_counts = pd.Series(shared.values, index=names(shared.index.to_series()).values,
+                                      name="count").rename_axis("sender_name")
             st.dataframe(sharer_counts, width="stretch")
 
         # Interaction Filter
@@ -220,8 +222,13 @@ with tab4:
         selected_user = st.selectbox("Filter by Sender", ["All"] + list(users_map.values()))
         
         if selected_user != "All":
-            filtered_view = file_df[file_df['sender_name'] == selected_user]
+            sender_id = next(uid for uid, name in users_map.items() if name == selected_user)
+            filtered_view = get_recent_files(version, sender_id)
         else:
-            filtered_view = file_df
+            filtered_view = get_recent_files(version)
+        filtered_view = filtered_view.assign(
+            date=filtered_view['timestamp'].dt.normalize(),
+            sender_name=names(filtered_view['sender']),
+            receiver_name=names(filtered_view['receiver']))
             
         st.dataframe(filtered_view[['date', 'sender_name', 'receiver_name', 'category', 'file_type']], width="stretch")
@@ -0,0 +1,167 @@
+"""Append messages sent since the last run to the analytics store.
+
+    python analytics/ingest.py [--loop SECONDS] [--page 5000]
+
+Reads message_index in push-key order from just before the stored
+watermark, so each run costs reads proportional to the new messages only.
+Push keys encode their creation time and the index carries sender, receiver
+and (for attachments) file_type, so message bodies are never read, except
+for index entries written before participants were indexed ({"pair"}
+only): those are resolved from chats/<pair>/messages/<key>. Each batch is
+also folded into the hourly rollups (rollups.py). The directory is
+snapshotted to users.parquet on every run for sender/receiver names.
+
+A key is picked before its message is written, so one pushed just before
+the watermark can land after a pass has moved past it. Every pass starts
+ANALYTICS_INGEST_LOOKBACK seconds (push time) before the watermark and
+skips the keys the store already holds; the rollups recount by key too.
+The watermark is saved after the batch's files are written: a crash in
+between re-ingests that batch, and the loader drops the duplicate keys.
+
+Storage reads run on the calling thread; the pandas/Parquet steps go
+through `offload`, which server.py sets to eventlet's tpool.execute so they
+leave the hub while the reads stay green.
+"""
+import os
+import sys
+import time
+import argparse
+
+import pyarrow as pa
+
+import store
+import rollups
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from database import push_id_time, push_id_prefix
+from concurrency import gather_map
+
+INGEST_PAGE = int(os.environ.get("ANALYTICS_INGEST_PAGE", 5000))
+INGEST_LOOKBACK = float(os.environ.get("ANALYTICS_INGEST_LOOKBACK", 300))
+
+
+def _backfill(db, entries):
+    """Fill sender/receiver/file_type of pre-participant index entries from
+    their messages (read side by side); other entries pass through."""
+    legacy = [(key, idx["pair"]) for key, idx in entries
+              if isinstance(idx, dict) and not idx.get("sender") and idx.get("pair")]
+    if not legacy:
+        return entries
+    msgs = gather_map(lambda item: db.chats_ref.child(item[1]).child("messages").child(item[0]).get(),
+                      legacy, timeout=None)
+    resolved = {key: msg for (key, _), msg in zip(legacy, msgs) if isinstance(msg, dict)}
+    filled = []
+    for key, idx in entries:
+        msg = resolved.get(key)
+        if msg:
+            idx = {**idx, "sender": msg.get("sender"), "receiver": msg.get("receiver"),
+                   "file_type": msg.get("file_type") if msg.get("file_url") else None}
+        filled.append((key, idx))
+    return filled
+
+
+def _rows(entries):
+    cols = {name: [] for name in store.MESSAGE_SCHEMA.names}
+    for key, idx in entries:
+        if not isinstance(idx, dict) or not idx.get("sender"):
+            continue   # message gone, or nothing to chart
+        cols["key"].append(key)
+        cols["sender"].append(idx["sender"])
+        cols["receiver"].append(idx.get("receiver"))
+        cols["timestamp"].append(push_id_time(key))
+        cols["file_type"].append(idx.get("file_type"))
+    return pa.Table.from_pydict(cols, schema=store.MESSAGE_SCHEMA)
+
+
+def _inline(fn, *args):
+    return fn(*args)
+
+
+def _store_batch(table, root):
+    """Count a batch into the rollups, then append it; the days written."""
+    rollups.update(table, root)
+    return [os.path.basename(os.path.dirname(path))[len("date="):]
+            for path in store.append_messages(table, root)]
+
+
+def _finish(touched, users, root):
+    for day in touched:
+        store.compact(day, root)
+    store.write_users(users, root)
+
+
+def _known_keys(cursor, root):
+    """Keys at or after cursor that the store already holds."""
+    day = time.strftime("%Y-%m-%d", time.gmtime(push_id_time(cursor) / 1000))
+    keys = store.load_messages(columns=["key"], start=day, root=root)["key"]
+    return set(keys[keys >= cursor])
+
+
+def ingest(db, root=store.ANALYTICS_DIR, page=INGEST_PAGE, lookback=INGEST_LOOKBACK,
+           offload=None):
+    """One incremental pass; returns the number of new message rows."""
+    if not db.ref:
+        return 0
+    offload = offload or _inline
+    state = store.read_state(root)
+    if state["watermark"] and not rollups.read_state(root)["watermark"]:
+        offload(rollups.rebuild, root)   # store written before rollups existed
+    index = db.ref.child("message_index")
+    cursor, known = None, set()
+    if state["watermark"]:
+        cursor = push_id_prefix(max(push_id_time(state["watermark"]) - int(lookback * 1000), 0))
+        known = offload(_known_keys, cursor, root)
+    added = 0
+    touched = set()
+    last = None
+    while True:
+        query = index.order_by_key()
+        if last or cursor:
+            query = query.start_at(last or cursor)
+        entries = list((query.limit_to_first(page + 1).get() or {}).items())
+        full = len(entries) > page
+        if entries and entries[0][0] == last:
+            entries = entries[1:]   # start_at is inclusive
+        if not entries:
+            break
+        last = entries[-1][0]
+        fresh = [(key, idx) for key, idx in entries if key not in known]
+        table = _rows(_backfill(db, fresh))
+        if table.num_rows:
+            touched.update(offload(_store_batch, table, root))
+            known.update(table["key"].to_pylist())
+            added += table.num_rows
+        state = {"watermark": max(state["watermark"] or "", last),
+                 "rows": state.get("rows", 0) + table.num_rows}
+        store.write_state(state, root)
+        if not full:
+            break
+
+    directory = db.directory_ref.get() if db.directory_ref else None
+    users = [{"user_id": e.get("user_id"), "name": e.get("name")}
+             for e in (directory or {}).values() if isinstance(e, dict)]
+    offload(_finish, touched, users, root)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loop", type=float, help="keep ingesting every N seconds")
+    parser.add_argument("--page", type=int, default=INGEST_PAGE)
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database()
+    while True:
+        started = time.perf_counter()
+        added = ingest(db, page=args.page)
+        print(f"ingested {added} messages in {time.perf_counter() - started:.2f}s "
+              f"(watermark {store.read_state()['watermark']})")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
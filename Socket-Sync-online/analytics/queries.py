@@ -0,0 +1,179 @@
+import time
+import hashlib
+import threading
+from functools import lru_cache
+
+import pandas as pd
+
+import store
+import rollups
+
+# ================== QUERIES ==================
+# JSON-ready aggregates over the rollups, served by server.py's /analytics/*
+# routes so clients (the dashboard, /stats) get a few hundred numbers, never
+# message rows. Every kind takes the same filters:
+#
+#   start, end   "YYYY-MM-DD", inclusive, UTC days
+#   user         only messages this user sent or received
+#
+# Results are cached per store.data_version(): between ingests a repeated
+# query is a dict lookup, and an ingest that wrote something invalidates all
+# of them at once. Times are UTC; hour-of-day counts are UTC hours.
+
+BUCKETS = ("hour", "day", "week", "month")
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _day(value, name):
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value, tz="UTC").normalize()
+    except ValueError:
+        raise QueryError(f"{name} must be YYYY-MM-DD") from None
+
+
+def _iso(stamps):
+    return stamps.dt.strftime("%Y-%m-%dT%H:%M:%SZ").tolist()
+
+
+@lru_cache(maxsize=1)
+def _rollups(version, root):
+    return rollups.load(root=root)
+
+
+@lru_cache(maxsize=1)
+def _names(version, root):
+    users = store.load_users(root)
+    return dict(zip(users["user_id"], users["name"]))
+
+
+def _select(version, root, start, end, user):
+    r = _rollups(version, root)
+    if start is not None:
+        r = r[r["hour"] >= start]
+    if end is not None:
+        r = r[r["hour"] < end + pd.Timedelta(days=1)]
+    if user:
+        r = r[(r["sender"] == user) | (r["receiver"] == user)]
+    return r
+
+
+def _bucket(hours, bucket):
+    if bucket == "hour":
+        return hours
+    day = hours.dt.normalize()
+    if bucket == "week":   # weeks start on Monday
+        return day - pd.to_timedelta(day.dt.dayofweek, unit="D")
+    if bucket == "month":
+        return day - pd.to_timedelta(day.dt.day - 1, unit="D")
+    return day
+
+
+# ---------- kinds ----------
+def _summary(r, names, **_):
+    totals = rollups.totals(r)
+    active = pd.concat([r["sender"], r["receiver"]]).dropna().nunique()
+    span = _iso(pd.Series([r["hour"].min(), r["hour"].max()])) if not r.empty else [None, None]
+    return {**totals, "users": len(names), "active_users": int(active),
+            "first": span[0], "last": span[1]}
+
+
+def _counts(r, bucket="day", **_):
+    counts = r.groupby(_bucket(r["hour"], bucket))["count"].sum()
+    return {"bucket": bucket, "t": _iso(counts.index.to_series()), "count": counts.tolist()}
+
+
+def _top_senders(r, names, limit=10, files_only=False, **_):
+    top = rollups.by_sender(r, files_only=files_only).head(limit)
+    return {"senders": [{"user_id": uid, "name": names.get(uid), "count": int(n)}
+                        for uid, n in top.items()]}
+
+
+def _file_types(r, **_):
+    return {"types": {str(k): int(v) for k, v in rollups.categories(r).items()}}
+
+
+def _hours(r, **_):
+    counts = rollups.hour_of_day(r).reindex(range(24), fill_value=0)
+    return {"hours": [int(n) for n in counts]}
+
+
+def _users(r, names, **_):
+    return {"users": names}
+
+
+KINDS = {
+    "summary": _summary,
+    "counts": _counts,
+    "top-senders": _top_senders,
+    "file-types": _file_types,
+    "hours": _hours,
+    "users": _users,
+}
+
+
+@lru_cache(maxsize=256)
+def _cached(version, root, kind, start, end, user, bucket, limit, files_only):
+    r = _select(version, root, start, end, user)
+    return KINDS[kind](r, names=_names(version, root), bucket=bucket, limit=limit,
+                       files_only=files_only)
+
+
+def query(kind, start=None, end=None, user=None, bucket="day", limit=10, files_only=False,
+          root=store.ANALYTICS_DIR):
+    """One aggregate as a JSON-ready dict; QueryError on a bad parameter."""
+    if kind not in KINDS:
+        raise QueryError(f"Unknown query {kind!r}")
+    if bucket not in BUCKETS:
+        raise QueryError(f"bucket must be one of {', '.join(BUCKETS)}")
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    return _cached(store.data_version(root), root, kind, _day(start, "start"), _day(end, "end"),
+                   user or None, bucket, limit, bool(files_only))
+
+
+def recent_files(sender=None, start=None, end=None, limit=100, root=store.ANALYTICS_DIR):
+    """The newest attachments (capped at MAX_LIMIT): the only row-level read."""
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    start, end = _day(start, "start"), _day(end, "end")
+    df = store.load_messages(columns=["timestamp", "sender", "receiver", "file_type"],
+                             start=start.strftime("%Y-%m-%d") if start is not None else None,
+                             end=end.strftime("%Y-%m-%d") if end is not None else None,
+                             senders=[sender] if sender else None, files_only=True, root=root)
+    df = df.nlargest(limit, "timestamp")
+    return {"files": [{"timestamp": t, "sender": s, "receiver": r, "file_type": f, "category": c}
+                      for t, s, r, f, c in zip(_iso(df["timestamp"]), df["sender"], df["receiver"],
+                                               df["file_type"], rollups.categorize(df["file_type"]))]}
+
+
+def version_tag(root=store.ANALYTICS_DIR):
+    """Short ETag for the current data version."""
+    return hashlib.sha1(repr(store.data_version(root)).encode()).hexdigest()[:16]
+
+
+# ---------- freshness ----------
+_last_ingest = 0.0
+_ingest_lock = threading.Lock()
+
+
+def refresh(db, max_age=0, root=store.ANALYTICS_DIR, offload=None):
+    """Ingest what is new if the last ingest is older than max_age seconds.
+
+    A caller that finds another ingest already running skips it and serves
+    what is stored rather than waiting. offload runs the ingest's
+    pandas/Parquet steps (see ingest.py).
+    """
+    global _last_ingest
+    if time.monotonic() - _last_ingest < max_age or not _ingest_lock.acquire(blocking=False):
+        return 0
+    try:
+        from ingest import ingest
+        added = ingest(db, root, offload=offload)
+        _last_ingest = time.monotonic()
+        return added
+    finally:
+        _ingest_lock.release()
@@ -0,0 +1,185 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import store
+
+# ================== ROLLUPS ==================
+# Message counts per (hour, sender, receiver, category), maintained by
+# ingest.py as batches arrive, so dashboard tabs aggregate a few thousand
+# rollup rows instead of scanning every message:
+#
+#   ANALYTICS_DIR/rollups/date=YYYY-MM-DD.parquet   hour, sender, receiver, category, count
+#   ANALYTICS_DIR/rollups/_state.json               {"watermark": <highest key counted>}
+#
+# A batch only rewrites the days it touches, and recounts each of them from
+# the store's rows for that day plus the batch, de-duplicated by key: a key
+# read again (ingest re-scans a trailing window, or re-ingests a batch after
+# a crash) is never counted twice, and one that arrived late below the
+# watermark is still counted. rebuild() recomputes everything from the raw
+# store.
+
+CATEGORIES = ["Text", "Image", "Video", "Audio", "Document"]
+CATEGORY_DTYPE = pd.CategoricalDtype(CATEGORIES)
+ROLLUP_SCHEMA = pa.schema([
+    ("hour", pa.timestamp("ms", tz="UTC")),
+    ("sender", pa.string()),
+    ("receiver", pa.string()),
+    ("category", pa.string()),
+    ("count", pa.int64()),
+])
+KEYS = ["hour", "sender", "receiver", "category"]
+
+
+def _rollup_dir(root):
+    return os.path.join(root, "rollups")
+
+
+def _category(file_type):
+    if file_type is None:
+        return "Text"
+    t = file_type.lower()
+    if "image" in t: return "Image"
+    if "video" in t: return "Video"
+    if "audio" in t: return "Audio"
+    return "Document"
+
+
+def categorize(file_types):
+    """Category per file_type, as a Categorical.
+
+    Classifies each distinct MIME type once (there are a handful) and maps
+    the codes back, instead of a Python call per row.
+    """
+    codes, uniques = pd.factorize(pd.Series(file_types, dtype=object), use_na_sentinel=True)
+    lookup = np.array([CATEGORIES.index(_category(t)) for t in uniques] + [0], dtype=np.int8)
+    # factorize marks missing values with -1, which indexes the trailing "Text"
+    return pd.Categorical.from_codes(lookup[codes], dtype=CATEGORY_DTYPE)
+
+
+def aggregate(df):
+    """Rollup rows for raw message rows (sender, receiver, timestamp, file_type)."""
+    if df.empty:
+        return ROLLUP_SCHEMA.empty_table().to_pandas()
+    frame = pd.DataFrame({
+        "hour": df["timestamp"].dt.floor("h"),
+        "sender": df["sender"],
+        "receiver": df["receiver"],
+        "category": categorize(df["file_type"]),
+    })
+    out = frame.groupby(KEYS, observed=True, sort=False).size().reset_index(name="count")
+    out["category"] = out["category"].astype(str)
+    return out
+
+
+def _merge(frames):
+    merged = pd.concat(frames, ignore_index=True)
+    return merged.groupby(KEYS, sort=True, observed=True)["count"].sum().reset_index()
+
+
+def _write_day(day, df, root):
+    directory = _rollup_dir(root)
+    os.makedirs(directory, exist_ok=True)
+    table = pa.Table.from_pandas(df[ROLLUP_SCHEMA.names], schema=ROLLUP_SCHEMA, preserve_index=False)
+    store._atomic_write(os.path.join(directory, f"date={day}.parquet"),
+                        lambda tmp: pq.write_table(table, tmp))
+
+
+def read_state(root=store.ANALYTICS_DIR):
+    try:
+        with open(os.path.join(_rollup_dir(root), "_state.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"watermark": None}
+
+
+def _write_state(state, root):
+    os.makedirs(_rollup_dir(root), exist_ok=True)
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+    store._atomic_write(os.path.join(_rollup_dir(root), "_state.json"), write)
+
+
+def update(table, root=store.ANALYTICS_DIR):
+    """Fold a batch of message rows (store.MESSAGE_SCHEMA) into the rollups.
+
+    Call it before the batch is appended to the store: a crash in between
+    leaves rows that the next pass appends and recounts the same way.
+    """
+    df = table.to_pandas()
+    if df.empty:
+        return 0
+    day_of = df["timestamp"].dt.strftime("%Y-%m-%d")
+    for day, rows in df.groupby(day_of, sort=False):
+        stored = store.load_messages(start=day, end=day, root=root)
+        rows = pd.concat([stored, rows[stored.columns]], ignore_index=True).drop_duplicates("key")
+        _write_day(day, _merge([aggregate(rows)]), root)
+    _write_state({"watermark": max(read_state(root)["watermark"] or "", df["key"].max())}, root)
+    return len(df)
+
+
+def rebuild(root=store.ANALYTICS_DIR):
+    """Recompute every rollup day from the raw store."""
+    directory = _rollup_dir(root)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+    watermark = None
+    for day in store.days(root):
+        df = store.load_messages(start=day, end=day, root=root)
+        if df.empty:
+            continue
+        _write_day(day, _merge([aggregate(df)]), root)
+        watermark = max(watermark or "", df["key"].max())
+    _write_state({"watermark": watermark}, root)
+
+
+def load(start=None, end=None, root=store.ANALYTICS_DIR):
+    """Rollup rows for "YYYY-MM-DD" bounds (inclusive)."""
+    directory = _rollup_dir(root)
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.startswith("date=") and n.endswith(".parquet"))
+    except OSError:
+        names = []
+    days = [n[len("date="):-len(".parquet")] for n in names]
+    picked = [n for n, d in zip(names, days) if (not start or d >= start) and (not end or d <= end)]
+    if not picked:
+        df = ROLLUP_SCHEMA.empty_table().to_pandas()
+    else:
+        df = pa.concat_tables(pq.read_table(os.path.join(directory, n), schema=ROLLUP_SCHEMA)
+                              for n in picked).to_pandas()
+    df["category"] = df["category"].astype(CATEGORY_DTYPE)
+    return df
+
+
+# ---------- views (what each dashboard tab shows) ----------
+def totals(r):
+    files = int(r.loc[r["category"] != "Text", "count"].sum())
+    return {"messages": int(r["count"].sum()), "files": files}
+
+
+def by_sender(r, files_only=False):
+    if files_only:
+        r = r[r["category"] != "Text"]
+    return r.groupby("sender")["count"].sum().sort_values(ascending=False)
+
+
+def daily(r):
+    return r.groupby(r["hour"].dt.normalize())["count"].sum().rename_axis("date")
+
+
+def hour_of_day(r):
+    return r.groupby(r["hour"].dt.hour)["count"].sum().rename_axis("hour")
+
+
+def categories(r, files_only=True):
+    counts = r.groupby("category", observed=False)["count"].sum()
+    if files_only:
+        counts = counts.drop("Text")
+    return counts[counts > 0].sort_values(ascending=False)
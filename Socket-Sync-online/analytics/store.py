@@ -0,0 +1,169 @@
+import os
+import json
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# ================== ANALYTICS STORE ==================
+# Columnar copy of the message history for the dashboard, kept up to date by
+# ingest.py (append-only, since a watermark):
+#
+#   ANALYTICS_DIR/
+#     messages/date=YYYY-MM-DD/part-*.parquet   one row per message
+#     users.parquet                             user_id, name (directory snapshot)
+#     _state.json                               {"watermark": <last push key>, "rows": n}
+#
+# Partitions are by UTC day, so date-range reads only open those days, and
+# Parquet lets the loader read only the columns a chart needs.
+
+ANALYTICS_DIR = os.environ.get(
+    "ANALYTICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+MESSAGE_SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("sender", pa.string()),
+    ("receiver", pa.string()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("file_type", pa.string()),
+])
+USER_SCHEMA = pa.schema([("user_id", pa.string()), ("name", pa.string())])
+
+
+def _messages_dir(root):
+    return os.path.join(root, "messages")
+
+
+def _atomic_write(path, write):
+    # Dot-prefixed: dataset discovery skips a temp file left by a crash
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+# ---------- state ----------
+def read_state(root=ANALYTICS_DIR):
+    try:
+        with open(os.path.join(root, "_state.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"watermark": None, "rows": 0}
+
+
+def write_state(state, root=ANALYTICS_DIR):
+    os.makedirs(root, exist_ok=True)
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+    _atomic_write(os.path.join(root, "_state.json"), write)
+
+
+# ---------- writing ----------
+def append_messages(table, root=ANALYTICS_DIR):
+    """Write a batch of message rows as one new file per day it covers."""
+    if not table.num_rows:
+        return []
+    day_of = pc.strftime(table["timestamp"], format="%Y-%m-%d")
+    written = []
+    for day in pc.unique(day_of).to_pylist():
+        part = table.filter(pc.equal(day_of, day))
+        directory = os.path.join(_messages_dir(root), f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        # Named by first key: files sort in ingest order within a day
+        path = os.path.join(directory, f"part-{part['key'][0].as_py()}.parquet")
+        _atomic_write(path, lambda tmp: pq.write_table(part, tmp, compression="zstd"))
+        written.append(path)
+    return written
+
+
+def compact(day, root=ANALYTICS_DIR, max_parts=16):
+    """Merge a day's part files once there are more than max_parts."""
+    directory = os.path.join(_messages_dir(root), f"date={day}")
+    parts = sorted(p for p in os.listdir(directory) if p.endswith(".parquet"))
+    if len(parts) <= max_parts:
+        return False
+    table = pa.concat_tables(pq.read_table(os.path.join(directory, p), schema=MESSAGE_SCHEMA)
+                             for p in parts)
+    # Same name as the first part, so a crash mid-way leaves only duplicates
+    # of rows that the loader de-duplicates by key
+    _atomic_write(os.path.join(directory, parts[0]),
+                  lambda tmp: pq.write_table(table, tmp, compression="zstd"))
+    for p in parts[1:]:
+        os.remove(os.path.join(directory, p))
+    return True
+
+
+def write_users(rows, root=ANALYTICS_DIR):
+    os.makedirs(root, exist_ok=True)
+    table = pa.Table.from_pylist(rows, schema=USER_SCHEMA)
+    try:
+        if pq.read_table(os.path.join(root, "users.parquet")).equals(table):
+            return   # unchanged: keep the mtime, data_version() stays put
+    except (OSError, pa.ArrowException):
+        pass
+    _atomic_write(os.path.join(root, "users.parquet"), lambda tmp: pq.write_table(table, tmp))
+
+
+# ---------- reading ----------
+def data_version(root=ANALYTICS_DIR):
+    """Changes whenever ingest writes anything; cheap enough for every rerun.
+
+    The watermark (max ingested key) and row counter from _state.json, the
+    rollups' watermark and the users snapshot's mtime: two tiny JSON reads
+    and a stat, no Parquet opened.
+    """
+    state = read_state(root)
+    try:
+        with open(os.path.join(root, "rollups", "_state.json")) as f:
+            rolled = json.load(f).get("watermark")
+    except (OSError, ValueError):
+        rolled = None
+    try:
+        users = os.stat(os.path.join(root, "users.parquet")).st_mtime_ns
+    except OSError:
+        users = None
+    return (state["watermark"], state.get("rows", 0), rolled, users)
+
+
+def days(root=ANALYTICS_DIR):
+    try:
+        return sorted(d[len("date="):] for d in os.listdir(_messages_dir(root)) if d.startswith("date="))
+    except OSError:
+        return []
+
+
+def load_messages(columns=None, start=None, end=None, senders=None, files_only=False,
+                  root=ANALYTICS_DIR):
+    """Message rows as a DataFrame.
+
+    columns: only these (default all); start/end: "YYYY-MM-DD" bounds
+    (inclusive), resolved against the partition names so other days are
+    never opened; senders / files_only are pushed down to the Parquet scan.
+    """
+    columns = list(columns or MESSAGE_SCHEMA.names)
+    if not days(root):
+        return MESSAGE_SCHEMA.empty_table().select(columns).to_pandas()
+    dataset = ds.dataset(_messages_dir(root), format="parquet", partitioning="hive",
+                         schema=MESSAGE_SCHEMA.append(pa.field("date", pa.string())))
+    where = None
+    if start:
+        where = ds.field("date") >= start
+    for bound in ((ds.field("date") <= end) if end else None,
+                  ds.field("sender").isin(list(senders)) if senders else None,
+                  ds.field("file_type").is_valid() if files_only else None):
+        if bound is not None:
+            where = bound if where is None else where & bound
+    read = columns if "key" in columns else columns + ["key"]
+    df = dataset.to_table(columns=read, filter=where).to_pandas()
+    df = df.drop_duplicates("key")
+    return df[columns].reset_index(drop=True)
+
+
+def load_users(root=ANALYTICS_DIR):
+    try:
+        return pq.read_table(os.path.join(root, "users.parquet")).to_pandas()
+    except (OSError, pa.ArrowException):
+        return USER_SCHEMA.empty_table().to_pandas()
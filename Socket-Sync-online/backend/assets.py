@@ -0,0 +1,75 @@
+import os
+import json
+import mimetypes
+
+from flask import request
+
+from static_files import send_static
+
+# ================== BUILT FRONTEND ASSETS ==================
+# Serves the output of build_assets.py (frontend/dist) when it exists:
+#   * fingerprinted css/js  -> Cache-Control: max-age=1y, immutable
+#   * pages                 -> no-cache (revalidated by ETag)
+#   * .br / .gz sibling picked by Accept-Encoding, with Vary: Accept-Encoding
+# Names that aren't in the build (old bookmarks, un-built files) fall back to
+# the source tree, so running without a build behaves as before.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ENCODING_SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+
+class AssetPipeline:
+    def __init__(self, source_dir, dist_dir=None, fallback_max_age=0):
+        self.source_dir = source_dir
+        self.dist_dir = dist_dir or os.path.join(source_dir, "dist")
+        self.fallback_max_age = fallback_max_age
+        self.assets = {}
+        self.encodings = {}
+        self.built = set()
+
+        manifest_path = os.path.join(self.dist_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            self.assets = manifest.get("assets", {})
+            self.encodings = manifest.get("encodings", {})
+            self.built = set(self.assets.values())
+            print(f"DEBUG: Serving {len(self.built)} built assets from {self.dist_dir}")
+
+    @property
+    def enabled(self):
+        return bool(self.encodings)
+
+    def _pick_encoding(self, rel):
+        available = self.encodings.get(rel) or []
+        accepted = request.accept_encodings
+        for enc in ("br", "gzip"):
+            if enc in available and accepted[enc] > 0:
+                return enc
+        return None
+
+    def _send_built(self, rel, max_age, immutable):
+        mimetype = None
+        enc = self._pick_encoding(rel)
+        headers = {"Vary": "Accept-Encoding"}
+        filename = rel
+        if enc:
+            mimetype = mimetypes.guess_type(rel)[0]
+            headers["Content-Encoding"] = enc
+            filename = rel + ENCODING_SUFFIX[enc]
+        return send_static(self.dist_dir, filename, max_age=max_age, immutable=immutable,
+                           mimetype=mimetype, headers=headers)
+
+    def send(self, kind, filename):
+        """Serve /css, /js (kind = folder) with fingerprint-aware caching."""
+        rel = f"{kind}/{filename}"
+        if rel in self.built:
+            return self._send_built(rel, IMMUTABLE_MAX_AGE, True)
+        return send_static(os.path.join(self.source_dir, kind), filename,
+                           max_age=self.fallback_max_age)
+
+    def send_page(self, filename):
+        rel = f"pages/{filename}"
+        if rel in self.encodings:
+            return self._send_built(rel, 0, False)
+        return send_static(os.path.join(self.source_dir, "pages"), filename)
@@ -0,0 +1,110 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+
+# ================== SESSION TOKENS ==================
+# Stateless signed tokens: base64url(json claims) + "." + base64url(HMAC-SHA256).
+# Claims are {"sub": user_id, "typ": "access"|"refresh", "exp": unix time}.
+# Verifying one is a constant-time compare in memory, so routes and socket
+# handlers learn who the caller is without a user lookup.
+#
+# Access tokens are short-lived and sent on every call (Authorization: Bearer
+# for REST, the Socket.IO connect `auth` payload for sockets). The long-lived
+# refresh token is only exchanged at /auth/refresh for a fresh pair.
+#
+# SESSION_SECRET must be set (and shared) when running several workers; the
+# random fallback means tokens die with the process.
+
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", 15 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", 30 * 24 * 3600))
+
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    def __init__(self, secret=None, access_ttl=ACCESS_TOKEN_TTL, refresh_ttl=REFRESH_TOKEN_TTL):
+        if not secret:
+            print("WARNING: SESSION_SECRET not set; session tokens won't survive a restart.")
+            secret = secrets.token_hex(32)
+        self.key = secret.encode() if isinstance(secret, str) else secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+
+    def _sign(self, body):
+        return _b64encode(hmac.new(self.key, body.encode("ascii"), hashlib.sha256).digest())
+
+    def encode(self, user_id, typ, ttl):
+        claims = {"sub": user_id, "typ": typ, "exp": int(time.time()) + ttl}
+        body = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{body}.{self._sign(body)}"
+
+    def issue(self, user_id):
+        """Fresh access + refresh pair, merged into login responses."""
+        return {
+            "access_token": self.encode(user_id, "access", self.access_ttl),
+            "refresh_token": self.encode(user_id, "refresh", self.refresh_ttl),
+            "expires_in": self.access_ttl,
+        }
+
+    def verify(self, token, typ="access"):
+        """User id the token was issued to; raises AuthError otherwise."""
+        try:
+            body, sig = token.split(".")
+            if not hmac.compare_digest(sig, self._sign(body)):
+                raise ValueError("bad signature")
+            claims = json.loads(_b64decode(body))
+        except Exception:
+            raise AuthError("Invalid token")
+        if claims.get("typ") != typ:
+            raise AuthError("Wrong token type")
+        if claims.get("exp", 0) < time.time():
+            raise AuthError("Token expired")
+        return claims["sub"]
+
+
+# ---------- provider identity ----------
+# /social-login only trusts an identity the provider vouched for: the
+# Supabase session JWT (HS256, signed with the project's JWT secret, from
+# Project Settings > API). The email comes from its claims, never from the
+# request body.
+SUPABASE_JWT_AUDIENCE = "authenticated"
+
+
+def verify_supabase_jwt(token, secret):
+    """Verified claims of a Supabase access token; raises AuthError otherwise."""
+    try:
+        header, payload, sig = token.split(".")
+        if json.loads(_b64decode(header)).get("alg") != "HS256":
+            raise ValueError("unexpected algorithm")
+        key = secret.encode() if isinstance(secret, str) else secret
+        expected = _b64encode(hmac.new(key, f"{header}.{payload}".encode("ascii"),
+                                       hashlib.sha256).digest())
+        if not hmac.compare_digest(sig, expected):
+            raise ValueError("bad signature")
+        claims = json.loads(_b64decode(payload))
+    except Exception:
+        raise AuthError("Invalid identity token")
+    if claims.get("exp", 0) < time.time():
+        raise AuthError("Identity token expired")
+    audience = claims.get("aud")
+    audience = audience if isinstance(audience, list) else [audience]
+    if SUPABASE_JWT_AUDIENCE not in audience or not claims.get("email"):
+        raise AuthError("Identity token not accepted")
+    return claims
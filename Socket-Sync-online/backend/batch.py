@@ -0,0 +1,170 @@
+import eventlet
+
+from database import MEDIA_CATEGORIES
+from auth_tokens import AuthError
+from concurrency import bind_context
+from logs import get_logger
+
+log = get_logger("batch")
+
+# ================== BATCH READS ==================
+# One round trip for the chat page bootstrap: the client posts a list of
+# read-only sub-queries (the same ones it would otherwise send to /contacts,
+# /chat-list, /user/<id>/stats, /user/block_state, /messages, /chat/<id>/media)
+# and gets every result back keyed by its id. Sub-queries run concurrently on
+# a bounded green pool against one scoped Database, so a profile, contact
+# list or block flag needed by several of them is read once.
+#
+#   {"requests": [{"id": "c", "op": "contacts", "args": {"user_id": "a"}}, ...]}
+#   -> {"responses": {"c": {"status": 200, "body": [...]}, ...}}
+
+BATCH_MAX_REQUESTS = 20
+BATCH_CONCURRENCY = 8
+
+
+class BatchError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _require(args, *names):
+    values = [args.get(n) for n in names]
+    missing = [n for n, v in zip(names, values) if not v]
+    if missing:
+        raise BatchError(400, f"Missing {'/'.join(missing)}")
+    return values[0] if len(values) == 1 else values
+
+
+def _limit(args, default, maximum):
+    try:
+        return min(max(int(args.get("limit", default)), 1), maximum)
+    except (TypeError, ValueError):
+        raise BatchError(400, "Invalid limit")
+
+
+def _contacts(db, args):
+    return db.get_contacts(_require(args, "user_id"))
+
+
+def _chat_list(db, args):
+    user_id = _require(args, "user_id")
+    return db.get_chat_list(user_id, before=args.get("before"), limit=_limit(args, 50, 200))
+
+
+def _stats(db, args):
+    return db.get_profile_stats(_require(args, "user_id"))
+
+
+def _block_state(db, args):
+    u1, u2 = _require(args, "u1", "u2")
+    return {"state": db.get_block_state(u1, u2)}
+
+
+def _messages(db, args):
+    u1, u2 = _require(args, "u1", "u2")
+    return db.get_messages_between(u1, u2)
+
+
+def _media(db, args):
+    u1, partner_id = _require(args, "u1", "partner_id")
+    category = args.get("type")
+    if category:
+        category = category.lower().rstrip("s")
+        if category not in MEDIA_CATEGORIES:
+            raise BatchError(400, f"Unknown media type: {category}")
+    return db.get_chat_media(u1, partner_id, category=category,
+                             before=args.get("before"), limit=_limit(args, 50, 100))
+
+
+def _user(db, args):
+    user = db.get_user_by_id(_require(args, "user_id"))
+    if not user:
+        raise BatchError(404, "User not found")
+    # Any caller may look anyone up: only the public profile goes out
+    return {"user_id": user.get("user_id"), "name": user.get("name"), "avatar": user.get("avatar")}
+
+
+def _users(db, args):
+    try:
+        offset = max(int(args.get("offset", 0)), 0)
+    except (TypeError, ValueError):
+        raise BatchError(400, "Invalid offset")
+    return db.search_users(args.get("q", ""), offset, _limit(args, 50, 200))
+
+
+# Arg naming the acting user, checked against the caller like the REST routes
+IDENTITY_ARGS = {
+    "contacts": "user_id",
+    "chat_list": "user_id",
+    "block_state": "u1",
+    "messages": "u1",
+    "media": "u1",
+}
+
+OPS = {
+    "contacts": _contacts,
+    "chat_list": _chat_list,
+    "stats": _stats,
+    "block_state": _block_state,
+    "messages": _messages,
+    "media": _media,
+    "user": _user,
+    "users": _users,
+}
+
+
+def _prepare(item, identify):
+    """(handler, args) ready to run, or an error response."""
+    handler = OPS.get(item.get("op"))
+    if handler is None:
+        return {"status": 400, "body": {"error": f"Unknown op: {item.get('op')}"}}
+    args = item.get("args") or {}
+    if not isinstance(args, dict):
+        return {"status": 400, "body": {"error": "args must be an object"}}
+    name = IDENTITY_ARGS.get(item["op"])
+    if name and identify:
+        try:
+            args = dict(args, **{name: identify(args.get(name))})
+        except AuthError as e:
+            return {"status": e.status, "body": {"error": e.message}}
+    return handler, args
+
+
+def _run_one(db, prepared):
+    if isinstance(prepared, dict):
+        return prepared
+    handler, args = prepared
+    try:
+        return {"status": 200, "body": handler(db, args)}
+    except BatchError as e:
+        return {"status": e.status, "body": {"error": e.message}}
+    except Exception as e:
+        log.error("batch_op_failed", op=handler.__name__.lstrip("_"), error=str(e))
+        return {"status": 500, "body": {"error": "Internal error"}}
+
+
+def run_batch(db, items, identify=None, concurrency=BATCH_CONCURRENCY):
+    """Run sub-queries concurrently; returns {id: {"status", "body"}}.
+
+    identify(claimed_id) resolves the acting user (raising AuthError); it runs
+    up front in the request context, before any green thread is spawned.
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchError(400, "requests must be a non-empty list")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(413, f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    ids = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise BatchError(400, f"requests[{i}] must be an object")
+        ids.append(str(item.get("id", i)))
+    if len(set(ids)) != len(ids):
+        raise BatchError(400, "Duplicate request id")
+
+    prepared = [_prepare(item, identify) for item in items]
+    scoped = db.scoped()
+    pool = eventlet.GreenPool(max(1, min(concurrency, len(items))))
+    results = pool.imap(bind_context(lambda p: _run_one(scoped, p)), prepared)
+    return dict(zip(ids, results))
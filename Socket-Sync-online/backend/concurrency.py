@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+
+# ================== READ FAN-OUT ==================
+# Runs independent storage reads side by side on green threads, so a method
+# that needs N unrelated reads waits for the slowest one instead of the sum.
+# firebase_admin does blocking HTTP, which eventlet's monkey patching turns
+# into cooperative I/O; without it (the dashboard, scripts, tests) green
+# threads would not overlap anything, so the calls simply run in order.
+# eventlet is never imported from here: importing it on a non-main thread
+# leaves that thread unable to exit, which hangs Streamlit's script runner.
+#
+#   user, contacts = gather(lambda: read_user(), lambda: read_contacts())
+#
+# At most `concurrency` calls are in flight. If one call raises, or the whole
+# fan-out exceeds `timeout` seconds, the calls still running are killed and
+# the error (or FanoutTimeout) is raised to the caller. That suits reads; a
+# bulk write must not stop halfway, so settle_map() runs every item to the
+# end and reports the ones that failed instead.
+
+FANOUT_CONCURRENCY = int(os.environ.get("FANOUT_CONCURRENCY", 8))
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", 10))
+
+# Greenlet-local state that spawned calls should inherit from their parent
+# (e.g. the metrics module's per-handler counters): (capture, restore) pairs,
+# capture() runs in the parent, restore(value) in the child before the call.
+CONTEXT_PROPAGATORS = []
+
+
+class FanoutTimeout(Exception):
+    pass
+
+
+def _green():
+    """The eventlet module if this process is monkey patched, else None."""
+    eventlet = sys.modules.get("eventlet")
+    if eventlet is not None and eventlet.patcher.is_monkey_patched("socket"):
+        return eventlet
+    return None
+
+
+def gather(*calls, concurrency=FANOUT_CONCURRENCY, timeout=FANOUT_TIMEOUT):
+    """Run zero-argument callables concurrently; results in call order."""
+    if not calls:
+        return []
+    eventlet = _green()
+    if len(calls) == 1 or eventlet is None:
+        return _sequential(calls, timeout)
+
+    pool = eventlet.GreenPool(max(1, min(concurrency, len(calls))))
+    threads = []
+    try:
+        with eventlet.Timeout(timeout, FanoutTimeout(f"fan-out exceeded {timeout}s")):
+            # spawn() blocks while the pool is full, so the timeout covers
+            # queued calls too
+            for call in calls:
+                threads.append(pool.spawn(bind_context(call)))
+            return [t.wait() for t in threads]
+    finally:
+        for t in threads:
+            if not t.dead:
+                t.kill()
+
+
+def gather_map(fn, items, concurrency=FANOUT_CONCURRENCY, timeout=FANOUT_TIMEOUT):
+    """gather() over fn(item) for each item."""
+    return gather(*[(lambda item=item: fn(item)) for item in items],
+                  concurrency=concurrency, timeout=timeout)
+
+
+def settle_map(fn, items, concurrency=FANOUT_CONCURRENCY):
+    """Run fn(item) for every item, no deadline; a failure never cancels
+    the rest. Returns (results, failures): results in item order (None for
+    a failed item) and [(item, exception)] for the items that raised."""
+    items = list(items)
+    failures = []
+
+    def settle(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            failures.append((item, e))
+            return None
+
+    eventlet = _green()
+    if len(items) <= 1 or eventlet is None:
+        return [settle(item) for item in items], failures
+    pool = eventlet.GreenPool(max(1, min(concurrency, len(items))))
+    threads = [pool.spawn(bind_context(lambda item=item: settle(item))) for item in items]
+    return [t.wait() for t in threads], failures
+
+
+def bind_context(call):
+    """Wrap call so it runs with the caller's propagated greenlet state."""
+    if not CONTEXT_PROPAGATORS:
+        return call
+    captured = [(restore, capture()) for capture, restore in CONTEXT_PROPAGATORS]
+
+    def bound(*args, **kwargs):
+        for restore, value in captured:
+            restore(value)
+        return call(*args, **kwargs)
+    return bound
+
+
+def _sequential(calls, timeout):
+    deadline = time.monotonic() + timeout if timeout else None
+    results = []
+    for call in calls:
+        if deadline is not None and time.monotonic() > deadline:
+            raise FanoutTimeout(f"fan-out exceeded {timeout}s")
+        results.append(call())
+    return results
@@ -2,6 +2,15 @@ import os
 from datetime import datetime
 import json
 import time
+import copy
+import random
+import threading
+
+from user_directory import UserDirectory
+from message_cache import ConversationCache
+from versioning import VersionTable
+from concurrency import gather, gather_map, settle_map
+from logs import get_logger
 
 # Try to import firebase_admin, but handle failure for migration
 try:
@@ -12,12 +21,164 @@ except ImportError:
     FIREBASE_AVAILABLE = False
     print("WARNING: firebase-admin not installed. Backend is in DEPRECATED mode.")
 
+# "firebase" (default) or "memory": the in-process emulator in rtdb_emulator.py,
+# for load tests and local runs without credentials. The emulator can inject
+# per-call latency (+/- uniform jitter) to stand in for the network.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase").lower()
+EMULATOR_LATENCY_MS = float(os.getenv("EMULATOR_LATENCY_MS", 0))
+EMULATOR_JITTER_MS = float(os.getenv("EMULATOR_JITTER_MS", 0))
+
+log = get_logger("database")
+
+# Firebase push-id alphabet (lexicographic order == chronological order)
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_last_push_time = 0
+_last_rand = []
+
+def generate_push_id():
+    # Same algorithm as the Firebase client SDKs: lets us pick the key locally
+    # and write message + indexes in one multi-path update instead of POSTing.
+    global _last_push_time, _last_rand
+    now = int(time.time() * 1000)
+    if now == _last_push_time:
+        for i in range(11, -1, -1):
+            if _last_rand[i] != 63:
+                _last_rand[i] += 1
+                break
+            _last_rand[i] = 0
+    else:
+        _last_rand = [random.randrange(64) for _ in range(12)]
+    _last_push_time = now
+    return push_id_prefix(now) + "".join(PUSH_CHARS[i] for i in _last_rand)
+
+def push_id_prefix(ms):
+    # The 8 time chars of a push id made at epoch ms: sorts before every key
+    # pushed from that millisecond on
+    ts_chars = []
+    for _ in range(8):
+        ts_chars.append(PUSH_CHARS[ms % 64])
+        ms //= 64
+    return "".join(reversed(ts_chars))
+
+def push_id_time(key):
+    # Creation time (epoch ms) encoded in the first 8 chars of a push id
+    ms = 0
+    for ch in key[:8]:
+        ms = ms * 64 + PUSH_CHARS.index(ch)
+    return ms
+
+# Gallery categories for the per-pair media index
+MEDIA_CATEGORIES = ("image", "video", "audio", "doc")
+
+def media_category(file_type):
+    t = (file_type or "").lower()
+    if t.startswith("image"): return "image"
+    if t.startswith("video"): return "video"
+    if t.startswith("audio"): return "audio"
+    return "doc"
+
+REVOKED_TEXT = "🚫 This message was deleted"
+SNIPPET_LEN = 80
+MEDIA_SNIPPETS = {"image": "📷 Photo", "video": "🎥 Video", "audio": "🎵 Audio", "doc": "📄 File"}
+
+def message_snippet(data):
+    text = data.get("message")
+    if isinstance(text, str) and text.strip():
+        text = " ".join(text.split())
+        return text if len(text) <= SNIPPET_LEN else text[:SNIPPET_LEN - 1] + "…"
+    if data.get("file_url"):
+        return MEDIA_SNIPPETS[media_category(data.get("file_type"))]
+    return ""
+
+def increment(n):
+    # RTDB server-side increment (ServerValue.increment)
+    return {".sv": {"increment": n}}
+
+# Storage round trips each public method may make per call, with cold caches:
+# (reads, writes) or (reads, writes, reads per item, writes per item) for
+# methods that fan out over a list (contacts, or the ids of a bulk call).
+# Counted by metrics.instrument_database(); tests/test_round_trip_budget.py
+# runs every method against the emulator and fails on an overrun or on a
+# public method missing from this table.
+ROUND_TRIP_BUDGET = {
+    # users
+    "get_user_by_id": (1, 0),
+    "create_user": (1, 1),
+    "update_password": (0, 1),
+    "get_qr_token": (1, 0),
+    "update_qr_token": (0, 1),
+    "get_user_by_qr_token": (1, 0),
+    "update_avatar": (0, 1),
+    "update_login_streak": (1, 1),
+    "get_profile_stats": (2, 0, 1, 0),
+    "delete_user_data": (0, 1),
+    # directory
+    "rebuild_user_directory": (1, 1),
+    "search_users": (1, 0),
+    "get_all_users": (1, 0),
+    # messages
+    "save_message": (0, 1),
+    "get_message_by_id": (2, 0),
+    "update_message_media": (1, 1),
+    "get_messages_between": (1, 0),
+    "delete_message": (3, 1),
+    "delete_message_for_user": (1, 1),
+    "bulk_delete_messages": (0, 0, 3, 1),
+    "bulk_delete_message_for_user": (0, 0, 1, 1),
+    "mark_messages_read": (2, 1),
+    "mark_message_delivered": (1, 1),
+    "mark_offline_messages_delivered": (0, 0),
+    "get_user_message_counts": (0, 0),
+    "get_chat_media": (1, 0),
+    "clear_chat": (0, 1),
+    # contacts / chat list
+    "add_contact": (1, 1),
+    "remove_contact": (0, 1),
+    "get_contacts": (1, 0, 1, 0),
+    "get_chat_list": (3, 0, 1, 0),
+    # blocking
+    "toggle_block": (1, 1),
+    "is_blocked": (2, 0),
+    "get_block_state": (2, 0),
+    # local only
+    "scoped": (0, 0),
+    "conversation_etag": (0, 0),
+    "chat_list_etag": (0, 0),
+    "contacts_etag": (0, 0),
+}
+
+class _MemoEntry:
+    __slots__ = ("done", "value")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
 class Database:
     def __init__(self):
+        # Per-scope read memo (see scoped()); None on the shared instance
+        self._memo = None
         self.ref = None
+        self.emulator = None
         self.users_ref = None
         self.chats_ref = None
+        # Compact {user_id, name, avatar} mirror of users/, searched in memory
+        self.directory_ref = None
+        self.directory = UserDirectory()
+        # Hot per-pair message windows (write-through, patched in place)
+        self.message_cache = ConversationCache(
+            max_bytes=int(os.getenv("MESSAGE_CACHE_BYTES", 32 * 1024 * 1024)))
+        # Bumped by every mutation; read endpoints turn these into ETags
+        self.versions = VersionTable()
         
+        if STORAGE_BACKEND == "memory":
+            from rtdb_emulator import Emulator
+            self.emulator = Emulator(latency=EMULATOR_LATENCY_MS / 1000,
+                                     jitter=EMULATOR_JITTER_MS / 1000)
+            self._attach(self.emulator.reference('/'))
+            print("Database using in-memory storage (STORAGE_BACKEND=memory).")
+            return
+
         if not FIREBASE_AVAILABLE:
             print("Database initialized in dummy mode (Supabase Migration).")
             return
@@ -56,12 +217,43 @@ class Database:
                     print(f"Failed to init Firebase locally: {e}")
         
         try:
-            self.ref = db.reference('/')
-            self.users_ref = self.ref.child('users')
-            self.chats_ref = self.ref.child('chats')
+            self._attach(db.reference('/'))
         except:
             self.ref = None
 
+    def _attach(self, root):
+        self.ref = root
+        self.users_ref = self.ref.child('users')
+        self.chats_ref = self.ref.child('chats')
+        self.directory_ref = self.ref.child('directory')
+
+    def scoped(self):
+        """Shallow copy sharing refs/caches, with its own read memo.
+
+        Used for one logical request (e.g. /batch): repeated point reads such
+        as the same user profile, contacts subtree or block flag are fetched
+        once, and concurrent greenlets asking for the same key wait for the
+        first fetch instead of issuing their own.
+        """
+        clone = copy.copy(self)
+        clone._memo = {}
+        return clone
+
+    def _memoized(self, key, fetch):
+        if self._memo is None:
+            return fetch()
+        entry = self._memo.get(key)
+        if entry is None:
+            entry = self._memo[key] = _MemoEntry()
+            try:
+                entry.value = fetch()
+            finally:
+                entry.done.set()
+        else:
+            entry.done.wait()
+        # Callers mutate results (e.g. strip password), so hand out copies
+        return copy.deepcopy(entry.value)
+
     def _sanitize(self, key):
         return str(key).replace('.', ',')
 
@@ -70,30 +262,62 @@ class Database:
         s2 = self._sanitize(u2)
         return "-".join(sorted([s1, s2]))
 
+    # Versions / ETags
+    def _touch(self, pair_id=None, inbox=(), contacts=(), profiles=False):
+        keys = []
+        if pair_id: keys.append(f"pair:{pair_id}")
+        keys += [f"inbox:{self._sanitize(u)}" for u in inbox]
+        keys += [f"contacts:{self._sanitize(u)}" for u in contacts]
+        if profiles: keys.append("profiles")
+        self.versions.bump(*keys)
+
+    def conversation_etag(self, u1, u2):
+        return self.versions.etag(f"pair:{self._get_pair_id(u1, u2)}")
+
+    def chat_list_etag(self, user_id):
+        # Contacts without a conversation are listed too, so both feed it
+        key = self._sanitize(user_id)
+        return self.versions.etag(f"inbox:{key}", f"contacts:{key}", "profiles")
+
+    def contacts_etag(self, user_id):
+        return self.versions.etag(f"contacts:{self._sanitize(user_id)}", "profiles")
+
     def get_user_by_id(self, user_id):
         if not self.users_ref: return None
         try:
-            user = self.users_ref.child(self._sanitize(user_id)).get()
-            return user
+            key = self._sanitize(user_id)
+            return self._memoized(("user", key), lambda: self.users_ref.child(key).get())
         except Exception as e:
             return None
 
     def create_user(self, user_data):
         if not self.users_ref: return False, "Backend Deprecated"
         try:
-            if self.get_user_by_id(user_data["userId"]):
+            key = self._sanitize(user_data["userId"])
+            # The directory mirror answers known ids for free; otherwise read
+            # one leaf instead of the whole record (password hash included)
+            if (self.directory.get(user_data["userId"])
+                    or self.users_ref.child(key).child('user_id').get() is not None):
                 return False, "User already exists"
-                
-            self.users_ref.child(self._sanitize(user_data["userId"])).set({
+
+            entry = {
                 "user_id": user_data["userId"],
                 "name": user_data["name"],
-                "password": user_data["password"],
-                "avatar": user_data["avatar"],
-                "created_at": str(datetime.now()),
-                "login_streak": 0,
-                "last_login": None,
-                "qr_token": None
+                "avatar": user_data["avatar"]
+            }
+            self.ref.update({
+                f"users/{key}": {
+                    **entry,
+                    "password": user_data["password"],
+                    "created_at": str(datetime.now()),
+                    "login_streak": 0,
+                    "last_login": None,
+                    "qr_token": None
+                },
+                f"directory/{key}": entry
             })
+            self.directory.upsert(entry)
+            self._touch(profiles=True)
             return True, None
         except Exception as e:
             return False, str(e)
@@ -125,25 +349,50 @@ class Database:
     def update_avatar(self, user_id, avatar_url):
         if not self.users_ref: return False
         try:
-            self.users_ref.child(self._sanitize(user_id)).update({"avatar": avatar_url})
+            key = self._sanitize(user_id)
+            self.ref.update({
+                f"users/{key}/avatar": avatar_url,
+                f"directory/{key}/avatar": avatar_url
+            })
+            self.directory.upsert({"user_id": user_id, "avatar": avatar_url})
+            self._touch(profiles=True)
             return True
         except: return False
 
-    def get_all_users(self):
+    # Directory
+    def rebuild_user_directory(self):
+        # One-time migration / repair: the only place that still reads all of users/
         if not self.users_ref: return []
+        users_dict = self.users_ref.get() or {}
+        directory = {}
+        for key, data in users_dict.items():
+            if not isinstance(data, dict) or not data.get("user_id"): continue
+            directory[key] = {
+                "user_id": data.get("user_id"),
+                "name": data.get("name"),
+                "avatar": data.get("avatar")
+            }
+        self.directory_ref.set(directory)
+        return list(directory.values())
+
+    def _load_directory(self):
+        if not self.directory.stale: return
+        entries = self.directory_ref.get()
+        if entries:
+            entries = list(entries.values())
+        else:
+            entries = self.rebuild_user_directory()
+        self.directory.load(entries)
+
+    def search_users(self, query=None, offset=0, limit=50):
+        if not self.directory_ref: return {"users": [], "total": 0, "next_offset": None}
         try:
-            users_dict = self.users_ref.get()
-            if not users_dict: return []
-            
-            users = []
-            for uid, data in users_dict.items():
-                users.append({
-                    "user_id": data.get("user_id"),
-                    "name": data.get("name"),
-                    "avatar": data.get("avatar")
-                })
-            return users
-        except: return []
+            self._load_directory()
+            return self.directory.search(query, offset, limit)
+        except: return {"users": [], "total": 0, "next_offset": None}
+
+    def get_all_users(self):
+        return self.search_users(limit=10 ** 6)["users"]
 
     def save_message(self, data):
         if not self.chats_ref: return None
@@ -156,9 +405,50 @@ class Database:
             data["status"] = "sent"
             data["is_revoked"] = False
             
-            new_ref = self.chats_ref.child(pair_id).child('messages').push(data)
-            self.ref.child('message_index').child(new_ref.key).set({"pair": pair_id})
-            return new_ref.key
+            key = generate_push_id()
+            # Participants ride along so per-user deletes need no message read
+            index = {"pair": pair_id, "sender": sender, "receiver": receiver}
+            updates = {
+                f"chats/{pair_id}/messages/{key}": data,
+                f"message_index/{key}": index,
+            }
+            # Secondary media index: the gallery never scans messages
+            if data.get("file_url"):
+                category = media_category(data.get("file_type"))
+                entry = {
+                    "category": category,
+                    "cat_key": f"{category}:{key}",
+                    "file_url": data["file_url"],
+                    "file_type": data.get("file_type"),
+                    "sender": sender,
+                    "timestamp": data["timestamp"],
+                }
+                for field in ("thumb_url", "poster_url", "placeholder"):
+                    if data.get(field): entry[field] = data[field]
+                updates[f"chats/{pair_id}/media/{key}"] = entry
+                index["media"] = True
+                # Analytics ingest reads the index only, never the messages
+                index["file_type"] = data.get("file_type")
+
+            # Inbox summaries for both sides (field paths, so unread survives)
+            s_key, r_key = self._sanitize(sender), self._sanitize(receiver)
+            summary = {
+                "last_message": message_snippet(data),
+                "last_key": key,
+                "last_sender": sender,
+                "timestamp": data["timestamp"],
+            }
+            for owner, partner_key, partner in ((s_key, r_key, receiver), (r_key, s_key, sender)):
+                base = f"inbox/{owner}/{partner_key}"
+                updates[f"{base}/partner"] = partner
+                for field, value in summary.items():
+                    updates[f"{base}/{field}"] = value
+            updates[f"inbox/{r_key}/{s_key}/unread"] = increment(1)
+
+            self.ref.update(updates)
+            self.message_cache.append(pair_id, key, dict(data))
+            self._touch(pair_id, inbox=(sender, receiver))
+            return key
         except Exception as e: return None
 
     def get_message_by_id(self, msg_id):
@@ -167,7 +457,12 @@ class Database:
             idx = self.ref.child('message_index').child(msg_id).get()
             if idx:
                 pair_id = idx['pair']
-                msg = self.chats_ref.child(pair_id).child('messages').child(msg_id).get()
+                # Hot windows are write-through: a cached copy is current
+                window = self.message_cache.get(pair_id)
+                if window and msg_id in window:
+                    msg = dict(window[msg_id])
+                else:
+                    msg = self.chats_ref.child(pair_id).child('messages').child(msg_id).get()
                 if msg:
                     msg['id'] = msg_id
                     msg['pair_id'] = pair_id 
@@ -175,98 +470,221 @@ class Database:
             return None
         except: return None
 
+    def update_message_media(self, msg_id, variants):
+        # Attach thumbnail/poster/placeholder once background processing is done
+        if not self.ref: return False
+        try:
+            idx = self.ref.child('message_index').child(msg_id).get()
+            if not idx: return False
+            pair_id = idx['pair']
+            updates = {}
+            for field, value in variants.items():
+                updates[f"{pair_id}/messages/{msg_id}/{field}"] = value
+                updates[f"{pair_id}/media/{msg_id}/{field}"] = value
+            self.chats_ref.update(updates)
+            self.message_cache.patch(pair_id, msg_id, variants)
+            self._touch(pair_id)
+            return True
+        except: return False
+
     def get_messages_between(self, u1, u2):
         if not self.chats_ref: return []
         try:
             pair_id = self._get_pair_id(u1, u2)
-            msgs_dict = self.chats_ref.child(pair_id).child('messages').order_by_key().limit_to_last(100).get()
+            msgs_dict = self.message_cache.get(pair_id)
+            if msgs_dict is None:
+                since = self.message_cache.fill_token()
+                msgs_dict = self.chats_ref.child(pair_id).child('messages').order_by_key().limit_to_last(100).get() or {}
+                # A write that landed during the read may be missing from it
+                self.message_cache.put(pair_id, msgs_dict, since=since)
             
             if not msgs_dict: return []
             
+            # Per-viewer filtering on copies: the cached window is shared
             all_msgs = []
             for mid, m in msgs_dict.items():
+                m = dict(m)
                 m["id"] = mid
                 if m.get('sender') == u1 and m.get('deleted_by_sender'): continue
                 if m.get('receiver') == u1 and m.get('deleted_by_receiver'): continue
                 
                 if m.get('is_revoked'):
-                     m['message'] = "🚫 This message was deleted"
+                     m['message'] = REVOKED_TEXT
                      m['file_url'] = None
                      m['file_type'] = None
+                     m['thumb_url'] = None
+                     m['poster_url'] = None
+                     m['placeholder'] = None
                 
                 all_msgs.append(m)
             return all_msgs
         except: return []
 
-    def delete_message(self, msg_id):
+    def delete_message(self, msg_id, only_sender=None, msg=None):
+        # only_sender: refuse unless the message was sent by this user
+        # msg: the get_message_by_id() result the caller already has
         if not self.chats_ref: return False
         try:
-            msg = self.get_message_by_id(msg_id)
+            if msg is None:
+                msg = self.get_message_by_id(msg_id)
+            if msg and only_sender and msg['sender'] != only_sender:
+                return False
             if msg:
                 pair_id = msg.get('pair_id')
                 if pair_id:
-                     self.chats_ref.child(pair_id).child('messages').child(msg_id).update({
-                        "message": "🚫 This message was deleted",
-                        "file_url": None,
-                        "file_type": None,
+                     base = f"chats/{pair_id}/messages/{msg_id}"
+                     updates = {
+                        f"{base}/message": REVOKED_TEXT,
+                        f"{base}/file_url": None,
+                        f"{base}/file_type": None,
+                        f"{base}/thumb_url": None,
+                        f"{base}/poster_url": None,
+                        f"{base}/placeholder": None,
+                        f"{base}/is_revoked": True,
+                        f"chats/{pair_id}/media/{msg_id}": None,
+                        f"message_index/{msg_id}/media": None,
+                        f"message_index/{msg_id}/file_type": None
+                     }
+                     if not msg.get('is_revoked'):
+                         updates.update(self._inbox_revoke_updates(msg, msg_id))
+                     self.ref.update(updates)
+                     self.message_cache.patch(pair_id, msg_id, {
+                        "message": REVOKED_TEXT, "file_url": None, "file_type": None,
+                        "thumb_url": None, "poster_url": None, "placeholder": None,
                         "is_revoked": True
-                    })
+                     })
+                     self._touch(pair_id, inbox=(msg['sender'], msg['receiver']))
                      return True
             return False
         except: return False
 
+    def _inbox_revoke_updates(self, msg, msg_id):
+        s_key = self._sanitize(msg['sender'])
+        r_key = self._sanitize(msg['receiver'])
+        updates = {}
+        # An unread message no longer counts once revoked. mark_messages_read
+        # flips every sent/delivered message when it zeroes the counter, so
+        # anything not 'read' was counted since the last reset.
+        if msg.get('status') in ('sent', 'delivered'):
+            updates[f"inbox/{r_key}/{s_key}/unread"] = increment(-1)
+        # Only rewrite the preview if this was the latest message
+        last_key = self.ref.child('inbox').child(s_key).child(r_key).child('last_key').get()
+        if last_key == msg_id:
+            updates[f"inbox/{s_key}/{r_key}/last_message"] = REVOKED_TEXT
+            updates[f"inbox/{r_key}/{s_key}/last_message"] = REVOKED_TEXT
+        return updates
+
     def delete_message_for_user(self, msg_id, user_id):
         if not self.chats_ref: return False
         try:
-            msg = self.get_message_by_id(msg_id)
+            # One index read; entries written before participants were
+            # indexed fall back to reading the message itself
+            msg = self.ref.child('message_index').child(msg_id).get()
+            if msg and 'sender' not in msg:
+                full = self.get_message_by_id(msg_id)
+                msg = full and {"pair": full['pair_id'], "sender": full['sender'],
+                                "receiver": full['receiver'], "media": bool(full.get('file_url'))}
             if not msg: return False
-            pair_id = msg.get('pair_id')
+            pair_id = msg['pair']
             
             updates = {}
+            base = f"{pair_id}/messages/{msg_id}"
             if msg['sender'] == user_id:
-                updates['deleted_by_sender'] = True
+                field = 'deleted_by_sender'
             elif msg['receiver'] == user_id:
-                 updates['deleted_by_receiver'] = True
+                field = 'deleted_by_receiver'
+            else:
+                field = None
                  
-            if updates:
-                self.chats_ref.child(pair_id).child('messages').child(msg_id).update(updates)
+            if field:
+                updates[f"{base}/{field}"] = True
+                # Hide it from this user's gallery as well
+                if msg.get('media'):
+                    updates[f"{pair_id}/media/{msg_id}/hidden_by/{self._sanitize(user_id)}"] = True
+                self.chats_ref.update(updates)
+                self.message_cache.patch(pair_id, msg_id, {field: True})
+                self._touch(pair_id)
                 return True
             return False
         except: return False
 
-    def bulk_delete_messages(self, msg_ids):
-        for mid in msg_ids: self.delete_message(mid)
+    def bulk_delete_messages(self, msg_ids, only_sender=None):
+        """Revoke each id; returns the ids actually revoked.
+
+        Every id is attempted even if some are slow or fail: a bulk write
+        never stops partway the way a timed-out read fan-out does.
+        """
+        done, failures = settle_map(lambda mid: self.delete_message(mid, only_sender), msg_ids)
+        for mid, e in failures:
+            log.error("bulk_revoke_failed", msg_id=mid, error=str(e))
+        return [mid for mid, ok in zip(msg_ids, done) if ok]
 
     def bulk_delete_message_for_user(self, msg_ids, user_id):
-        for mid in msg_ids: self.delete_message_for_user(mid, user_id)
+        """Hide each id for user_id; returns the ids actually hidden."""
+        done, failures = settle_map(lambda mid: self.delete_message_for_user(mid, user_id), msg_ids)
+        for mid, e in failures:
+            log.error("bulk_hide_failed", msg_id=mid, error=str(e))
+        return [mid for mid, ok in zip(msg_ids, done) if ok]
 
     def mark_messages_read(self, sender, receiver):
         if not self.chats_ref: return 0
         try:
             pair_id = self._get_pair_id(sender, receiver)
-            msgs = self.chats_ref.child(pair_id).child('messages').order_by_child('status').equal_to('sent').get()
+            messages = self.chats_ref.child(pair_id).child('messages')
+            # Everything the inbox counter counted: not yet read, delivered or not
+            unread = gather(lambda: messages.order_by_child('status').equal_to('sent').get(),
+                            lambda: messages.order_by_child('status').equal_to('delivered').get())
             
             count = 0
-            if msgs:
-                updates = {}
-                for mid, m in msgs.items():
+            # Reader's inbox entry for this sender goes back to zero unread
+            updates = {f"inbox/{self._sanitize(receiver)}/{self._sanitize(sender)}/unread": 0}
+            read_ids = []
+            for msgs in unread:
+                for mid, m in (msgs or {}).items():
                     if m.get('receiver') == receiver: 
-                        updates[f"{mid}/status"] = "read"
+                        updates[f"chats/{pair_id}/messages/{mid}/status"] = "read"
+                        read_ids.append(mid)
                         count += 1
                 
-                if updates:
-                    self.chats_ref.child(pair_id).child('messages').update(updates)
+            self.ref.update(updates)
+            for mid in read_ids:
+                self.message_cache.patch(pair_id, mid, {"status": "read"})
+            self._touch(pair_id, inbox=(receiver,))
             return count
         except: return 0
 
-    def mark_message_delivered(self, msg_id):
-        if not self.chats_ref: return
+    def mark_message_delivered(self, msg_id, receiver=None):
+        """Move a message from 'sent' to 'delivered'; True if it moved.
+
+        Conditional (a transaction on the status), so a receipt that arrives
+        after the message was read never takes it back to 'delivered'.
+        receiver: refuse unless the message was sent to this user.
+        """
+        if not self.chats_ref: return False
         try:
-            msg = self.get_message_by_id(msg_id)
-            if msg:
-                pair_id = msg['pair_id']
-                self.chats_ref.child(pair_id).child('messages').child(msg_id).update({"status": "delivered"})
-        except: pass
+            # The index has the pair and the receiver: no message read
+            idx = self.ref.child('message_index').child(msg_id).get()
+            if not idx: return False
+            if receiver is not None:
+                if 'receiver' not in idx:
+                    # Entries from before participants were indexed
+                    idx = self.get_message_by_id(msg_id) or {}
+                    idx['pair'] = idx.get('pair_id')
+                if idx.get('receiver') != receiver: return False
+            pair_id = idx['pair']
+            moved = []
+
+            def deliver(status):
+                moved[:] = [status == "sent"]
+                return "delivered" if status == "sent" else status
+
+            status = self.chats_ref.child(pair_id).child('messages').child(msg_id).child('status')
+            status.transaction(deliver)
+            if not moved or not moved[0]: return False
+            self.message_cache.patch(pair_id, msg_id, {"status": "delivered"})
+            self._touch(pair_id)
+            return True
+        except: return False
 
     def mark_offline_messages_delivered(self, user_id):
         return []
@@ -282,6 +700,7 @@ class Database:
                 "contact_id": contact_id,
                 "added_at": str(datetime.now())
             })
+            self._touch(contacts=(user_id,))
             return True, None
         except Exception as e: return False, str(e)
 
@@ -289,6 +708,7 @@ class Database:
         if self.users_ref:
             try:
                 self.users_ref.child(self._sanitize(user_id)).child('contacts').child(self._sanitize(contact_id)).delete()
+                self._touch(contacts=(user_id,))
                 return True
             except: return False
         return False
@@ -296,31 +716,93 @@ class Database:
     def get_contacts(self, user_id):
         if not self.users_ref: return []
         try:
-            c_dict = self.users_ref.child(self._sanitize(user_id)).child('contacts').get()
+            key = self._sanitize(user_id)
+            c_dict = self._memoized(("contacts", key),
+                                    lambda: self.users_ref.child(key).child('contacts').get())
             contacts = []
             if c_dict:
-                for cid in c_dict:
-                    original_contact_id = c_dict[cid].get('contact_id')
-                    if original_contact_id:
-                        u = self.get_user_by_id(original_contact_id)
-                        if u:
-                            contacts.append({
-                                "user_id": u["user_id"],
-                                "name": u["name"],
-                                "avatar": u["avatar"]
-                            })
+                contact_ids = [c.get('contact_id') for c in c_dict.values() if c.get('contact_id')]
+                # Profile reads are independent: fetch them side by side
+                for u in gather_map(self.get_user_by_id, contact_ids):
+                    if u:
+                        contacts.append({
+                            "user_id": u["user_id"],
+                            "name": u["name"],
+                            "avatar": u["avatar"]
+                        })
             return contacts
         except: return []
 
-    def get_chat_list(self, user_id):
-        return self.get_contacts(user_id)
+    def get_chat_list(self, user_id, before=None, limit=50):
+        """Inbox summaries newest-first: one read of inbox/<user>.
+
+        before: timestamp cursor (the last item's timestamp from the previous page)
+        Contacts with no conversation yet follow the conversations on the last
+        page. Needs ".indexOn": ["timestamp"] on inbox/$uid.
+        """
+        if not self.ref: return []
+        try:
+            key = self._sanitize(user_id)
+            query = self.ref.child('inbox').child(key).order_by_child('timestamp')
+            if before:
+                query = query.end_at(before)
+            rows = query.limit_to_last(limit + (1 if before else 0)).get() or {}
+
+            self._load_directory()
+            chats = []
+            for row in rows.values():
+                if before and row.get('timestamp') == before: continue
+                partner = row.get('partner')
+                profile = self.directory.get(partner) or {}
+                chats.append({
+                    "user_id": partner,
+                    "name": profile.get("name", partner),
+                    "avatar": profile.get("avatar"),
+                    "last_message": row.get('last_message'),
+                    "last_key": row.get('last_key'),
+                    "last_sender": row.get('last_sender'),
+                    "timestamp": row.get('timestamp'),
+                    "unread_count": max(row.get('unread') or 0, 0)
+                })
+            chats.sort(key=lambda c: c["timestamp"] or "", reverse=True)
+            chats = chats[:limit]
+
+            if len(chats) < limit:
+                chats.extend(self._idle_contacts(user_id, rows, checked_pages=bool(before)))
+            return chats
+        except: return []
+
+    def _idle_contacts(self, user_id, rows, checked_pages=False):
+        """Contacts without an inbox row, shaped like chat list entries."""
+        key = self._sanitize(user_id)
+        c_dict = self._memoized(("contacts", key),
+                                lambda: self.users_ref.child(key).child('contacts').get()) or {}
+        ids = [c.get('contact_id') for ck, c in c_dict.items()
+               if c.get('contact_id') and ck not in rows]
+        if checked_pages and ids:
+            # Earlier pages were not read here: drop contacts that have a row there
+            inbox = self.ref.child('inbox').child(key)
+            partners = gather_map(lambda cid: inbox.child(self._sanitize(cid)).child('partner').get(), ids)
+            ids = [cid for cid, partner in zip(ids, partners) if not partner]
+        idle = []
+        for cid in ids:
+            profile = self.directory.get(cid)
+            if profile:
+                idle.append({"user_id": cid, "name": profile.get("name", cid),
+                             "avatar": profile.get("avatar"), "last_message": None,
+                             "timestamp": None, "unread_count": 0})
+        return idle
 
     # Block
-    def toggle_block(self, blocker, blocked):
+    def toggle_block(self, blocker, blocked, state=None):
+        # state: True/False sets the flag directly (one write, no read);
+        # None flips whatever is stored
         if not self.users_ref: return False
         try:
             ref = self.users_ref.child(self._sanitize(blocker)).child('blocked').child(self._sanitize(blocked))
-            if ref.get():
+            if state is None:
+                state = not ref.get()
+            if not state:
                 ref.delete()
                 return False
             else:
@@ -328,20 +810,27 @@ class Database:
                 return True
         except: return False
 
+    def _block_flag(self, blocker, blocked):
+        b1, b2 = self._sanitize(blocker), self._sanitize(blocked)
+        return self._memoized(("blocked", b1, b2),
+                              lambda: self.users_ref.child(b1).child('blocked').child(b2).get())
+
     def is_blocked(self, u1, u2):
         if not self.users_ref: return False
         try:
-            b1 = self.users_ref.child(self._sanitize(u1)).child('blocked').child(self._sanitize(u2)).get()
-            b2 = self.users_ref.child(self._sanitize(u2)).child('blocked').child(self._sanitize(u1)).get()
+            b1, b2 = gather(lambda: self._block_flag(u1, u2),
+                            lambda: self._block_flag(u2, u1))
             return b1 is not None or b2 is not None
         except: return False
 
     def get_block_state(self, me, other):
         if not self.users_ref: return "none"
         try:
-            if self.users_ref.child(self._sanitize(me)).child('blocked').child(self._sanitize(other)).get():
+            by_me, by_other = gather(lambda: self._block_flag(me, other),
+                                     lambda: self._block_flag(other, me))
+            if by_me:
                 return "blocked_by_me"
-            if self.users_ref.child(self._sanitize(other)).child('blocked').child(self._sanitize(me)).get():
+            if by_other:
                 return "blocked_by_other"
             return "none"
         except: return "none"
@@ -350,45 +839,59 @@ class Database:
         if not self.chats_ref: return False
         try:
             pair_id = self._get_pair_id(u1, u2)
-            self.chats_ref.child(pair_id).delete()
+            k1, k2 = self._sanitize(u1), self._sanitize(u2)
+            self.ref.update({
+                f"chats/{pair_id}": None,
+                f"inbox/{k1}/{k2}": None,
+                f"inbox/{k2}/{k1}": None
+            })
+            self.message_cache.invalidate(pair_id)
+            self._touch(pair_id, inbox=(u1, u2))
             return True
         except: return False
 
-    def update_login_streak(self, user_id):
-        if not self.users_ref: return
+    def update_login_streak(self, user_id, user=None, extra=None):
+        """Record a login; returns the fields written ({} if nothing changed).
+
+        user: the record the caller already read (saves a second read)
+        extra: more fields to write in the same update (e.g. a rehashed password)
+        Repeat logins on the same day only write if `extra` has something.
+        """
+        if not self.users_ref: return {}
         try:
-            u = self.get_user_by_id(user_id)
-            if not u: return
+            u = user if user is not None else self.get_user_by_id(user_id)
+            if not u: return {}
             
             last_login_str = u.get("last_login")
             current_streak = u.get("login_streak", 0)
             
             now = datetime.now()
             today_str = now.strftime("%Y-%m-%d")
+            fields = dict(extra or {})
             
-            new_streak = current_streak
+            # last_login is str(datetime): the date is its first 10 chars
+            last_day = last_login_str[:10] if last_login_str else None
+            if last_day != today_str:
+                if last_day:
+                    delta = (now.date() - datetime.strptime(last_day, "%Y-%m-%d").date()).days
+                    new_streak = current_streak
+                    if delta == 1: new_streak += 1
+                    elif delta > 1: new_streak = 1
+                else: new_streak = 1
+                fields["last_login"] = str(now)
+                fields["login_streak"] = new_streak
             
-            if last_login_str:
-                last_date = datetime.strptime(last_login_str, "%Y-%m-%d %H:%M:%S.%f").date()
-                today_date = now.date()
-                
-                delta = (today_date - last_date).days
-                if delta == 1: new_streak += 1
-                elif delta > 1: new_streak = 1
-            else: new_streak = 1
-                
-            self.users_ref.child(self._sanitize(user_id)).update({
-                "last_login": str(now),
-                "login_streak": new_streak
-            })
-        except: pass
+            if fields:
+                self.users_ref.child(self._sanitize(user_id)).update(fields)
+            return fields
+        except: return {}
 
     def get_profile_stats(self, user_id):
         if not self.users_ref: return {}
         try:
-            u = self.get_user_by_id(user_id)
+            u, contacts = gather(lambda: self.get_user_by_id(user_id),
+                                 lambda: self.get_contacts(user_id))
             if not u: return {}
-            contacts = self.get_contacts(user_id)
             return {
                 "streak": u.get("login_streak", 0),
                 "contacts": len(contacts),
@@ -402,10 +905,53 @@ class Database:
     def delete_user_data(self, user_id):
         if self.users_ref:
             try:
-                self.users_ref.child(self._sanitize(user_id)).delete()
+                key = self._sanitize(user_id)
+                self.ref.update({f"users/{key}": None, f"directory/{key}": None})
+                self.directory.remove(user_id)
+                self._touch(contacts=(user_id,), inbox=(user_id,), profiles=True)
                 return True
             except: pass
         return False
 
-    def get_chat_media(self, u1, partner_id):
-        return []
+    def get_chat_media(self, u1, partner_id, category=None, before=None, limit=50):
+        """Newest-first page of the pair's media index.
+
+        category: one of MEDIA_CATEGORIES (None = all)
+        before:   message key cursor from the previous page's next_before
+        Needs ".indexOn": ["cat_key"] on chats/$pair/media for category queries.
+        """
+        empty = {"items": [], "next_before": None}
+        if not self.chats_ref: return empty
+        try:
+            pair_id = self._get_pair_id(u1, partner_id)
+            media_ref = self.chats_ref.child(pair_id).child('media')
+            # end_at is inclusive, so ask for one extra to drop the cursor row
+            fetch = limit + 1 + (1 if before else 0)
+
+            if category:
+                prefix = f"{category}:"
+                upper = f"{prefix}{before}" if before else prefix + "\uf8ff"
+                query = media_ref.order_by_child('cat_key').start_at(prefix).end_at(upper)
+            else:
+                query = media_ref.order_by_key()
+                if before:
+                    query = query.end_at(before)
+
+            rows = query.limit_to_last(fetch).get() or {}
+            keys = sorted((k for k in rows if k != before), reverse=True)
+            has_more = len(keys) > limit
+            keys = keys[:limit]
+
+            viewer = self._sanitize(u1)
+            items = []
+            for k in keys:
+                entry = rows[k]
+                if not entry.get('file_url'): continue
+                if viewer in (entry.get('hidden_by') or {}): continue
+                entry.pop('hidden_by', None)
+                entry.pop('cat_key', None)
+                entry['id'] = k
+                items.append(entry)
+
+            return {"items": items, "next_before": keys[-1] if has_more and keys else None}
+        except: return empty
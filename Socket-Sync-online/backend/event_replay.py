@@ -0,0 +1,63 @@
+import secrets
+from collections import OrderedDict, deque
+
+# ================== SOCKET EVENT REPLAY ==================
+# Bounded per-user ring of recent outbound events for connection state
+# recovery. Every recorded event gets one server-wide sequence number (put
+# into the payload as "seq", plus "epoch"), and is stored in the ring of each
+# user it concerns. A client that reconnects sends its epoch + last seq:
+#   * gap still in the ring     -> replay just the missing events
+#   * ring overflowed / restart -> caller tells the client to resync over REST
+
+REPLAY_CAPACITY = 256      # events kept per user
+REPLAY_MAX_USERS = 10000   # rings kept (LRU by last event)
+
+
+class _Ring:
+    __slots__ = ("events", "dropped_seq")
+
+    def __init__(self, capacity):
+        self.events = deque(maxlen=capacity)
+        self.dropped_seq = 0   # highest seq pushed out of the ring
+
+
+class ReplayBuffer:
+    def __init__(self, capacity=REPLAY_CAPACITY, max_users=REPLAY_MAX_USERS):
+        self.capacity = capacity
+        self.max_users = max_users
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.rings = OrderedDict()   # user_id -> _Ring
+        # Highest seq that lived in a ring we evicted wholesale: a user we no
+        # longer track may have missed anything up to here.
+        self.floor = 0
+
+    def record(self, event, payload, users):
+        """Stamp payload with a sequence number and remember it for users."""
+        self.seq += 1
+        payload = dict(payload, seq=self.seq, epoch=self.epoch)
+        for user in set(u for u in users if u):
+            ring = self.rings.get(user)
+            if ring is None:
+                ring = self.rings[user] = _Ring(self.capacity)
+            else:
+                self.rings.move_to_end(user)
+            if len(ring.events) == ring.events.maxlen:
+                ring.dropped_seq = ring.events[0][0]
+            ring.events.append((self.seq, event, payload))
+        while len(self.rings) > self.max_users:
+            _, ring = self.rings.popitem(last=False)
+            if ring.events:
+                self.floor = max(self.floor, ring.events[-1][0])
+        return payload
+
+    def since(self, user, epoch, last_seq):
+        """[(event, payload)] after last_seq, or None if the gap can't be replayed."""
+        if epoch != self.epoch or last_seq is None or last_seq > self.seq:
+            return None
+        ring = self.rings.get(user)
+        if ring is None:
+            return None if last_seq < self.floor else []
+        if last_seq < ring.dropped_seq:
+            return None
+        return [(event, payload) for seq, event, payload in ring.events if seq > last_seq]
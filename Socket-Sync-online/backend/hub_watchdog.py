@@ -0,0 +1,142 @@
+import os
+import sys
+import traceback
+from collections import deque
+
+import eventlet
+from eventlet import patcher
+
+from logs import get_logger
+
+# Real OS primitives: the monitor must keep running while the hub is stuck
+_real_threading = patcher.original("threading")
+_real_thread = patcher.original("_thread")
+_real_time = patcher.original("time")
+
+# ================== HUB WATCHDOG ==================
+# Everything runs on one eventlet hub, so a greenlet that computes (or does
+# un-patched blocking I/O) without yielding freezes every socket. Two parts:
+#
+#   * a heartbeat greenlet sleeps `interval` and records how late it woke
+#     up: that is the hub's scheduling lag, kept as a histogram
+#   * a real OS thread notices when the heartbeat is overdue by more than
+#     `threshold`, grabs the hub thread's current stack (sys._current_frames)
+#     and names the server.py handler on it; when the hub comes back the
+#     stall is logged with its total duration
+#
+# Off unless HUB_WATCHDOG=1: when disabled nothing is spawned.
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+HANDLER_FILE = "server.py"
+
+log = get_logger("hub")
+
+
+class LagHistogram:
+    def __init__(self, buckets=LAG_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot: +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += ms
+
+    def snapshot(self):
+        cumulative, running = {}, 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {"buckets_ms": cumulative, "count": self.count, "sum_ms": round(self.sum, 3)}
+
+
+class HubWatchdog:
+    def __init__(self, threshold=0.1, interval=0.05, keep=20):
+        self.threshold = threshold
+        self.interval = interval
+        self.histogram = LagHistogram()
+        self.stalls = deque(maxlen=keep)   # most recent finished stalls
+        self.running = False
+        self._beat = None        # monotonic time of the last heartbeat
+        self._pending = None     # stall seen by the monitor, not yet over
+        self._hub_ident = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        # Called from the hub's own OS thread
+        self._hub_ident = _real_thread.get_ident()
+        self._beat = _real_time.monotonic()
+        eventlet.spawn(self._heartbeat)
+        _real_threading.Thread(target=self._monitor, name="hub-watchdog", daemon=True).start()
+        print(f"DEBUG: Hub watchdog on (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self.running = False
+
+    def _heartbeat(self):
+        while self.running:
+            before = _real_time.monotonic()
+            eventlet.sleep(self.interval)
+            now = _real_time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - before - self.interval)
+            self.histogram.observe(lag * 1000)
+            stall, self._pending = self._pending, None
+            if stall:
+                stall["duration_ms"] = round(lag * 1000, 1)
+                self.stalls.append(stall)
+                log.warning("hub_blocked", handler=stall["handler"],
+                            duration_ms=stall["duration_ms"], stack="".join(stall["stack"]))
+
+    def _monitor(self):
+        while self.running:
+            _real_time.sleep(self.interval)
+            beat = self._beat
+            if self._pending is None and _real_time.monotonic() - beat > self.threshold + self.interval:
+                frame = sys._current_frames().get(self._hub_ident)
+                if frame is None:
+                    continue
+                self._pending = {
+                    "at": _real_time.time(),
+                    "handler": self._handler_name(frame),
+                    "stack": traceback.format_stack(frame),
+                }
+
+    @staticmethod
+    def _handler_name(frame):
+        # Innermost named server.py function on the stack: the route/event
+        # handler (or a helper it called)
+        while frame is not None:
+            code = frame.f_code
+            if os.path.basename(code.co_filename) == HANDLER_FILE and not code.co_name.startswith("<"):
+                return code.co_name
+            frame = frame.f_back
+        return "unknown"
+
+    def exposition(self):
+        """Prometheus lines for the lag histogram (nothing while disabled)."""
+        if not self.running:
+            return []
+        name = "hub_lag_milliseconds"
+        lines = [f"# HELP {name} Eventlet hub scheduling lag",
+                 f"# TYPE {name} histogram"]
+        for bound, n in self.histogram.snapshot()["buckets_ms"].items():
+            lines.append(f'{name}_bucket{{le="{bound}"}} {n}')
+        lines.append(f"{name}_sum {round(self.histogram.sum, 3)}")
+        lines.append(f"{name}_count {self.histogram.count}")
+        return lines
+
+    def snapshot(self):
+        return {
+            "enabled": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "lag": self.histogram.snapshot(),
+            "stalls": [dict(s, stack="".join(s["stack"])) for s in self.stalls],
+        }
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import random
+import logging
+
+# ================== STRUCTURED LOGGING ==================
+# One JSON object per line on stderr: {"ts", "level", "logger", "event", ...fields}.
+# LOG_LEVEL picks the floor (default INFO). Per-message debug lines on the
+# send path are also sampled: LOG_DEBUG_SAMPLE (0..1, default 1) of them are
+# kept once DEBUG is enabled, so it can be left on under load.
+#
+#   log = get_logger("socket")
+#   log.debug("message_saved", msg_id=new_id)
+#   log.warning("save_failed", sender=sender)
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE = float(os.environ.get("LOG_DEBUG_SAMPLE", 1))
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_root = logging.getLogger("socketsync")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(_JsonFormatter())
+    _root.addHandler(_handler)
+    _root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    _root.propagate = False
+
+
+class EventLogger:
+    def __init__(self, name, sample=LOG_DEBUG_SAMPLE):
+        self.logger = _root.getChild(name)
+        self.sample = sample
+
+    def _log(self, level, event, fields, exc_info=False):
+        self.logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        # Level check first: a disabled debug line costs one comparison
+        if self.logger.isEnabledFor(logging.DEBUG) and (
+                self.sample >= 1 or random.random() < self.sample):
+            self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=exc_info)
+
+
+def get_logger(name):
+    return EventLogger(name)
@@ -0,0 +1,165 @@
+import os
+import base64
+import shutil
+import hashlib
+import subprocess
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+
+import eventlet
+from eventlet import tpool
+
+from logs import get_logger
+
+# Pillow is optional: without it uploads still work, they just have no variants
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("WARNING: Pillow not installed. Thumbnail generation disabled.")
+
+FFMPEG = shutil.which("ffmpeg")
+
+# ================== MEDIA PIPELINE ==================
+# On upload, images (and videos when ffmpeg is on PATH) are queued on a small
+# green pool. The CPU work runs in eventlet's OS thread pool (tpool) so Pillow
+# never stalls the hub. Each job produces:
+#   thumb_url    downscaled WebP (images)
+#   poster_url   WebP frame grab (videos)
+#   placeholder  ~16px blurred WebP as a data: URI, inlined in the message
+# Variants are kept by file_url so send_message can copy them into the
+# message record; jobs that finish after the message was saved patch it.
+
+THUMB_SIZE = int(os.environ.get("THUMB_SIZE", 320))
+PLACEHOLDER_SIZE = 16
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", 2))
+MEDIA_MAX_PENDING = int(os.environ.get("MEDIA_MAX_PENDING", 32))
+MAX_TRACKED = 1024
+
+log = get_logger("media")
+
+
+def _variant_stem(path):
+    st = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(f"{name}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:10]
+    return f"{name}.{digest}"
+
+
+def _render_image(src, dest, size):
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+        thumb = img.copy()
+        thumb.thumbnail((size, size))
+        thumb.save(dest, "WEBP", quality=70, method=4)
+
+        tiny = thumb.copy()
+        tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buf = BytesIO()
+        tiny.save(buf, "WEBP", quality=30)
+    return "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def _grab_frame(src, dest):
+    # Seek a little in to skip black intro frames; fall back to frame 0
+    for offset in ("1", "0"):
+        cmd = [FFMPEG, "-loglevel", "error", "-y", "-ss", offset, "-i", src,
+               "-frames:v", "1", dest]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        if result.returncode == 0 and os.path.exists(dest) and os.path.getsize(dest) > 0:
+            return True
+    return False
+
+
+class MediaPipeline:
+    def __init__(self, upload_folder, url_prefix="/uploads", workers=MEDIA_WORKERS,
+                 max_pending=MEDIA_MAX_PENDING, thumb_size=THUMB_SIZE):
+        self.upload_folder = upload_folder
+        self.url_prefix = url_prefix.rstrip("/")
+        self.thumb_dir = os.path.join(upload_folder, "thumbs")
+        self.thumb_size = thumb_size
+        self.max_pending = max_pending
+        self.pool = eventlet.GreenPool(workers)
+        self.pending = {}              # file_url -> [callbacks]
+        self.results = OrderedDict()   # file_url -> variants (bounded)
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+    def supports(self, content_type):
+        content_type = content_type or ""
+        if not PIL_AVAILABLE:
+            return False
+        if content_type.startswith("image/") and content_type != "image/svg+xml":
+            return True
+        return content_type.startswith("video/") and FFMPEG is not None
+
+    def submit(self, filename, content_type):
+        """Queue variant generation for a saved upload. Never blocks the caller."""
+        if not self.supports(content_type):
+            return False
+        file_url = f"{self.url_prefix}/{filename}"
+        if file_url in self.pending:
+            return True
+        if len(self.pending) >= self.max_pending:
+            log.warning("media_queue_full", filename=filename)
+            return False
+        self.results.pop(file_url, None)
+        self.pending[file_url] = []
+        self.pool.spawn_n(self._run, filename, content_type, file_url)
+        return True
+
+    def variants_for(self, file_url):
+        return self.results.get(file_url)
+
+    def on_ready(self, file_url, callback):
+        """Run callback(variants) once the job for file_url finishes.
+        Returns False if nothing is being generated for that URL."""
+        if file_url in self.pending:
+            self.pending[file_url].append(callback)
+            return True
+        return False
+
+    def _run(self, filename, content_type, file_url):
+        variants = None
+        try:
+            variants = tpool.execute(self._render, filename, content_type)
+        except Exception as e:
+            log.error("media_render_failed", filename=filename, error=str(e))
+
+        callbacks = self.pending.pop(file_url, [])
+        if not variants:
+            return
+        self.results[file_url] = variants
+        while len(self.results) > MAX_TRACKED:
+            self.results.popitem(last=False)
+        for cb in callbacks:
+            try:
+                cb(variants)
+            except Exception as e:
+                log.error("media_callback_failed", filename=filename, error=str(e))
+
+    def _render(self, filename, content_type):
+        src = os.path.join(self.upload_folder, filename)
+        stem = _variant_stem(src)
+        out_name = f"{stem}.thumb.webp"
+        dest = os.path.join(self.thumb_dir, out_name)
+        url = f"{self.url_prefix}/thumbs/{out_name}"
+
+        if content_type.startswith("image/"):
+            placeholder = _render_image(src, dest, self.thumb_size)
+            return {"thumb_url": url, "placeholder": placeholder}
+
+        fd, frame = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            if not _grab_frame(src, frame):
+                return None
+            # Posters are shown at bubble width, so keep them a bit larger
+            placeholder = _render_image(frame, dest, self.thumb_size * 2)
+            return {"poster_url": url, "placeholder": placeholder}
+        finally:
+            os.remove(frame)
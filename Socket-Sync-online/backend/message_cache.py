@@ -0,0 +1,149 @@
+import json
+import time
+from collections import OrderedDict
+
+# ================== HOT CONVERSATION CACHE ==================
+# Recent message windows per pair, shared by every viewer of that pair.
+# Windows hold the raw stored records (no per-viewer filtering), so one
+# cached window serves both participants and all their tabs. Database
+# writes through on save and patches in place on revoke/hide/read/delivered,
+# so a hit never needs a remote read. Bounded by total (approximate JSON)
+# bytes with LRU eviction.
+#
+# A miss fills the window from a remote read that yields to other greenlets.
+# Every write bumps a per-pair generation, so a fill that started before a
+# write landed (and may not contain it) is discarded rather than cached.
+
+MESSAGE_CACHE_BYTES = 32 * 1024 * 1024
+MESSAGE_CACHE_TTL = 300
+WRITE_GENERATIONS = 4096   # pairs whose last write generation is remembered
+
+
+def _size(msg):
+    return len(json.dumps(msg, default=str, ensure_ascii=False))
+
+
+class _Window:
+    __slots__ = ("msgs", "sizes", "bytes", "loaded_at")
+
+    def __init__(self):
+        self.msgs = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.loaded_at = time.time()
+
+    def set(self, key, msg):
+        size = _size(msg)
+        self.bytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self.msgs[key] = msg
+
+    def pop_oldest(self):
+        key, _ = self.msgs.popitem(last=False)
+        self.bytes -= self.sizes.pop(key)
+
+
+class ConversationCache:
+    def __init__(self, max_bytes=MESSAGE_CACHE_BYTES, window=100, ttl=MESSAGE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.window = window
+        self.ttl = ttl
+        self.windows = OrderedDict()   # pair_id -> _Window, LRU order
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self.written = OrderedDict()   # pair_id -> generation of its last write
+        self.written_floor = 0         # newest generation forgotten from written
+
+    def fill_token(self):
+        """Take before the remote read that feeds put(pair_id, msgs, since=...)."""
+        return self.generation
+
+    def _written(self, pair_id):
+        self.generation += 1
+        self.written[pair_id] = self.generation
+        self.written.move_to_end(pair_id)
+        if len(self.written) > WRITE_GENERATIONS:
+            _, self.written_floor = self.written.popitem(last=False)
+
+    def get(self, pair_id):
+        """Cached {key: msg} window (oldest first), or None on a miss."""
+        w = self.windows.get(pair_id)
+        if w is not None and self.ttl and time.time() - w.loaded_at > self.ttl:
+            self.drop(pair_id)
+            w = None
+        if w is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.windows.move_to_end(pair_id)
+        return w.msgs
+
+    def put(self, pair_id, msgs, since=None):
+        """Cache a freshly read window. With since (a fill_token()), skip it
+        if the pair was written meanwhile; returns whether it was cached."""
+        if since is not None and self.written.get(pair_id, self.written_floor) > since:
+            return False
+        self.drop(pair_id)
+        w = _Window()
+        for key in sorted(msgs)[-self.window:]:
+            w.set(key, msgs[key])
+        self.windows[pair_id] = w
+        self.bytes += w.bytes
+        self._evict()
+        return True
+
+    def append(self, pair_id, key, msg):
+        # Only extends windows that are already hot; cold pairs load on read
+        self._written(pair_id)
+        w = self.windows.get(pair_id)
+        if w is None:
+            return
+        before = w.bytes
+        w.set(key, msg)
+        while len(w.msgs) > self.window:
+            w.pop_oldest()
+        self.bytes += w.bytes - before
+        self._evict()
+
+    def patch(self, pair_id, key, fields):
+        self._written(pair_id)
+        w = self.windows.get(pair_id)
+        if w is None or key not in w.msgs:
+            return
+        before = w.bytes
+        msg = dict(w.msgs[key])
+        msg.update(fields)
+        w.set(key, msg)
+        self.bytes += w.bytes - before
+        self._evict()
+
+    def invalidate(self, pair_id):
+        # The stored conversation changed wholesale (e.g. cleared)
+        self._written(pair_id)
+        self.drop(pair_id)
+
+    def drop(self, pair_id):
+        w = self.windows.pop(pair_id, None)
+        if w is not None:
+            self.bytes -= w.bytes
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self.windows:
+            _, w = self.windows.popitem(last=False)
+            self.bytes -= w.bytes
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "windows": len(self.windows),
+            "evictions": self.evictions,
+        }
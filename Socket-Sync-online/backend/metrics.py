@@ -0,0 +1,353 @@
+import json
+import time
+import inspect
+import functools
+import threading
+import contextlib
+
+from flask import g, request
+
+import concurrency
+
+# ================== METRICS ==================
+# Prometheus text exposition without the client library: a few counters and
+# histograms kept in process, rendered on /metrics.
+#
+#   http_request_duration_seconds{route,method,status}   every REST route
+#   socketio_event_duration_seconds{event}               every socket handler
+#   socketio_emits_total{event}                          outbound events
+#   db_operations_total{op}                              storage calls
+#   db_round_trips_per_call{handler}                     storage calls per invocation
+#   db_bytes_per_call{handler}                           JSON bytes read+written per invocation
+#   db_method_round_trips{method,kind}                   storage calls per Database method call
+#
+# Storage calls are counted by CountingRef, which wraps Database's refs and
+# charges each call to the handler running on the current greenlet (and to
+# fan-out children spawned through concurrency.gather). track() opens a
+# nested scope that rolls up into the enclosing one; instrument_database()
+# opens one per public Database method, which is what the round-trip budget
+# in database.ROUND_TRIP_BUDGET is checked against.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+BYTE_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}   # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for key, series in sorted(self.series.items()):
+            for bound, n in zip(self.buckets + ("+Inf",), series[:-2] + [series[-1]]):
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {n}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {round(series[-2], 6)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []   # callables returning extra exposition lines
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+http_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "REST handler latency", ("route", "method", "status"))
+socket_duration = REGISTRY.histogram(
+    "socketio_event_duration_seconds", "Socket.IO handler latency", ("event",))
+socket_errors = REGISTRY.counter(
+    "socketio_event_errors_total", "Socket.IO handlers that raised", ("event",))
+emits = REGISTRY.counter("socketio_emits_total", "Outbound Socket.IO events", ("event",))
+db_ops = REGISTRY.counter("db_operations_total", "Storage calls", ("op",))
+db_trips = REGISTRY.histogram(
+    "db_round_trips_per_call", "Storage calls per handler invocation", ("handler",), TRIP_BUCKETS)
+db_bytes = REGISTRY.histogram(
+    "db_bytes_per_call", "JSON bytes read+written per handler invocation", ("handler",), BYTE_BUCKETS)
+db_method_trips = REGISTRY.histogram(
+    "db_method_round_trips", "Storage calls per Database method call", ("method", "kind"), TRIP_BUCKETS)
+
+READ_OPS = ("get",)
+
+
+# ---------- per-invocation storage accounting ----------
+_local = threading.local()   # green-local once eventlet has patched threading
+
+
+class _Call:
+    __slots__ = ("trips", "bytes", "reads", "writes", "ops")
+
+    def __init__(self):
+        self.trips = 0
+        self.bytes = 0
+        self.reads = 0
+        self.writes = 0
+        self.ops = []   # (op, path) in call order
+
+    def merge(self, other):
+        self.trips += other.trips
+        self.bytes += other.bytes
+        self.reads += other.reads
+        self.writes += other.writes
+        self.ops.extend(other.ops)
+
+
+def _current():
+    return getattr(_local, "call", None)
+
+
+def _set_current(call):
+    _local.call = call
+
+
+# gather() children charge their reads to the handler that spawned them
+concurrency.CONTEXT_PROPAGATORS.append((_current, _set_current))
+
+
+def _begin():
+    call = _Call()
+    _local.call = call
+    return call
+
+
+def _finish(handler, call):
+    _local.call = None
+    db_trips.observe(call.trips, handler=handler)
+    db_bytes.observe(call.bytes, handler=handler)
+
+
+def _size(value):
+    if value is None:
+        return 0
+    return len(json.dumps(value, default=str, separators=(",", ":"), ensure_ascii=False))
+
+
+def _record(op, payload, path=None):
+    db_ops.inc(op=op)
+    call = _current()
+    if call is not None:
+        call.trips += 1
+        call.bytes += _size(payload)
+        if op in READ_OPS:
+            call.reads += 1
+        else:
+            call.writes += 1
+        call.ops.append((op, path))
+
+
+@contextlib.contextmanager
+def track():
+    """Count the storage calls made inside the block.
+
+    Yields the counter (trips, reads, writes, bytes, ops); on exit the counts
+    are also added to the enclosing scope, so nested tracking never hides
+    calls from the handler-level metrics.
+    """
+    parent = _current()
+    call = _Call()
+    _local.call = call
+    try:
+        yield call
+    finally:
+        _local.call = parent
+        if parent is not None:
+            parent.merge(call)
+
+
+class CountingRef:
+    """firebase_admin Reference/Query wrapper that counts calls and bytes."""
+    __slots__ = ("_ref",)
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    def __getattr__(self, name):
+        # key, path, parent... pass straight through
+        return getattr(self._ref, name)
+
+    def _wrap(self, method, *args):
+        return CountingRef(getattr(self._ref, method)(*args))
+
+    def child(self, path): return self._wrap("child", path)
+    def order_by_child(self, path): return self._wrap("order_by_child", path)
+    def order_by_key(self): return self._wrap("order_by_key")
+    def order_by_value(self): return self._wrap("order_by_value")
+    def equal_to(self, value): return self._wrap("equal_to", value)
+    def start_at(self, value): return self._wrap("start_at", value)
+    def end_at(self, value): return self._wrap("end_at", value)
+    def limit_to_first(self, n): return self._wrap("limit_to_first", n)
+    def limit_to_last(self, n): return self._wrap("limit_to_last", n)
+
+    def _path(self):
+        # Queries have no path of their own; the SDK keeps it on _pathurl
+        return getattr(self._ref, "path", None) or getattr(self._ref, "_pathurl", None)
+
+    def get(self, *args, **kwargs):
+        result = self._ref.get(*args, **kwargs)
+        _record("get", result, self._path())
+        return result
+
+    def set(self, value):
+        _record("set", value, self._path())
+        return self._ref.set(value)
+
+    def update(self, value):
+        _record("update", value, self._path())
+        return self._ref.update(value)
+
+    def push(self, *args):
+        _record("push", args[0] if args else None, self._path())
+        return CountingRef(self._ref.push(*args))
+
+    def delete(self):
+        _record("delete", None, self._path())
+        return self._ref.delete()
+
+    def transaction(self, fn):
+        _record("transaction", None, self._path())
+        return self._ref.transaction(fn)
+
+
+def _tracked_method(name, method):
+    @functools.wraps(method)
+    def tracked(*args, **kwargs):
+        with track() as call:
+            try:
+                return method(*args, **kwargs)
+            finally:
+                db_method_trips.observe(call.reads, method=name, kind="read")
+                db_method_trips.observe(call.writes, method=name, kind="write")
+    tracked._tracked = True
+    return tracked
+
+
+def instrument_database(db):
+    """Count db's storage calls, per handler and per public method."""
+    for attr in ("ref", "users_ref", "chats_ref", "directory_ref"):
+        ref = getattr(db, attr, None)
+        if ref is not None and not isinstance(ref, CountingRef):
+            setattr(db, attr, CountingRef(ref))
+    # Patched on the class: Database.scoped() copies share the wrappers
+    cls = type(db)
+    for name, method in inspect.getmembers(cls, inspect.isfunction):
+        if not name.startswith("_") and not getattr(method, "_tracked", False):
+            setattr(cls, name, _tracked_method(name, method))
+    return db
+
+
+# ---------- handler instrumentation ----------
+def instrument_flask(app):
+    @app.before_request
+    def _metrics_start():
+        g.metrics_call = (time.perf_counter(), _begin())
+
+    @app.after_request
+    def _metrics_stop(response):
+        started = g.pop("metrics_call", None)
+        if started:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            http_duration.observe(time.perf_counter() - started[0], route=route,
+                                  method=request.method, status=response.status_code)
+            _finish(f"{request.method} {route}", started[1])
+        return response
+
+
+def instrument_socketio(socketio):
+    """Time every handler registered through socketio.on() and count emits.
+
+    Must run before the handlers are declared. flask_socketio.emit() goes
+    through socketio.emit, so wrapping the instance method covers both.
+    """
+    register = socketio.on
+    send = socketio.emit
+
+    def on(message, namespace=None):
+        decorator = register(message, namespace)
+
+        def timed_decorator(handler):
+            @functools.wraps(handler)
+            def timed(*args):
+                started = time.perf_counter()
+                call = _begin()
+                try:
+                    return handler(*args)
+                except Exception:
+                    socket_errors.inc(event=message)
+                    raise
+                finally:
+                    socket_duration.observe(time.perf_counter() - started, event=message)
+                    _finish(f"socket {message}", call)
+            return decorator(timed)
+        return timed_decorator
+
+    @functools.wraps(send)
+    def counted_emit(event, *args, **kwargs):
+        emits.inc(event=event)
+        return send(event, *args, **kwargs)
+
+    socketio.on = on
+    socketio.emit = counted_emit
+    return socketio
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import heapq
+import random
+import secrets
+import functools
+import itertools
+
+import greenlet
+from flask import g, request
+
+# ================== REQUEST PROFILER ==================
+# Opt-in wall-clock profiles of single REST requests / socket events, for
+# "my chat took 4 s to load" reports. A call is profiled when
+#   * it carries "X-Profile: 1" (for sockets: on the connect handshake), or
+#   * it is picked by PROFILE_SAMPLE_RATE (0..1, default 0)
+# and at most PROFILE_MAX_ACTIVE calls are profiled at once.
+#
+# Profiling uses sys.setprofile, installed only while a profiled call is in
+# flight and filtered to that call's greenlet. Time spent suspended (waiting
+# on storage I/O) is charged to the frame that yielded, so slow Database calls
+# show up as wide frames. The PROFILE_KEEP slowest profiles are kept in
+# memory as collapsed stacks ("a;b;c <microseconds>", flamegraph.pl and
+# speedscope read it) and served on /admin/profiles behind ADMIN_TOKEN.
+# Off (the default) costs a header lookup per call.
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MAX_ACTIVE = int(os.environ.get("PROFILE_MAX_ACTIVE", 4))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
+PROFILE_HEADER = "X-Profile"
+
+
+def _label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _Collector:
+    __slots__ = ("stack", "stacks", "last", "started")
+
+    def __init__(self):
+        self.stack = []
+        self.stacks = {}    # "a;b;c" -> seconds with that stack on top
+        self.started = self.last = time.perf_counter()
+
+    def event(self, frame, what, arg):
+        now = time.perf_counter()
+        if self.stack:
+            key = ";".join(self.stack)
+            self.stacks[key] = self.stacks.get(key, 0.0) + (now - self.last)
+        self.last = now
+        if what == "call":
+            self.stack.append(_label(frame))
+        elif what == "c_call":
+            self.stack.append(f"builtin:{getattr(arg, '__qualname__', getattr(arg, '__name__', '?'))}")
+        elif self.stack:   # return / c_return / c_exception
+            self.stack.pop()
+
+
+class Profiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, max_active=PROFILE_MAX_ACTIVE, keep=PROFILE_KEEP):
+        self.sample_rate = sample_rate
+        self.max_active = max_active
+        self.keep = keep
+        self.active = {}       # greenlet -> _Collector
+        self.slowest = []      # min-heap of (duration, seq, profile)
+        self._seq = itertools.count()
+
+    # ---------- start / stop ----------
+    def wanted(self):
+        """Should the current request/event be profiled?"""
+        if len(self.active) >= self.max_active:
+            return False
+        if request.headers.get(PROFILE_HEADER) == "1":
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        collector = _Collector()
+        self.active[greenlet.getcurrent()] = collector
+        if len(self.active) == 1:
+            sys.setprofile(self._dispatch)
+        return collector
+
+    def stop(self, collector, kind, name):
+        self.active.pop(greenlet.getcurrent(), None)
+        if not self.active:
+            sys.setprofile(None)
+        duration = time.perf_counter() - collector.started
+        profile = {
+            "id": secrets.token_hex(6),
+            "kind": kind,
+            "name": name,
+            "at": time.time(),
+            "duration_ms": round(duration * 1000, 3),
+            "stacks": collector.stacks,
+        }
+        entry = (duration, next(self._seq), profile)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        return profile
+
+    def _dispatch(self, frame, what, arg):
+        collector = self.active.get(greenlet.getcurrent())
+        if collector is not None:
+            collector.event(frame, what, arg)
+
+    # ---------- reading ----------
+    def summaries(self):
+        return [{k: v for k, v in p.items() if k != "stacks"}
+                for _, _, p in sorted(self.slowest, key=lambda e: e[0], reverse=True)]
+
+    def get(self, profile_id):
+        for _, _, profile in self.slowest:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+    @staticmethod
+    def collapsed(profile):
+        """Flamegraph input: one "frame;frame;frame <microseconds>" per line."""
+        lines = [f"{stack} {int(seconds * 1e6)}"
+                 for stack, seconds in sorted(profile["stacks"].items()) if seconds >= 1e-6]
+        return "\n".join(lines) + "\n"
+
+    # ---------- hooks ----------
+    def instrument_flask(self, app):
+        @app.before_request
+        def _profile_start():
+            if self.wanted():
+                g.profile = self.start()
+
+        @app.after_request
+        def _profile_stop(response):
+            collector = g.pop("profile", None)
+            if collector is not None:
+                route = request.url_rule.rule if request.url_rule else request.path
+                profile = self.stop(collector, "http", f"{request.method} {route}")
+                response.headers["X-Profile-Id"] = profile["id"]
+            return response
+
+        @app.teardown_request
+        def _profile_cleanup(exc):
+            # after_request is skipped when a response never got built
+            collector = g.pop("profile", None)
+            if collector is not None:
+                self.stop(collector, "http", f"{request.method} {request.path}")
+
+    def instrument_socketio(self, socketio):
+        """Wrap handlers registered through socketio.on() from here on."""
+        register = socketio.on
+
+        def on(message, namespace=None):
+            decorator = register(message, namespace)
+
+            def profiled_decorator(handler):
+                @functools.wraps(handler)
+                def profiled(*args):
+                    if not self.wanted():
+                        return handler(*args)
+                    collector = self.start()
+                    try:
+                        return handler(*args)
+                    finally:
+                        self.stop(collector, "socket", message)
+                return decorator(profiled)
+            return profiled_decorator
+
+        socketio.on = on
+        return socketio
@@ -0,0 +1,383 @@
+import copy
+import json
+import time
+import random
+from collections import OrderedDict
+
+# ================== IN-MEMORY RTDB ==================
+# Local stand-in for the subset of firebase_admin.db that Database uses, so
+# every Database method can be exercised, unit-tested and benchmarked without
+# the live project:
+#
+#   Reference   child / get / set / update (multi-path) / push / delete /
+#               transaction, key / path / parent, order_by_child /
+#               order_by_key / order_by_value
+#   Query       equal_to / start_at / end_at / limit_to_first / limit_to_last / get
+#
+# Semantics follow the RTDB REST API the SDK talks to:
+#   * null and empty objects are never stored; deleting the last child of a
+#     node removes the node
+#   * keys may not contain . $ # [ ] / or control characters
+#   * multi-path update paths may not overlap (one an ancestor of another)
+#   * {".sv": {"increment": n}} and {".sv": "timestamp"} server values
+#   * push() keys are Firebase push ids: 8 time chars + 12 random chars, so
+#     lexicographic order is creation order
+#   * order_by_key sorts 32-bit integer keys numerically before other keys;
+#     child/value ordering is null < false < true < numbers < strings <
+#     objects, ties broken by key; results come back as ordered dicts
+#
+# Every call sleeps `latency` seconds +/- uniform `jitter` (time.sleep, so a
+# cooperative sleep under eventlet's monkey patching) and is appended to
+# `oplog` as {"op", "path", "bytes"}; `counts` totals calls per op.
+# Selected in Database with STORAGE_BACKEND=memory (EMULATOR_LATENCY_MS /
+# EMULATOR_JITTER_MS apply there).
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+INVALID_KEY_CHARS = set(".$#[]/")
+MAX_INT_KEY = 2 ** 31 - 1
+
+
+class EmulatorError(ValueError):
+    """Request the real database would reject."""
+
+
+def _split(path):
+    return [p for p in (path or "").split("/") if p]
+
+
+def _check_key(key):
+    if not key or any(c in INVALID_KEY_CHARS or ord(c) < 32 or ord(c) == 127 for c in key):
+        raise EmulatorError(f"Invalid key: {key!r}")
+    if len(key.encode("utf-8")) > 768:
+        raise EmulatorError("Key longer than 768 bytes")
+
+
+def _normalize(value):
+    """JSON round trip (validates types, copies) + drop nulls and empty objects."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            k = str(k)
+            if k != ".sv":
+                _check_key(k)
+            v = _normalize(v)
+            if v is not None:
+                out[k] = v
+        return out or None
+    if isinstance(value, (list, tuple)):
+        # Stored like the server does: an object keyed by index
+        return _normalize({str(i): v for i, v in enumerate(value)})
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise EmulatorError(f"Value of type {type(value).__name__} is not JSON serializable")
+
+
+def _size(value):
+    if value is None:
+        return 0
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False))
+
+
+def key_rank(key):
+    """order_by_key: 32-bit integer keys numerically, then the rest as strings."""
+    if key.lstrip("-").isdigit() and key == str(int(key)) and -MAX_INT_KEY - 1 <= int(key) <= MAX_INT_KEY:
+        return (0, int(key), "")
+    return (1, 0, key)
+
+
+def value_rank(value):
+    """order_by_child / order_by_value: null < false < true < numbers < strings < objects."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, int(value))
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, 0)
+
+
+class Emulator:
+    def __init__(self, latency=0.0, jitter=0.0, seed=None, now=time.time):
+        self.root = None
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.now = now
+        self.oplog = []
+        self.counts = {}
+        self._last_push_time = 0
+        self._last_rand = []
+
+    def reference(self, path="/"):
+        parts = _split(path)
+        for p in parts:
+            _check_key(p)
+        return Reference(self, parts)
+
+    # ---------- accounting ----------
+    def _call(self, op, parts, payload=None):
+        self.counts[op] = self.counts.get(op, 0) + 1
+        self.oplog.append({"op": op, "path": "/" + "/".join(parts), "bytes": _size(payload)})
+        delay = self.latency
+        if self.jitter:
+            delay += self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def reset_stats(self):
+        self.oplog = []
+        self.counts = {}
+
+    # ---------- push ids ----------
+    def push_id(self):
+        now = int(self.now() * 1000)
+        if now == self._last_push_time:
+            # Same millisecond: increment the random part so ids stay ordered
+            for i in range(11, -1, -1):
+                if self._last_rand[i] != 63:
+                    self._last_rand[i] += 1
+                    break
+                self._last_rand[i] = 0
+        else:
+            self._last_rand = [self.rng.randrange(64) for _ in range(12)]
+        self._last_push_time = now
+        chars = []
+        for _ in range(8):
+            chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(chars)) + "".join(PUSH_CHARS[i] for i in self._last_rand)
+
+    # ---------- raw tree access ----------
+    def read(self, parts):
+        node = self.root
+        for p in parts:
+            if not isinstance(node, dict) or p not in node:
+                return None
+            node = node[p]
+        return node
+
+    def write(self, parts, value):
+        value = self._resolve_server_values(self.read(parts), _normalize(value))
+        if not parts:
+            self.root = value
+            return
+        if value is None:
+            self._delete(parts)
+            return
+        if not isinstance(self.root, dict):
+            self.root = {}
+        node = self.root
+        for p in parts[:-1]:
+            if not isinstance(node.get(p), dict):
+                node[p] = {}
+            node = node[p]
+        node[parts[-1]] = value
+
+    def _delete(self, parts):
+        # Remove the leaf, then any parents it left empty
+        trail = []
+        node = self.root
+        for p in parts[:-1]:
+            if not isinstance(node, dict) or p not in node:
+                return
+            trail.append((node, p))
+            node = node[p]
+        if isinstance(node, dict):
+            node.pop(parts[-1], None)
+        for parent, key in reversed(trail):
+            if parent[key]:
+                break
+            del parent[key]
+        if not self.root:
+            self.root = None
+
+    def _resolve_server_values(self, current, value):
+        if isinstance(value, dict):
+            if ".sv" in value:
+                sv = value[".sv"]
+                if sv == "timestamp":
+                    return int(self.now() * 1000)
+                if isinstance(sv, dict) and "increment" in sv:
+                    base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+                    return base + sv["increment"]
+                raise EmulatorError(f"Unknown server value: {sv!r}")
+            cur = current if isinstance(current, dict) else {}
+            return {k: self._resolve_server_values(cur.get(k), v) for k, v in value.items()}
+        return value
+
+
+class Query:
+    def __init__(self, ref, order_by, path=None):
+        self._ref = ref
+        self._pathurl = ref.path    # same attribute as the SDK's Query
+        self._order_by = order_by   # "key" | "child" | "value"
+        self._path = _split(path)
+        self._start = self._end = None
+        self._has_start = self._has_end = False
+        self._first = self._last = None
+
+    def _copy(self, **changes):
+        q = copy.copy(self)
+        for k, v in changes.items():
+            setattr(q, k, v)
+        return q
+
+    def _bound(self, value):
+        if self._order_by == "key" and not isinstance(value, str):
+            raise EmulatorError("order_by_key bounds must be strings")
+        return value
+
+    def equal_to(self, value):
+        if self._has_start or self._has_end:
+            raise EmulatorError("equal_to cannot be combined with start_at/end_at")
+        value = self._bound(value)
+        return self._copy(_start=value, _end=value, _has_start=True, _has_end=True)
+
+    def start_at(self, value):
+        if self._has_start:
+            raise EmulatorError("start_at already set")
+        return self._copy(_start=self._bound(value), _has_start=True)
+
+    def end_at(self, value):
+        if self._has_end:
+            raise EmulatorError("end_at already set")
+        return self._copy(_end=self._bound(value), _has_end=True)
+
+    def _limit(self, n):
+        if self._first is not None or self._last is not None:
+            raise EmulatorError("Limit already set")
+        if not isinstance(n, int) or isinstance(n, bool) or n < 0:
+            raise EmulatorError("Limit must be a non-negative integer")
+        return n
+
+    def limit_to_first(self, n):
+        return self._copy(_first=self._limit(n))
+
+    def limit_to_last(self, n):
+        return self._copy(_last=self._limit(n))
+
+    def _rank(self, key, node):
+        if self._order_by == "key":
+            return key_rank(key)
+        if self._order_by == "child":
+            for p in self._path:
+                node = node.get(p) if isinstance(node, dict) else None
+        return value_rank(node)
+
+    def _bound_rank(self, value):
+        return key_rank(value) if self._order_by == "key" else value_rank(value)
+
+    def get(self):
+        ref = self._ref
+        emulator = ref._emulator
+        data = copy.deepcopy(emulator.read(ref._parts))
+        if not isinstance(data, dict):
+            emulator._call("get", ref._parts, data)
+            return data
+        rows = sorted(((self._rank(k, v), key_rank(k), k, v) for k, v in data.items()),
+                      key=lambda r: (r[0], r[1]))
+        if self._has_start:
+            low = self._bound_rank(self._start)
+            rows = [r for r in rows if r[0] >= low]
+        if self._has_end:
+            high = self._bound_rank(self._end)
+            rows = [r for r in rows if r[0] <= high]
+        if self._first is not None:
+            rows = rows[:self._first]
+        if self._last is not None:
+            rows = rows[len(rows) - self._last:] if self._last else []
+        result = OrderedDict((k, v) for _, _, k, v in rows)
+        emulator._call("query", ref._parts, result)
+        return result
+
+
+class Reference:
+    def __init__(self, emulator, parts):
+        self._emulator = emulator
+        self._parts = list(parts)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    @property
+    def parent(self):
+        return Reference(self._emulator, self._parts[:-1]) if self._parts else None
+
+    def child(self, path):
+        parts = _split(path)
+        if not parts:
+            raise EmulatorError("Child path must be a non-empty string")
+        for p in parts:
+            _check_key(p)
+        return Reference(self._emulator, self._parts + parts)
+
+    def get(self):
+        value = copy.deepcopy(self._emulator.read(self._parts))
+        self._emulator._call("get", self._parts, value)
+        return value
+
+    def set(self, value):
+        self._emulator._call("set", self._parts, value)
+        self._emulator.write(self._parts, value)
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise EmulatorError("Update value must be a non-empty dict")
+        paths = []
+        for path in value:
+            parts = _split(path)
+            if not parts:
+                raise EmulatorError("Update paths must be non-empty")
+            for p in parts:
+                _check_key(p)
+            paths.append(parts)
+        # The server rejects overlapping paths instead of guessing an order
+        ordered = sorted(paths)
+        for a, b in zip(ordered, ordered[1:]):
+            if b[:len(a)] == a:
+                raise EmulatorError(f"Path /{'/'.join(a)} is an ancestor of /{'/'.join(b)}")
+        self._emulator._call("update", self._parts, value)
+        # Validate everything before writing anything: updates are atomic
+        staged = [(self._parts + parts, _normalize(v)) for parts, v in zip(paths, value.values())]
+        for parts, v in staged:
+            self._emulator.write(parts, v)
+
+    def delete(self):
+        self._emulator._call("delete", self._parts)
+        self._emulator.write(self._parts, None)
+
+    def transaction(self, transaction_update):
+        # The latency is paid up front: read, update and write then run
+        # without yielding, so nothing can interleave, as with a retried
+        # compare-and-set on the server
+        self._emulator._call("transaction", self._parts)
+        value = transaction_update(copy.deepcopy(self._emulator.read(self._parts)))
+        self._emulator.write(self._parts, value)
+        return value
+
+    def push(self, value=""):
+        ref = Reference(self._emulator, self._parts + [self._emulator.push_id()])
+        if value == "":
+            self._emulator._call("push", ref._parts)
+        else:
+            self._emulator._call("push", ref._parts, value)
+            self._emulator.write(ref._parts, value)
+        return ref
+
+    def order_by_key(self):
+        return Query(self, "key")
+
+    def order_by_child(self, path):
+        if not _split(path):
+            raise EmulatorError("order_by_child path must be non-empty")
+        return Query(self, "child", path)
+
+    def order_by_value(self):
+        return Query(self, "value")
@@ -2,32 +2,32 @@ import eventlet
 eventlet.monkey_patch()
 
 import os
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room
-# ... imports ...
-
-# ... inside app setup ...
-app = Flask(__name__)
-# Allow CORS from specific origin in production, or * for now if strictly needed
-cors_origin = "*" # FORCE WILDCARD FOR DEBUGGING
-print(f"DEBUG: CORS configured for origin: {cors_origin}")
-CORS(app, resources={r"/*": {"origins": cors_origin}})
-
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import Database
-import matplotlib
-matplotlib.use('Agg') # Non-interactive backend
-import matplotlib.pyplot as plt
-import numpy as np
+from database import Database, MEDIA_CATEGORIES
+from static_files import send_static
+from assets import AssetPipeline
+from media_pipeline import MediaPipeline
+from event_replay import ReplayBuffer
+from batch import run_batch, BatchError
+from auth_tokens import TokenSigner, AuthError, verify_supabase_jwt
+from hub_watchdog import HubWatchdog
+from logs import get_logger
+import metrics
+from eventlet import tpool
+from profiler import Profiler
 import time
-import qrcode
 import secrets
 from io import BytesIO
-from flask import send_file
+# matplotlib/numpy (/stats), pandas/pyarrow (/analytics), qrcode
+# (/user/<id>/qr) and subprocess (/start-dashboard) are imported on first
+# use: together they are most of the import time, and a cold start only
+# needs the chat path.
+# benchmarks/bench_startup.py tracks it.
 
 # ================== APP SETUP ==================
 from dotenv import load_dotenv
@@ -49,48 +49,67 @@ CORS(app, resources={r"/*": {"origins": cors_origin}})
 
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
+# Latency histograms for every route/socket handler, emit counters (/metrics)
+metrics.instrument_flask(app)
+metrics.instrument_socketio(socketio)
+# Opt-in per-call profiles (X-Profile: 1 or PROFILE_SAMPLE_RATE), see /admin/profiles
+profiler = Profiler()
+profiler.instrument_flask(app)
+profiler.instrument_socketio(socketio)
+log = get_logger("socket")
+
 # ================== FRONTEND ROUTES ==================
+# Pages are revalidated on every load (cheap 304 via ETag). When
+# build_assets.py has produced frontend/dist, pages/css/js come precompressed
+# from there and fingerprinted names are cached as immutable; otherwise the
+# source files are served with a short max-age.
+PAGE_DIR = os.path.join(TEMPLATE_DIR, "pages")
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 3600))
+assets = AssetPipeline(STATIC_DIR, fallback_max_age=STATIC_MAX_AGE)
+
 @app.route("/")
 def index():
     # serve login.html as the landing page
-    return send_from_directory(os.path.join(TEMPLATE_DIR, "pages"), "login.html")
+    return assets.send_page("login.html")
 
 @app.route("/login")
 def login_page():
-    return send_from_directory(os.path.join(TEMPLATE_DIR, "pages"), "login.html")
+    return assets.send_page("login.html")
 
 @app.route("/signup")
 def signup_page():
-    return send_from_directory(os.path.join(TEMPLATE_DIR, "pages"), "signup.html")
+    return assets.send_page("signup.html")
 
 @app.route("/chat")
 def chat():
-    return send_from_directory(os.path.join(TEMPLATE_DIR, "pages"), "chat.html")
+    return assets.send_page("chat.html")
 
 @app.route("/oauth-callback")
 def oauth_callback():
-    return send_from_directory(os.path.join(TEMPLATE_DIR, "pages"), "oauth-callback.html")
+    return assets.send_page("oauth-callback.html")
 
 # Serve Static Assets (CSS, JS, Material, etc.)
 # Since files are in ../frontend/css, ../frontend/js
 @app.route("/css/<path:filename>")
 def serve_css(filename):
-    return send_from_directory(os.path.join(STATIC_DIR, "css"), filename)
+    return assets.send("css", filename)
 
 @app.route("/js/<path:filename>")
 def serve_js(filename):
-    return send_from_directory(os.path.join(STATIC_DIR, "js"), filename)
+    return assets.send("js", filename)
 
 @app.route("/material/<path:filename>")
 def serve_material(filename):
-    return send_from_directory(os.path.join(STATIC_DIR, "material"), filename)
+    return send_static(os.path.join(STATIC_DIR, "material"), filename, max_age=STATIC_MAX_AGE)
     
 @app.route("/pages/<path:filename>")
 def serve_pages(filename):
-    return send_from_directory(os.path.join(STATIC_DIR, "pages"), filename)
+    return assets.send_page(filename)
 
 # ================== DATABASE ==================
 db = Database()
+# Storage round trips and bytes are charged to the handler that made them
+metrics.instrument_database(db)
 
 # ================== FILE UPLOAD CONFIG ==================
 # Files are in root/uploads, server is in root/backend. So -> ../uploads
@@ -99,17 +118,85 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, "../uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# Thumbnails / posters / blur placeholders are generated in the background
+media_pipeline = MediaPipeline(UPLOAD_FOLDER)
+
 # ================== SERVE UPLOADED FILES ==================
+# Upload names can be reused (secure_filename of the original name), so they
+# are revalidated by ETag instead of cached blindly. Range requests let
+# audio/video seek without re-downloading from byte zero.
 @app.get("/uploads/<path:filename>")
 def serve_upload(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    return send_static(app.config["UPLOAD_FOLDER"], filename)
 
 # ================== AUTH ==================
+# Login responses carry signed session tokens (auth_tokens.py). REST calls send
+# "Authorization: Bearer <access_token>", sockets pass {"token": ...} as the
+# connect auth payload. A call with a token may only act as that token's user.
+# Calls without one are refused unless ALLOW_LEGACY_IDENTITY=1, which trusts
+# the user id in the request for clients that predate tokens.
+tokens = TokenSigner(os.environ.get("SESSION_SECRET"))
+ALLOW_LEGACY_IDENTITY = os.environ.get("ALLOW_LEGACY_IDENTITY", "0") == "1"
+
+@app.errorhandler(AuthError)
+def auth_error(e):
+    return jsonify(error=e.message), e.status
+
+@app.before_request
+def load_session():
+    # Verified on first use (auth_user), so a stale token only fails routes
+    # that act as a user, never /auth/refresh, login or static pages
+    header = request.headers.get("Authorization", "")
+    g.auth_token = header[7:].strip() if header.startswith("Bearer ") else None
+    g.auth_user = None
+
+def auth_user():
+    """The token's user, or None without a token; AuthError if it is invalid."""
+    if g.auth_user is None and g.auth_token:
+        g.auth_user = tokens.verify(g.auth_token)
+    return g.auth_user
+
+def caller_id(claimed=None):
+    """The acting user: from the token, or (legacy) the id the client sent."""
+    user_id = auth_user()
+    if user_id:
+        if claimed and claimed != user_id:
+            raise AuthError("Token does not match user", 403)
+        return user_id
+    if ALLOW_LEGACY_IDENTITY and claimed:
+        return claimed
+    raise AuthError("Authentication required")
+
+# Cost of new password hashes (werkzeug method string, e.g. "scrypt:32768:8:1"
+# or "pbkdf2:sha256:600000"). Stored hashes made with other parameters are
+# upgraded transparently the next time their owner logs in.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+_hash_prefix = None
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def needs_rehash(stored_hash):
+    global _hash_prefix
+    if _hash_prefix is None:
+        # Canonical "method:params" of a hash made now (werkzeug fills defaults)
+        _hash_prefix = hash_password("").split("$")[0]
+    return stored_hash.split("$")[0] != _hash_prefix
+
+@app.post("/auth/refresh")
+def refresh_session():
+    data = request.get_json(silent=True) or {}
+    user_id = tokens.verify(data.get("refresh_token") or "", typ="refresh")
+    # The only token check that reads storage: deleted accounts stop here
+    if not db.get_user_by_id(user_id):
+        raise AuthError("Unknown user")
+    return jsonify(tokens.issue(user_id))
+
 @app.post("/signup")
 def signup():
     data = request.json
     # Hash the password before saving
-    data["password"] = generate_password_hash(data["password"])
+    data["password"] = hash_password(data["password"])
     
     success, error = db.create_user(data)
     if success:
@@ -122,6 +209,8 @@ def login():
     user_id = data["userId"]
     input_pw = data["password"]
 
+    # One read; the streak update (plus any rehash) is a single write,
+    # skipped entirely on repeat logins the same day
     user = db.get_user_by_id(user_id)
     
     if user:
@@ -129,12 +218,12 @@ def login():
         
         # 1. Check if it's a valid hash
         if check_password_hash(stored_pw, input_pw):
-            # Update login streak
-            db.update_login_streak(user_id)
+            extra = {"password": hash_password(input_pw)} if needs_rehash(stored_pw) else None
+            user.update(db.update_login_streak(user_id, user=user, extra=extra))
             
             # Clean password from response
             del user["password"]
-            return jsonify(user)
+            return jsonify({**user, **tokens.issue(user.get("user_id", user_id))})
 
     return jsonify(error="Invalid credentials"), 401
 
@@ -146,18 +235,26 @@ def login_qr():
     if user:
         # Invalidate token after use? Optional. For persistent "ID card" style, keep it.
         # User requested "unique qr code for every unique user", implies it's static-ish.
-        return jsonify(user)
+        user.pop("password", None)
+        return jsonify({**user, **tokens.issue(user["user_id"])})
     return jsonify(error="Invalid QR Token"), 401
 
+# Social logins must prove who they are: the client posts its Supabase session
+# JWT as id_token and the account is the email inside it. Without
+# SUPABASE_JWT_SECRET nothing can be verified, so no tokens are issued.
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+
 @app.post("/social-login")
 def social_login():
-    data = request.json
-    email = data.get("email")
-    name = data.get("name")
+    data = request.json or {}
+    if not SUPABASE_JWT_SECRET:
+        return jsonify(error="Social login is not configured"), 503
+    claims = verify_supabase_jwt(data.get("id_token") or "", SUPABASE_JWT_SECRET)
+    email = claims["email"]
+    if data.get("email") and data["email"] != email:
+        raise AuthError("Token does not match user", 403)
+    name = data.get("name") or (claims.get("user_metadata") or {}).get("full_name") or email
     avatar = data.get("avatar")
-    
-    if not email:
-        return jsonify(error="Email is required"), 400
         
     # Check if user exists
     user = db.get_user_by_id(email)
@@ -171,13 +268,13 @@ def social_login():
         if "password" in user:
             del user["password"]
             
-        db.update_login_streak(email)
-        return jsonify(user)
+        user.update(db.update_login_streak(email, user=user))
+        return jsonify({**user, **tokens.issue(email)})
     else:
         # Signup
         # Generate random password
         random_pw = secrets.token_urlsafe(16)
-        hashed_pw = generate_password_hash(random_pw)
+        hashed_pw = hash_password(random_pw)
         
         new_user = {
             "userId": email,
@@ -190,7 +287,7 @@ def social_login():
         if success:
             # Return user data without password
             del new_user["password"]
-            return jsonify(new_user)
+            return jsonify({**new_user, **tokens.issue(email)})
         else:
             return jsonify(error=error), 400
 
@@ -198,7 +295,7 @@ def social_login():
 @app.post("/user/avatar")
 def update_avatar_endpoint():
     data = request.json
-    uid = data.get("userId")
+    uid = caller_id(data.get("userId"))
     avatar_url = data.get("avatarUrl")
     
     if db.update_avatar(uid, avatar_url):
@@ -207,6 +304,8 @@ def update_avatar_endpoint():
 
 @app.get("/user/<user_id>/qr")
 def get_user_qr(user_id):
+    # The QR token is a login credential: only its owner may see it
+    user_id = caller_id(user_id)
     # 1. Generate or retrieve token
     # For simplicity, we generate a new one if not exists, or update it.
     # To keep it "unique for every user" (persistent), we could check if one exists.
@@ -227,6 +326,7 @@ def get_user_qr(user_id):
     # QR Content: JSON string to be parsed by scanner
     qr_content = f'{{"type":"login", "token":"{token}"}}'
     
+    import qrcode
     img = qrcode.make(qr_content)
     buf = BytesIO()
     img.save(buf)
@@ -235,17 +335,19 @@ def get_user_qr(user_id):
     return send_file(buf, mimetype="image/png")
 
 # ================== USERS ==================
+# ?q=<search-as-you-type> &offset=<n> &limit=<n, max 200>
+# Served from the in-memory directory index; payload size follows the page size.
 @app.get("/users")
 def users():
-    return jsonify(db.get_all_users())
+    query = request.args.get("q", "")
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    return jsonify(db.search_users(query, offset, limit))
 
 @app.delete("/user/delete")
 def delete_user():
     data = request.json
-    user_id = data.get("userId")
-    
-    if not user_id:
-        return jsonify(error="User ID required"), 400
+    user_id = caller_id(data.get("userId"))
         
     if db.delete_user_data(user_id):
         return jsonify(success=True)
@@ -257,18 +359,30 @@ def get_profile_stats(user_id):
     stats = db.get_profile_stats(user_id)
     return jsonify(stats)
 
+# ================= CONDITIONAL GET =================
+# ETags come from Database's in-memory version counters, so an unchanged
+# conversation/list costs one dict lookup and a 304 instead of a storage read.
+# The version is taken before building the body: a concurrent write can only
+# make the body newer than its tag, never older.
+def versioned_json(etag, build):
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 # ================= CONTACTS =================
 @app.get("/contacts")
 def get_contacts():
-    user_id = request.args.get("user_id")
-    if not user_id:
-        return jsonify(error="Missing user_id"), 400
-    return jsonify(db.get_contacts(user_id))
+    user_id = caller_id(request.args.get("user_id"))
+    return versioned_json(db.contacts_etag(user_id), lambda: db.get_contacts(user_id))
 
 @app.post("/contacts/add")
 def add_contact():
     data = request.json
-    user_id = data.get("user_id")
+    user_id = caller_id(data.get("user_id"))
     contact_id = data.get("contact_id")
     
     if not user_id or not contact_id:
@@ -285,26 +399,40 @@ def add_contact():
 @app.post("/contacts/remove")
 def remove_contact():
     data = request.json
-    user_id = data.get("user_id")
+    user_id = caller_id(data.get("user_id"))
     contact_id = data.get("contact_id")
     
     if db.remove_contact(user_id, contact_id):
         return jsonify(success=True)
     return jsonify(error="Failed to remove"), 400
 
+# Sorted by recency; page with ?limit=<n> &before=<timestamp of last item>
 @app.get("/chat-list")
 def get_chat_list():
-    user_id = request.args.get("user_id")
-    if not user_id:
-        return jsonify(error="Missing user_id"), 400
-    return jsonify(db.get_chat_list(user_id))
+    user_id = caller_id(request.args.get("user_id"))
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    before = request.args.get("before")
+    return versioned_json(db.chat_list_etag(user_id),
+                          lambda: db.get_chat_list(user_id, before=before, limit=limit))
 
 # ================== LOAD MESSAGES ==================
 @app.get("/messages")
 def messages():
-    u1 = request.args.get("u1")
+    u1 = caller_id(request.args.get("u1"))
     u2 = request.args.get("u2")
-    return jsonify(db.get_messages_between(u1, u2))
+    if not u2:
+        return jsonify(error="Missing u2"), 400
+    return versioned_json(db.conversation_etag(u1, u2), lambda: db.get_messages_between(u1, u2))
+
+# ================== BATCH ==================
+# Chat page bootstrap in one round trip; see batch.py for the request shape.
+@app.post("/batch")
+def batch():
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(responses=run_batch(db, data.get("requests"), identify=caller_id))
+    except BatchError as e:
+        return jsonify(error=e.message), e.status
 
 # ================== FILE UPLOAD API ==================
 @app.post("/upload")
@@ -317,21 +445,96 @@ def upload_file():
 
     path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     file.save(path)
+    media_pipeline.submit(filename, file.content_type)
 
     return jsonify(
         file_url=f"/uploads/{filename}",
         file_type=file.content_type
     )
 
+# ?type=image|video|audio|doc (plurals ok) &before=<cursor> &limit=<n, max 100>
 @app.get("/chat/<partner_id>/media")
 def get_media(partner_id):
-    u1 = request.args.get("u1") # Current user
-    return jsonify(db.get_chat_media(u1, partner_id))
+    u1 = caller_id(request.args.get("u1")) # Current user
+
+    category = request.args.get("type")
+    if category:
+        category = category.lower().rstrip("s")
+        if category not in MEDIA_CATEGORIES:
+            return jsonify(error=f"Unknown media type: {category}"), 400
+
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 100)
+    before = request.args.get("before")
+    return jsonify(db.get_chat_media(u1, partner_id, category=category, before=before, limit=limit))
 
 # ================== SOCKET EVENTS ==================
+# State-changing events are stamped with a sequence number and kept per user
+# so a briefly disconnected client can "resume" instead of reloading over REST.
+replay = ReplayBuffer(capacity=int(os.environ.get("REPLAY_CAPACITY", 256)))
+
+# sid -> user id, verified once at connect from the access token
+socket_users = {}
+
+@socketio.on("connect")
+def handle_connect(auth=None):
+    token = (auth or {}).get("token") if isinstance(auth, dict) else None
+    token = token or request.args.get("token")
+    if token:
+        try:
+            socket_users[request.sid] = tokens.verify(token)
+        except AuthError:
+            return False
+    elif not ALLOW_LEGACY_IDENTITY:
+        return False
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    socket_users.pop(request.sid, None)
+
+def socket_caller(claimed):
+    """caller_id() for socket events; None means drop the event."""
+    user_id = socket_users.get(request.sid)
+    if user_id:
+        return user_id if not claimed or claimed == user_id else None
+    return claimed if ALLOW_LEGACY_IDENTITY else None
+
+def room_for(a, b):
+    """Socket.IO room shared by a conversation's two participants."""
+    return "-".join(sorted([a, b]))
+
+def may_join(user_id, room, other=None):
+    if room == user_id:
+        return True
+    if other is None:
+        # Clients that only send the room name: the partner is what is left
+        # once this user's id is taken off whichever end it is on
+        if room.startswith(user_id + "-"):
+            other = room[len(user_id) + 1:]
+        elif room.endswith("-" + user_id):
+            other = room[:-len(user_id) - 1]
+    # The room must be exactly the one this pair's events go to
+    return bool(other) and room == room_for(user_id, other)
+
+@socketio.on("resume")
+def handle_resume(data):
+    # data: { user_id, epoch, last_seq } from the last event the client saw
+    user_id = socket_caller(data.get("user_id"))
+    if not user_id: return
+    events = replay.since(user_id, data.get("epoch"), data.get("last_seq"))
+    if events is None:
+        emit("resync_required", {"epoch": replay.epoch, "seq": replay.seq})
+        return
+    for event, payload in events:
+        emit(event, payload)
+    emit("resumed", {"epoch": replay.epoch, "seq": replay.seq, "replayed": len(events)})
+
 @socketio.on("join")
 def handle_join(data):
     room = data["room"]
+    # Authenticated sockets may only join their own room or pair rooms they are in
+    user_id = socket_users.get(request.sid)
+    if user_id and not may_join(user_id, room, data.get("with")):
+        return
     join_room(room)
     
     # If a user is joining their personal room (which matches their user_id),
@@ -357,12 +560,16 @@ def handle_join(data):
 
 @socketio.on("send_message")
 def handle_message(data):
-    sender = data["from"]
+    sender = socket_caller(data.get("from"))
     receiver = data["to"]
     text = data.get("text")
     file_url = data.get("file_url")
     file_type = data.get("file_type")
-    room = data["room"]
+    if not sender:
+        emit("error", {"message": "Not allowed to send as this user"})
+        return
+    # The pair room is derived, never taken from the client
+    room = room_for(sender, receiver)
 
     now = datetime.now().astimezone()
 
@@ -374,59 +581,55 @@ def handle_message(data):
         "file_type": file_type,
         "timestamp": now
     }
+
+    # Reference the small variants first if they are already rendered
+    variants = media_pipeline.variants_for(file_url) if file_url else None
+    if variants:
+        msg_data.update(variants)
     
-    print(f"DEBUG: Processing message from {sender} to {receiver}")
+    log.debug("message_received", sender=sender, receiver=receiver)
 
     # Check Block
     if db.is_blocked(sender, receiver):
-        print(f"DEBUG: Blocked message attempt")
+        log.info("message_blocked", sender=sender, receiver=receiver)
         emit("error", {"message": "Message not sent. You are blocked or have blocked this user."}, room=room)
         return
 
     new_id = db.save_message(msg_data)
-    print(f"DEBUG: Message saved with ID: {new_id}")
     
     if not new_id:
-        print("CRITICAL: save_message returned None!")
+        log.error("message_save_failed", sender=sender, receiver=receiver)
         emit("error", {"message": "Failed to save message"}, room=room)
         return
 
-    emit(
-        "receive_message",
-        {
-            "id": new_id,
-            "from": sender,
-            "to": receiver,
-            "message": text,
-            "file_url": file_url,
-            "file_type": file_type,
-            "timestamp": now.isoformat(),
-            "status": "sent" # Default
-        },
-        room=room,
-        include_self=False
-    )
+    # The job may have finished while we were saving: attach its result once
+    # the message itself has gone out instead of waiting on a callback
+    late = None
+    if file_url and not variants:
+        if not media_pipeline.on_ready(file_url, lambda v: on_media_ready(new_id, sender, receiver, v)):
+            late = media_pipeline.variants_for(file_url)
+
+    payload = replay.record("receive_message", {
+        "id": new_id,
+        "from": sender,
+        "to": receiver,
+        "message": text,
+        "file_url": file_url,
+        "file_type": file_type,
+        **(variants or {}),
+        "timestamp": now.isoformat(),
+        "status": "sent" # Default
+    }, (sender, receiver))
+
+    emit("receive_message", payload, room=room, include_self=False)
     
     # ALSO Emit to Receiver's Personal Room (for ignored/background notifications)
     # This ensures they get 'double gray tick' even if they haven't opened this specific chat
     # provided they are online (joined their own room).
-    emit(
-        "receive_message",
-        {
-            "id": new_id,
-            "from": sender,
-            "to": receiver,
-            "message": text,
-            "file_url": file_url,
-            "file_type": file_type,
-            "timestamp": now.isoformat(),
-            "status": "sent"
-        },
-        room=receiver
-    )
+    emit("receive_message", payload, room=receiver)
     
     # Emit back to sender to update their temporary message with the real ID
-    print(f"DEBUG: Emitting confirmation to sender for temp_id: {data.get('temp_id')}")
+    log.debug("message_saved", msg_id=new_id, temp_id=data.get("temp_id"))
     emit("message_sent_confirm", {
         "temp_id": data.get("temp_id"), 
         "id": new_id,
@@ -434,10 +637,22 @@ def handle_message(data):
         "status": "sent"
     })
 
-@app.delete("/messages/<int:msg_id>")
+    if late:
+        on_media_ready(new_id, sender, receiver, late)
+
+def on_media_ready(msg_id, sender, receiver, variants):
+    # Runs on the media pool after the message was already saved/emitted
+    if db.update_message_media(msg_id, variants):
+        pair_room = room_for(sender, receiver)
+        payload = replay.record("message_media", {"id": msg_id, **variants}, (sender, receiver))
+        socketio.emit("message_media", payload, room=pair_room)
+
+@app.delete("/messages/<msg_id>")
 def delete_message(msg_id):
-    # In a real app, verify 'sender' matches current user
-    db.delete_message(msg_id)
+    # Revoke for everyone: only the message's sender may
+    user_id = caller_id(request.args.get("user_id"))
+    if not db.delete_message(msg_id, only_sender=user_id):
+        return jsonify(error="Message not found"), 404
     return jsonify(success=True)
 
 @socketio.on("delete_message")
@@ -451,18 +666,20 @@ def handle_delete(data):
     
     sender = msg["sender"]
     receiver = msg["receiver"]
+    # Only the sender can revoke for everyone
+    if socket_caller(sender) is None: return
     
-    # 2. Perform soft delete
-    db.delete_message(msg_id)
+    # 2. Perform soft delete (reusing the record read above)
+    db.delete_message(msg_id, msg=msg)
     
     # 3. Broadcast revocation
-    payload = {
+    payload = replay.record("message_revoked", {
         "id": msg_id,
         "message": "🚫 This message was deleted"
-    }
+    }, (sender, receiver))
     
     # Shared pair room
-    pair_room = "-".join(sorted([sender, receiver]))
+    pair_room = room_for(sender, receiver)
     emit("message_revoked", payload, room=pair_room)
     
     # Personal rooms (Crucial for background/chat-list updates)
@@ -481,15 +698,19 @@ def handle_bulk_delete(data):
     
     sender = first_msg["sender"]
     receiver = first_msg["receiver"]
+    # Authenticated callers can only revoke their own messages
+    caller = socket_users.get(request.sid)
+    if socket_caller(sender) is None: return
     
-    db.bulk_delete_messages(msg_ids)
+    msg_ids = db.bulk_delete_messages(msg_ids, only_sender=caller)
+    if not msg_ids: return
     
-    payload = {
+    payload = replay.record("bulk_message_revoked", {
         "ids": msg_ids,
         "message": "🚫 This message was deleted"
-    }
+    }, (sender, receiver))
     
-    pair_room = "-".join(sorted([sender, receiver]))
+    pair_room = room_for(sender, receiver)
     emit("bulk_message_revoked", payload, room=pair_room)
     emit("bulk_message_revoked", payload, room=sender)
     emit("bulk_message_revoked", payload, room=receiver)
@@ -498,28 +719,30 @@ def handle_bulk_delete(data):
 def handle_delete_for_me(data):
     # data = { "id": 123, "user_id": "..." }
     msg_id = data["id"]
-    user_id = data["user_id"]
+    user_id = socket_caller(data.get("user_id"))
+    if not user_id: return
     
     if db.delete_message_for_user(msg_id, user_id):
         # Only notify the requester
-        emit("message_deleted", {"id": msg_id}, room=user_id)
+        emit("message_deleted", replay.record("message_deleted", {"id": msg_id}, (user_id,)), room=user_id)
 
 @socketio.on("bulk_delete_for_me")
 def handle_bulk_delete_for_me(data):
     # data = { "ids": [1, 2, 3], "user_id": "..." }
     msg_ids = data.get("ids", [])
-    user_id = data.get("user_id")
+    user_id = socket_caller(data.get("user_id"))
     if not msg_ids or not user_id: return
     
-    db.bulk_delete_message_for_user(msg_ids, user_id)
+    msg_ids = db.bulk_delete_message_for_user(msg_ids, user_id)
+    if not msg_ids: return
     # Notify just the user's personal room
-    emit("bulk_message_deleted", {"ids": msg_ids}, room=user_id)
+    emit("bulk_message_deleted", replay.record("bulk_message_deleted", {"ids": msg_ids}, (user_id,)), room=user_id)
 
 @socketio.on("read_messages")
 def handle_read_messages(data):
     # data: { sender: "the_guy_who_sent_msgs", receiver: "me(reader)" }
     sender = data.get("sender")
-    receiver = data.get("receiver") # Me
+    receiver = socket_caller(data.get("receiver")) # Me
     
     if sender and receiver:
         # Mark in DB
@@ -528,45 +751,65 @@ def handle_read_messages(data):
         # Notify the sender that 'receiver' has read their messages
         # We need to emit to the sender's room OR the common room.
         # Common room is easier if both are joined.
-        room_name = "-".join(sorted([sender, receiver]))
+        room_name = room_for(sender, receiver)
         
-        emit("messages_read", {
+        emit("messages_read", replay.record("messages_read", {
             "by": receiver,
             "read_all_from": sender
-        }, room=room_name)
+        }, (sender, receiver)), room=room_name)
 
 @socketio.on("delivery_receipt")
 def handle_delivery_receipt(data):
     # data: { msg_id: 123, sender: "sender_id", receiver: "me" }
     msg_id = data.get("msg_id")
     sender = data.get("sender")
+    receiver = socket_caller(data.get("receiver"))
     
-    if msg_id and sender:
-        db.mark_message_delivered(msg_id)
+    if msg_id and sender and receiver:
+        # Only the receiver can confirm delivery; already delivered or read
+        # messages have nothing to announce
+        if not db.mark_message_delivered(msg_id, receiver=receiver): return
         
         # Notify sender
         # We can send to sender's personal room or the pair room
-        room_name = "-".join(sorted([sender, data.get("receiver")]))
-        emit("message_delivered", {
+        room_name = room_for(sender, receiver)
+        emit("message_delivered", replay.record("message_delivered", {
             "id": msg_id,
             "status": "delivered"
-        }, room=room_name)
+        }, (sender, receiver)), room=room_name)
 
 
 @socketio.on("typing")
 def handle_typing(data):
     # data: { to: "userb", from: "usera", typing: true/false }
+    sender = socket_caller(data.get("from"))
+    if not sender: return
     emit("user_typing", {
-        "from": data.get("from"),
+        "from": sender,
         "typing": data.get("typing", False)
     }, room=data["to"], include_self=False)
 
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg') # Non-interactive backend
+    import matplotlib.pyplot as plt
+    return plt
+
+# Top senders as a bar chart; aggregates come from the analytics API's queries
 @app.route('/stats', methods=['GET'])
 def get_stats():
+    denied = require_analytics()
+    if denied:
+        return denied
     try:
-        data = db.get_user_message_counts()
-        names = list(data.keys())
-        counts = list(data.values())
+        import numpy as np
+        plt = _pyplot()
+        queries = analytics()
+        refresh_analytics(ANALYTICS_MAX_AGE)
+        top = tpool.execute(queries.query, "top-senders", limit=20)["senders"]
+        total = tpool.execute(queries.query, "summary")["messages"]
+        names = [s["name"] or s["user_id"] for s in top]
+        counts = [s["count"] for s in top]
         
         # NumPy for calculations (Syllabus Requirement: Unit 9)
         avg_msgs = np.mean(counts) if counts else 0
@@ -595,7 +838,7 @@ def get_stats():
         return jsonify({
             "plot_url": f"/uploads/{filename}",
             "stats": {
-                "total_messages": sum(counts),
+                "total_messages": total,
                 "average_per_user": float(avg_msgs),
                 "most_active": names[np.argmax(counts)] if counts else "None"
             }
@@ -607,36 +850,36 @@ def get_stats():
 @app.post("/user/block")
 def toggle_block():
     data = request.json
-    blocker = data.get("blocker") # Current user
+    blocker = caller_id(data.get("blocker")) # Current user
     blocked = data.get("blocked") # Target
+    # Optional explicit state ("block": true/false) skips the toggle's read
+    block = data.get("block")
     
-    # Ideally verify blocker matches session/token
-    state = db.toggle_block(blocker, blocked)
+    state = db.toggle_block(blocker, blocked, block if isinstance(block, bool) else None)
     return jsonify(blocked=state)
 
 @app.get("/user/block_state")
 def get_block_state():
-    u1 = request.args.get("u1")
+    u1 = caller_id(request.args.get("u1"))
     u2 = request.args.get("u2")
     return jsonify(state=db.get_block_state(u1, u2))
 
 @app.delete("/chat/<target_id>")
 def clear_chat(target_id):
-    u1 = request.args.get("u1")
+    u1 = caller_id(request.args.get("u1"))
     db.clear_chat(u1, target_id)
     return jsonify(success=True)
 
 # ================== DASHBOARD AUTOMATION ==================
-import subprocess
-import socket
-import sys
-
 def is_port_in_use(port):
+    import socket
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('localhost', port)) == 0
 
 @app.post("/start-dashboard")
 def start_dashboard():
+    import subprocess
+    import sys
     try:
         if is_port_in_use(8501):
             return jsonify({"status": "running", "message": "Dashboard already running"})
@@ -653,7 +896,10 @@ def start_dashboard():
         
         cmd = [python_exe, "-m", "streamlit", "run", dashboard_path, "--server.port=8501", "--server.headless=true"]
         
-        subprocess.Popen(cmd, cwd=os.path.join(BASE_DIR, ".."))
+        # The dashboard reads this server's /analytics API
+        api_url = f"http://localhost:{os.environ.get('PORT', 5000)}"
+        subprocess.Popen(cmd, cwd=os.path.join(BASE_DIR, ".."),
+                         env=dict(os.environ, ANALYTICS_API_URL=api_url, ADMIN_TOKEN=ANALYTICS_TOKEN))
         
         return jsonify({"status": "started", "message": "Dashboard process initiated"})
     except Exception as e:
@@ -682,6 +928,136 @@ def debug_paths():
     except Exception as e:
         return jsonify({"error": str(e)})
 
+@app.route("/debug-cache")
+def debug_cache():
+    # Hot conversation window cache: hit ratio and memory use
+    return jsonify(db.message_cache.stats())
+
+# ================== HUB WATCHDOG ==================
+# HUB_WATCHDOG=1 logs any handler that holds the eventlet hub longer than
+# HUB_WATCHDOG_THRESHOLD_MS (with its stack) and keeps a scheduling-lag histogram.
+hub_watchdog = HubWatchdog(threshold=float(os.environ.get("HUB_WATCHDOG_THRESHOLD_MS", 100)) / 1000)
+if os.environ.get("HUB_WATCHDOG") == "1":
+    hub_watchdog.start()
+
+@app.route("/debug-hub")
+def debug_hub():
+    return jsonify(hub_watchdog.snapshot())
+
+# ================== METRICS ==================
+metrics.REGISTRY.collectors.append(hub_watchdog.exposition)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return app.response_class(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# ================== ADMIN: PROFILES ==================
+# Requires ADMIN_TOKEN to be set and sent as X-Admin-Token; 404 otherwise.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin():
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(supplied, ADMIN_TOKEN):
+        return jsonify(error="Not found"), 404
+    return None
+
+@app.get("/admin/profiles")
+def list_profiles():
+    # Slowest kept profiles first, without their stacks
+    return require_admin() or jsonify(profiles=profiler.summaries())
+
+@app.get("/admin/profiles/<profile_id>")
+def get_profile(profile_id):
+    # ?format=collapsed (default, flamegraph.pl / speedscope input) or json
+    denied = require_admin()
+    if denied:
+        return denied
+    profile = profiler.get(profile_id)
+    if not profile:
+        return jsonify(error="Profile not found"), 404
+    if request.args.get("format") == "json":
+        return jsonify(profile)
+    return app.response_class(profiler.collapsed(profile), mimetype="text/plain")
+
+# ================== ANALYTICS API ==================
+# Read-only aggregates over the columnar store (analytics/queries.py): the
+# dashboard and /stats are thin clients of these and never see message rows.
+#   GET /analytics/<kind>   summary | counts | top-senders | file-types | hours | users
+#       ?start=YYYY-MM-DD &end=YYYY-MM-DD (inclusive, UTC) &user=<id>
+#       counts: &bucket=hour|day|week|month   top-senders: &limit=<n> &files_only=1
+#   GET /analytics/recent-files ?sender=<id> &limit=<n, max 1000>
+#   POST /analytics/refresh  ingest now
+# All-user queries (and users, the whole directory) need X-Admin-Token. With
+# ?user= (or ?sender=) a caller holding a session token for that user may
+# query their own traffic; the claimed id alone is never enough. Without
+# ADMIN_TOKEN only the dashboard started by /start-dashboard, which gets a
+# per-process token, can run all-user queries (including /stats). Responses
+# carry the data version as ETag. New messages are ingested on demand, at
+# most every ANALYTICS_MAX_AGE seconds: the storage reads run on the request's
+# green thread, and only the pandas/Parquet steps go to the OS thread pool,
+# so neither holds the hub. pandas/pyarrow load on the first call, not at
+# startup.
+ANALYTICS_MAX_AGE = float(os.environ.get("ANALYTICS_MAX_AGE", 30))
+ANALYTICS_TOKEN = ADMIN_TOKEN or secrets.token_urlsafe(32)
+_queries = None
+
+if not ADMIN_TOKEN:
+    print("WARNING: ADMIN_TOKEN not set; /stats and all-user /analytics queries "
+          "are limited to the dashboard started by /start-dashboard.")
+
+def analytics():
+    global _queries
+    if _queries is None:
+        import sys
+        sys.path.insert(0, os.path.join(BASE_DIR, "../analytics"))
+        import queries
+        _queries = queries
+    return _queries
+
+def refresh_analytics(max_age=0):
+    return analytics().refresh(db, max_age, offload=tpool.execute)
+
+def require_analytics(user=None):
+    """None if the caller may run the query, else the 404 response."""
+    supplied = request.headers.get("X-Admin-Token", "")
+    if secrets.compare_digest(supplied, ANALYTICS_TOKEN):
+        return None
+    if user and auth_user() == user:
+        return None
+    return jsonify(error="Not found"), 404
+
+@app.get("/analytics/<kind>")
+def analytics_query(kind):
+    args = request.args
+    user = args.get("sender") if kind == "recent-files" else args.get("user")
+    # The directory is not per-user, whatever ?user= says
+    denied = require_analytics(None if kind == "users" else user)
+    if denied:
+        return denied
+    queries = analytics()
+    refresh_analytics(ANALYTICS_MAX_AGE)
+    if kind == "recent-files":
+        run = lambda: queries.recent_files(user, args.get("start"), args.get("end"),
+                                           args.get("limit", 100, type=int))
+    else:
+        run = lambda: queries.query(kind, args.get("start"), args.get("end"), user,
+                                    bucket=args.get("bucket", "day"),
+                                    limit=args.get("limit", 10, type=int),
+                                    files_only=args.get("files_only") == "1")
+    try:
+        # pandas work goes to the OS thread pool, off the hub
+        return versioned_json(queries.version_tag(), lambda: tpool.execute(run))
+    except queries.QueryError as e:
+        return jsonify(error=str(e)), 400
+
+@app.post("/analytics/refresh")
+def analytics_refresh():
+    denied = require_analytics()
+    if denied:
+        return denied
+    added = refresh_analytics()
+    return jsonify(added=added, version=analytics().version_tag())
+
 # ================== RUN ==================
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
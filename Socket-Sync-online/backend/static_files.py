@@ -0,0 +1,150 @@
+import os
+import mimetypes
+
+from flask import request, current_app, abort
+from werkzeug.http import unquote_etag
+from werkzeug.security import safe_join
+
+# ================== STATIC / MEDIA SERVING ==================
+# Replacement for send_from_directory on the hot asset + upload routes:
+#   * strong ETags (inode/size/mtime) answered with 304 on If-None-Match
+#   * single byte-range requests (206 / 416) so <video>/<audio> can seek
+#   * zero-copy os.sendfile through wsgi.file_wrapper when the server has one
+#     (gunicorn does; eventlet.wsgi falls back to chunked reads)
+#   * optional X-Accel-Redirect / X-Sendfile so nginx/apache ship the bytes
+#
+# Config (env or app.config):
+#   SENDFILE_MODE      "" (default) | "x-accel" | "x-sendfile"
+#   X_ACCEL_PREFIX     internal nginx location mapped to the served roots,
+#                      e.g. "/_protected" -> "/_protected/uploads/a.mp4"
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _config(key, default=None):
+    value = current_app.config.get(key)
+    if value is None:
+        value = os.environ.get(key, default)
+    return value
+
+
+def make_etag(st):
+    # Strong validator: any rewrite of the file changes size or mtime_ns
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _cache_control(max_age, immutable=False):
+    if not max_age:
+        return "no-cache"
+    value = f"public, max-age={int(max_age)}"
+    if immutable:
+        value += ", immutable"
+    return value
+
+
+def _iter_range(f, remaining):
+    try:
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _open_body(path, start, length, size):
+    environ = request.environ
+    f = open(path, "rb")
+    if start:
+        f.seek(start)
+
+    # wsgi.file_wrapper is what lets gunicorn use os.sendfile. Gunicorn bounds
+    # the copy by Content-Length; generic wrappers stream to EOF, so only hand
+    # them ranges that end at EOF.
+    wrapper = environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        bounded = environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")
+        if bounded or start + length == size:
+            return wrapper(f, CHUNK_SIZE)
+
+    return _iter_range(f, length)
+
+
+def _accel_headers(directory, path):
+    mode = (_config("SENDFILE_MODE", "") or "").lower()
+    if mode == "x-sendfile":
+        return {"X-Sendfile": path}
+    if mode == "x-accel":
+        prefix = (_config("X_ACCEL_PREFIX", "/_protected") or "").rstrip("/")
+        root = os.path.basename(os.path.normpath(directory))
+        rel = os.path.relpath(path, directory).replace(os.sep, "/")
+        return {"X-Accel-Redirect": f"{prefix}/{root}/{rel}"}
+    return None
+
+
+def send_static(directory, filename, max_age=0, immutable=False,
+                mimetype=None, headers=None):
+    directory = os.path.abspath(directory)
+    path = safe_join(directory, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not os.path.isfile(path):
+        abort(404)
+
+    size = st.st_size
+    etag = make_etag(st)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    response = current_app.response_class(mimetype=mimetype, direct_passthrough=True)
+    response.headers["ETag"] = etag
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Cache-Control"] = _cache_control(max_age, immutable)
+    response.last_modified = int(st.st_mtime)
+    if headers:
+        response.headers.update(headers)
+
+    # 1. Revalidation (If-None-Match uses weak comparison)
+    if request.if_none_match and request.if_none_match.contains_weak(unquote_etag(etag)[0]):
+        response.status_code = 304
+        return response
+
+    # 2. Let the fronting proxy serve the bytes (it handles Range itself)
+    accel = _accel_headers(directory, path)
+    if accel:
+        response.headers.update(accel)
+        response.headers["Content-Length"] = "0"
+        return response
+
+    # 3. Byte ranges (If-Range falls back to the full body on a stale ETag)
+    start, length = 0, size
+    rng = request.range
+    if rng is not None and request.method in ("GET", "HEAD"):
+        if_range = request.headers.get("If-Range")
+        if not if_range or if_range == etag:
+            span = rng.range_for_length(size) if len(rng.ranges) == 1 else None
+            if span is None:
+                if len(rng.ranges) == 1:
+                    response.status_code = 416
+                    response.headers["Content-Range"] = f"bytes */{size}"
+                    response.headers["Content-Length"] = "0"
+                    return response
+                # Multipart ranges are rare for media; answer with the full body
+            else:
+                start, stop = span
+                length = stop - start
+                response.status_code = 206
+                response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    response.headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return response
+
+    response.response = _open_body(path, start, length, size)
+    return response
@@ -0,0 +1,111 @@
+import re
+import time
+
+# ================== USER DIRECTORY INDEX ==================
+# In-memory search-as-you-type index over the compact `directory` node
+# ({user_id, name, avatar} per user). Every word of the name and of the
+# user id is indexed by its edge n-grams (prefixes), so a query term is a
+# single dict lookup; multi-word queries intersect the per-term sets.
+
+MAX_PREFIX = 12
+# Unicode-aware: letters and digits of any script are kept ("_" splits too)
+TOKEN_SPLIT = re.compile(r"[\W_]+")
+
+
+def _tokens(text):
+    return [t for t in TOKEN_SPLIT.split((text or "").casefold()) if t]
+
+
+class UserDirectory:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.entries = {}    # user_id -> {"user_id", "name", "avatar"}
+        self.prefixes = {}   # prefix -> set(user_id)
+        self._sorted = None
+
+    @property
+    def stale(self):
+        return self.loaded_at is None or time.time() - self.loaded_at > self.ttl
+
+    def load(self, entries):
+        self.entries = {}
+        self.prefixes = {}
+        for entry in entries:
+            self._add(entry)
+        self.loaded_at = time.time()
+        self._sorted = None
+
+    def _index_keys(self, entry):
+        keys = set()
+        for token in _tokens(entry.get("name")) + _tokens(entry.get("user_id")):
+            for i in range(1, min(len(token), MAX_PREFIX) + 1):
+                keys.add(token[:i])
+        return keys
+
+    def _add(self, entry):
+        uid = entry.get("user_id")
+        if not uid:
+            return
+        entry = {"user_id": uid, "name": entry.get("name"), "avatar": entry.get("avatar")}
+        self.entries[uid] = entry
+        for key in self._index_keys(entry):
+            self.prefixes.setdefault(key, set()).add(uid)
+
+    def _discard(self, uid):
+        entry = self.entries.pop(uid, None)
+        if not entry:
+            return
+        for key in self._index_keys(entry):
+            bucket = self.prefixes.get(key)
+            if bucket:
+                bucket.discard(uid)
+                if not bucket:
+                    del self.prefixes[key]
+
+    def upsert(self, entry):
+        current = self.entries.get(entry.get("user_id"))
+        # Not loaded yet (the next load picks it up) or a partial update for a
+        # user we have never seen: nothing sensible to index
+        if self.loaded_at is None or (current is None and "name" not in entry):
+            return
+        merged = dict(current or {}, **{k: v for k, v in entry.items() if v is not None})
+        self._discard(merged.get("user_id"))
+        self._add(merged)
+        self._sorted = None
+
+    def remove(self, uid):
+        self._discard(uid)
+        self._sorted = None
+
+    def get(self, uid):
+        return self.entries.get(uid)
+
+    def _sort_key(self, entry):
+        return ((entry.get("name") or "").casefold(), entry["user_id"])
+
+    def search(self, query=None, offset=0, limit=50):
+        terms = _tokens(query)
+        if not terms:
+            if self._sorted is None:
+                self._sorted = sorted(self.entries.values(), key=self._sort_key)
+            matches = self._sorted
+        else:
+            candidates = None
+            for term in sorted(terms, key=len, reverse=True):
+                bucket = self.prefixes.get(term[:MAX_PREFIX], set())
+                candidates = set(bucket) if candidates is None else candidates & bucket
+                if not candidates:
+                    break
+            matches = [self.entries[uid] for uid in candidates or ()]
+            # Terms longer than the indexed prefix need a real prefix check
+            long_terms = [t for t in terms if len(t) > MAX_PREFIX]
+            if long_terms:
+                matches = [e for e in matches if all(
+                    any(tok.startswith(t) for tok in _tokens(e.get("name")) + _tokens(e["user_id"]))
+                    for t in long_terms)]
+            matches.sort(key=self._sort_key)
+
+        page = matches[offset:offset + limit]
+        next_offset = offset + limit if offset + limit < len(matches) else None
+        return {"users": page, "total": len(matches), "next_offset": next_offset}
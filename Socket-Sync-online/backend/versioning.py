@@ -0,0 +1,30 @@
+import secrets
+
+# ================== DATA VERSIONS ==================
+# Monotonic in-process counters bumped by every Database mutation, so read
+# endpoints can answer If-None-Match without touching storage. The epoch is
+# random per process: counters restart at 0 on boot, and the epoch keeps an
+# old ETag from matching a new process's "version 3".
+#
+# Keys used by Database:
+#   pair:<pair_id>      messages of one conversation
+#   inbox:<user>        that user's chat-list summaries
+#   contacts:<user>     that user's contact list
+#   profiles            any name/avatar change (shown in lists)
+
+
+class VersionTable:
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.versions = {}
+
+    def bump(self, *keys):
+        for key in keys:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def get(self, key):
+        return self.versions.get(key, 0)
+
+    def etag(self, *keys):
+        """Opaque validator for a response built from these keys."""
+        return f"{self.epoch}-" + ".".join(str(self.get(k)) for k in keys)
@@ -0,0 +1,145 @@
+"""Microbenchmark: serial vs fanned-out reads in multi-read Database methods.
+
+    python benchmarks/bench_fanout.py [--latency-ms 20] [--rounds 20] [--contacts 10]
+
+Runs each method against an in-memory reference whose every get()/update()
+sleeps for the injected latency (a cooperative eventlet sleep, like real
+network I/O under monkey patching). Each method is timed twice: with
+concurrency.gather / gather_map / settle_map limited to one call at a time
+(the old serial behaviour) and with the default fan-out. Prints mean wall time and storage calls per
+invocation.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import copy
+import time
+import argparse
+import functools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import concurrency
+import database
+
+
+class SlowRef:
+    """Just enough of firebase_admin's Reference for the benchmarked paths."""
+
+    def __init__(self, store, stats, latency, path=()):
+        self.store, self.stats, self.latency, self.path = store, stats, latency, path
+
+    def child(self, path):
+        return SlowRef(self.store, self.stats, self.latency,
+                       self.path + tuple(p for p in path.split("/") if p))
+
+    def _wait(self, op):
+        self.stats[op] = self.stats.get(op, 0) + 1
+        eventlet.sleep(self.latency)
+
+    def get(self):
+        self._wait("get")
+        node = self.store
+        for p in self.path:
+            if not isinstance(node, dict) or p not in node:
+                return None
+            node = node[p]
+        return copy.deepcopy(node)
+
+    def update(self, values):
+        self._wait("update")
+        for key, value in values.items():
+            parts = self.path + tuple(p for p in key.split("/") if p)
+            node = self.store
+            for p in parts[:-1]:
+                node = node.setdefault(p, {})
+            if isinstance(value, dict) and ".sv" in value:
+                value = (node.get(parts[-1]) or 0) + value[".sv"]["increment"]
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = copy.deepcopy(value)
+
+
+def seed(n_contacts, n_messages):
+    users = {"me": {"user_id": "me", "name": "Me", "avatar": "a.png", "login_streak": 3,
+                    "created_at": "2024-01-01 00:00:00", "contacts": {}, "blocked": {}}}
+    for i in range(n_contacts):
+        uid = f"friend{i}"
+        users[uid] = {"user_id": uid, "name": f"Friend {i}", "avatar": "a.png",
+                      "created_at": "2024-01-01 00:00:00"}
+        users["me"]["contacts"][uid] = {"contact_id": uid, "added_at": "2024-01-01"}
+    pair = "friend0_me"
+    messages, index = {}, {}
+    for i in range(n_messages):
+        key = f"-M{i:08d}"
+        messages[key] = {"sender": "me", "receiver": "friend0", "message": "hi",
+                         "timestamp": "2024-01-01T00:00:00", "status": "sent"}
+        index[key] = {"pair": pair, "sender": "me", "receiver": "friend0"}
+    return {"users": users, "chats": {pair: {"messages": messages}},
+            "message_index": index}
+
+
+def make_db(latency, n_contacts, n_messages):
+    db = database.Database()
+    stats = {}
+    root = SlowRef(seed(n_contacts, n_messages), stats, latency)
+    db.ref = root
+    db.users_ref = root.child("users")
+    db.chats_ref = root.child("chats")
+    db.directory_ref = root.child("directory")
+    return db, stats
+
+
+def run(label, fn, latency, rounds, n_contacts, n_messages):
+    db, stats = make_db(latency, n_contacts, n_messages)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(db)
+    elapsed = (time.perf_counter() - started) / rounds
+    calls = sum(stats.values()) / rounds
+    return elapsed, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--contacts", type=int, default=10)
+    parser.add_argument("--bulk", type=int, default=10)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    bulk_ids = [f"-M{i:08d}" for i in range(args.bulk)]
+    cases = [
+        ("is_blocked", lambda db: db.is_blocked("me", "friend0")),
+        ("get_block_state", lambda db: db.get_block_state("me", "friend0")),
+        ("get_contacts", lambda db: db.get_contacts("me")),
+        ("get_profile_stats", lambda db: db.get_profile_stats("me")),
+        ("delete_message_for_user", lambda db: db.delete_message_for_user(bulk_ids[0], "me")),
+        (f"bulk_delete_message_for_user[{args.bulk}]",
+         lambda db: db.bulk_delete_message_for_user(bulk_ids, "me")),
+    ]
+
+    fanout = (database.gather, database.gather_map, database.settle_map)
+    serial = (functools.partial(concurrency.gather, concurrency=1),
+              functools.partial(concurrency.gather_map, concurrency=1),
+              functools.partial(concurrency.settle_map, concurrency=1))
+
+    print(f"latency {args.latency_ms:g} ms/call, {args.rounds} rounds, "
+          f"{args.contacts} contacts")
+    print(f"{'method':<36}{'calls':>7}{'serial ms':>12}{'fan-out ms':>12}{'speedup':>9}")
+    for label, fn in cases:
+        results = []
+        for database.gather, database.gather_map, database.settle_map in (serial, fanout):
+            results.append(run(label, fn, latency, args.rounds, args.contacts, args.bulk))
+        database.gather, database.gather_map, database.settle_map = fanout
+        (t_serial, calls), (t_fanout, _) = results
+        print(f"{label:<36}{calls:>7.1f}{t_serial * 1000:>12.1f}{t_fanout * 1000:>12.1f}"
+              f"{t_serial / t_fanout:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
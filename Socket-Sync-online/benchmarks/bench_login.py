@@ -0,0 +1,114 @@
+"""Login latency: previous hot path vs the current /login handler.
+
+    python benchmarks/bench_login.py [--latency-ms 20] [--rounds 50]
+                                     [--stored-method pbkdf2:sha256:600000]
+
+Both paths run against the latency-injecting reference from bench_fanout
+(every storage call sleeps --latency-ms):
+
+  previous   get_user_by_id, check_password_hash, then a streak update that
+             re-reads the user, strptime()s last_login and always writes
+  current    server.login(): one read, at most one write (none on a repeat
+             login the same day), rehash when the stored hash's method
+             differs from PASSWORD_HASH_METHOD
+
+Each scenario starts from a hash made with --stored-method; pass a method
+other than the server's PASSWORD_HASH_METHOD to see the one-off rehash show
+up in the current path's p99 (later rounds check the upgraded hash).
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from bench_fanout import SlowRef
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import server
+
+
+def attach(latency, password_hash, last_login):
+    stats = {}
+    store = {"users": {"alice": {
+        "user_id": "alice", "name": "Alice", "avatar": "a.png", "password": password_hash,
+        "created_at": "2024-01-01 00:00:00", "login_streak": 3, "last_login": last_login,
+    }}}
+    root = SlowRef(store, stats, latency)
+    server.db.ref = root
+    server.db.users_ref = root.child("users")
+    server.db.chats_ref = root.child("chats")
+    server.db.directory_ref = root.child("directory")
+    return store, stats
+
+
+def previous_login(user_id, password):
+    db = server.db
+    user = db.get_user_by_id(user_id)
+    if not user or not check_password_hash(user["password"], password):
+        return None
+    u = db.get_user_by_id(user_id)
+    now = datetime.now()
+    streak = u.get("login_streak", 0)
+    if u.get("last_login"):
+        delta = (now.date() - datetime.strptime(u["last_login"], "%Y-%m-%d %H:%M:%S.%f").date()).days
+        if delta == 1: streak += 1
+        elif delta > 1: streak = 1
+    else: streak = 1
+    db.users_ref.child(db._sanitize(user_id)).update({"last_login": str(now), "login_streak": streak})
+    del user["password"]
+    return user
+
+
+def current_login(user_id, password):
+    with server.app.test_request_context("/login", method="POST",
+                                         json={"userId": user_id, "password": password}):
+        return server.login()
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def measure(fn, rounds, latency, password_hash, fresh_day):
+    today = str(datetime.now())
+    store, stats = attach(latency, password_hash, today)
+    samples = []
+    for _ in range(rounds):
+        if fresh_day:
+            store["users"]["alice"]["last_login"] = "2000-01-01 00:00:00.000000"
+        started = time.perf_counter()
+        fn("alice", "correct horse")
+        samples.append((time.perf_counter() - started) * 1000)
+    calls = {op: n / rounds for op, n in sorted(stats.items())}
+    return samples, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--stored-method", default=server.PASSWORD_HASH_METHOD)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+    password_hash = generate_password_hash("correct horse", method=args.stored_method)
+
+    print(f"latency {args.latency_ms:g} ms/call, {args.rounds} rounds, stored hash "
+          f"{args.stored_method}, server method {server.PASSWORD_HASH_METHOD}")
+    print(f"{'path':<32}{'p50 ms':>9}{'p99 ms':>9}  calls/login")
+    for label, fn, fresh_day in (
+        ("previous, repeat same day", previous_login, False),
+        ("current, repeat same day", current_login, False),
+        ("previous, first of the day", previous_login, True),
+        ("current, first of the day", current_login, True),
+    ):
+        samples, calls = measure(fn, args.rounds, latency, password_hash, fresh_day)
+        print(f"{label:<32}{percentile(samples, 50):>9.1f}{percentile(samples, 99):>9.1f}  {calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Dashboard render cost: raw message scan vs the hourly rollups.
+
+    python benchmarks/bench_rollups.py [--rows 10000000] [--users 2000] [--days 90]
+                                       [--dir /tmp/rollup-bench] [--keep]
+
+Writes --rows synthetic messages into a scratch analytics store in 1M-row
+batches through store.append_messages + rollups.update, exactly as ingest.py
+does. Traffic comes in conversations: a Zipf-skewed user picks one of their
+few partners and the two trade a geometric number of messages (mean 20)
+seconds apart, at a uniform start time within --days; ~20% carry an
+attachment. Then it times what one dashboard render computes:
+
+  raw      load sender/receiver/timestamp/file_type for every message, map
+           names, value_counts per sender, groupby date and hour, and the
+           row-by-row simplify_type .apply for the File Analysis tab
+  rollup   load the rollup files and derive the same tables from them
+
+Also reports categorizing the attachments' file_type with .apply vs
+rollups.categorize. Peak memory grows with --rows (about 2.5 GB at 10M).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analytics"))
+
+import store
+import rollups
+
+FILE_TYPES = np.array([None, "image/jpeg", "image/png", "video/mp4", "audio/mpeg",
+                       "application/pdf", "text/plain"], dtype=object)
+FILE_WEIGHTS = [0.8, 0.08, 0.04, 0.03, 0.02, 0.02, 0.01]
+BATCH = 1_000_000
+PARTNERS = 8   # people each user regularly talks to
+
+
+def conversations(rng, rows, users, days):
+    """(timestamp ms, sender, receiver) arrays for `rows` messages, time-sorted."""
+    partners = rng.integers(0, users, (users, PARTNERS))
+    lengths = rng.geometric(1 / 20, rows // 10 + 1)
+    lengths = lengths[:np.searchsorted(np.cumsum(lengths), rows) + 1]
+    lengths[-1] -= lengths.sum() - rows
+    sessions = len(lengths)
+    starter = np.minimum(rng.zipf(1.3, sessions) - 1, users - 1)
+    other = partners[starter, rng.integers(0, PARTNERS, sessions)]
+    start_ms = int(pd.Timestamp("2024-01-01", tz="UTC").value // 10 ** 6)
+    begin = rng.integers(start_ms, start_ms + days * 86400 * 1000, sessions)
+
+    session = np.repeat(np.arange(sessions), lengths)
+    gaps = rng.exponential(30_000, rows).astype(np.int64)
+    # Running gap total within each session: cumsum minus the session's offset
+    offsets = np.cumsum(gaps)
+    first = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    offsets -= np.repeat(offsets[first] - gaps[first], lengths)
+    stamps = begin[session] + offsets
+    flip = rng.random(rows) < 0.5
+    senders = np.where(flip, other[session], starter[session])
+    receivers = np.where(flip, starter[session], other[session])
+    order = np.argsort(stamps, kind="stable")
+    return stamps[order], senders[order], receivers[order]
+
+
+def generate(root, rows, users, days, seed):
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"user{i}" for i in range(users)], dtype=object)
+    # Time-sorted so keys (and batches) arrive in order like push ids
+    stamps, senders, receivers = conversations(rng, rows, users, days)
+    for lo in range(0, rows, BATCH):
+        n = min(BATCH, rows - lo)
+        table = pa.table({
+            "key": pa.array([f"k{i:012d}" for i in range(lo, lo + n)]),
+            "sender": pa.array(ids[senders[lo:lo + n]], pa.string()),
+            "receiver": pa.array(ids[receivers[lo:lo + n]], pa.string()),
+            "timestamp": pa.array(stamps[lo:lo + n], pa.timestamp("ms", tz="UTC")),
+            "file_type": pa.array(rng.choice(FILE_TYPES, n, p=FILE_WEIGHTS), pa.string()),
+        }, schema=store.MESSAGE_SCHEMA)
+        store.append_messages(table, root)
+        rollups.update(table, root)
+    store.write_users([{"user_id": u, "name": u.title()} for u in ids], root)
+
+
+def simplify_type(t):
+    t = t.lower()
+    if 'image' in t: return 'Image'
+    if 'video' in t: return 'Video'
+    if 'audio' in t: return 'Audio'
+    return 'Document'
+
+
+def render_raw(root, users_map):
+    df = store.load_messages(columns=["sender", "receiver", "timestamp", "file_type"], root=root)
+    df['sender_name'] = df['sender'].map(users_map).fillna("Unknown")
+    df['receiver_name'] = df['receiver'].map(users_map).fillna("Unknown")
+    df['hour'] = df['timestamp'].dt.hour
+    df['date'] = df['timestamp'].dt.normalize()
+    out = [len(df), df['file_type'].notna().sum(), df['sender_name'].value_counts(),
+           df.groupby('date').size(), df.groupby('hour').size()]
+    file_df = df[df['file_type'].notna()].copy()
+    file_df['category'] = file_df['file_type'].apply(simplify_type)
+    out += [file_df['category'].value_counts(), file_df['sender_name'].value_counts()]
+    return out
+
+
+def render_rollup(root, users_map):
+    r = rollups.load(root=root)
+    sent = rollups.by_sender(r)
+    shared = rollups.by_sender(r, files_only=True)
+    return [rollups.totals(r), sent.index.map(users_map), rollups.daily(r), rollups.hour_of_day(r),
+            rollups.categories(r), shared.index.map(users_map)], len(r)
+
+
+def timed(fn, *args, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="scratch store (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch store")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="rollup-bench-")
+    try:
+        started = time.perf_counter()
+        generate(root, args.rows, args.users, args.days, args.seed)
+        print(f"generated {args.rows:,} messages in {time.perf_counter() - started:.1f}s -> {root}")
+
+        users = store.load_users(root)
+        users_map = dict(zip(users["user_id"], users["name"]))
+        raw_s, raw = timed(render_raw, root, users_map, repeat=1)
+        roll_s, (roll, roll_rows) = timed(render_rollup, root, users_map)
+        assert raw[0] == roll[0]["messages"] and raw[1] == roll[0]["files"]
+
+        file_types = store.load_messages(columns=["file_type"], root=root)["file_type"]
+        present = file_types[file_types.notna()]
+        apply_s, _ = timed(lambda: present.apply(simplify_type), repeat=1)
+        vector_s, _ = timed(rollups.categorize, present)
+
+        print(f"rollup rows: {roll_rows:,} ({roll_rows / args.rows:.2%} of messages)")
+        print(f"{'render':<24}{'raw scan':>12}{'rollups':>12}{'speedup':>10}")
+        print(f"{'dashboard tables':<24}{raw_s * 1000:>10.0f}ms{roll_s * 1000:>10.0f}ms{raw_s / roll_s:>9.1f}x")
+        print(f"{'categorize file_type':<24}{apply_s * 1000:>10.0f}ms{vector_s * 1000:>10.0f}ms"
+              f"{apply_s / vector_s:>9.1f}x")
+    finally:
+        if not args.keep and not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
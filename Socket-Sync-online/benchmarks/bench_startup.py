@@ -0,0 +1,117 @@
+"""Cold-start cost of the backend: time and memory to import server.py.
+
+    python benchmarks/bench_startup.py [--runs 10] [--module server]
+                                       [--out startup.json]
+                                       [--compare previous.json --tolerance 0.2]
+
+Each run is a fresh interpreter (what a worker boot or a serverless cold
+start pays) that imports the module with STORAGE_BACKEND=memory and reports:
+
+    import_ms     wall time of the import
+    rss_mb        peak resident set size afterwards (ru_maxrss)
+    deferred      heavy optional modules that got loaded anyway; should stay
+                  empty, they belong to /stats, /analytics, /user/<id>/qr,
+                  /start-dashboard
+
+The interpreter's own startup is measured with an empty run and reported
+separately so the numbers track server.py alone. With --compare the median
+import time and peak RSS are checked against an earlier result and the run
+exits 1 when either grew by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ("matplotlib", "numpy", "qrcode", "pandas", "pyarrow", "streamlit")
+
+PROBE = """
+import sys, json, time, resource
+started = time.perf_counter()
+if {module!r}:
+    __import__({module!r})
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024   # bytes there, KiB on Linux
+print(json.dumps({{"import_ms": elapsed * 1000, "rss_mb": rss / 1024,
+                   "deferred": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    env = dict(os.environ, STORAGE_BACKEND="memory", LOG_LEVEL="WARNING")
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, deferred=DEFERRED)],
+                         cwd=os.path.join(ROOT, "backend"), env=env,
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summarize(samples, key):
+    values = sorted(s[key] for s in samples)
+    return {"median": round(statistics.median(values), 1), "min": round(values[0], 1),
+            "max": round(values[-1], 1)}
+
+
+def compare(result, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    failures = []
+    for key in ("import_ms", "rss_mb"):
+        old = baseline[key]["median"]
+        new = result[key]["median"]
+        if new > old * (1 + tolerance):
+            failures.append(f"{key} {old} -> {new}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--out", help="write the result JSON here")
+    parser.add_argument("--compare", help="earlier result JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    probe(args.module)   # warm the filesystem and .pyc caches
+    baseline = [probe("") for _ in range(args.runs)]
+    runs = [probe(args.module) for _ in range(args.runs)]
+    deferred = sorted({m for r in runs for m in r["deferred"]})
+
+    result = {
+        "module": args.module,
+        "runs": args.runs,
+        "env": {"python": platform.python_version(), "platform": platform.platform()},
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "import_ms": summarize(runs, "import_ms"),
+        "rss_mb": summarize(runs, "rss_mb"),
+        "process_ms": summarize(runs, "process_ms"),
+        "interpreter": {"process_ms": summarize(baseline, "process_ms"),
+                        "rss_mb": summarize(baseline, "rss_mb")},
+        "deferred_loaded": deferred,
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = [f"{m} imported at startup" for m in deferred]
+    if args.compare:
+        failures += compare(result, args.compare, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""Deterministic synthetic chat data at production scale.
+
+    python benchmarks/generate_dataset.py [--users 100000] [--messages 50000000]
+                                          [--days 90] [--contacts 12] [--seed 1]
+                                          [--to parquet|json|db] [--out PATH]
+                                          [--analytics DIR] [--batch 500]
+
+Same seed and arguments, same data, byte for byte, so benchmark runs are
+comparable. What gets generated:
+
+  users       ids user000000.., names, avatars, one shared password hash
+              (the password is "password")
+  contacts    power-law out-degree (Pareto, mean --contacts), targets picked
+              preferentially by popularity, ~80% reciprocated
+  blocks      --block-rate of contact edges; blocked pairs never talk
+  messages    conversations between contacts, started by Zipf-skewed users
+              at diurnal/weekly-weighted times, geometric length (mean 20),
+              lognormal gaps between turns (bursty: seconds, sometimes hours)
+  attachments --file-rate of messages, by MIME type (images dominate)
+  states      read/delivered/sent by age: old messages are read, the last
+              day has a mix; inbox unread counts follow
+
+Outputs (--to):
+
+  parquet     OUT/users.parquet, contacts.parquet, blocks.parquet and
+              OUT/messages/part-NNNNN.parquet (one per generated day);
+              --analytics DIR also fills an analytics store (store.py +
+              rollups.py), ready for the dashboard and /analytics
+  json        OUT as a Firebase-export-style JSON tree (built in memory
+              through the emulator: keep it to a few million messages)
+  db          streams into Database() (STORAGE_BACKEND picks the backend)
+              as multi-path updates of --batch messages, in the exact
+              layout save_message/create_user/add_contact/toggle_block write
+
+Messages are produced one day at a time in key (= time) order, so memory
+follows a day's traffic, not the whole history. write_rtdb(dataset, ref)
+and write_parquet(dataset, path) are importable for benchmarks that build
+their own backend.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "analytics"))
+
+from database import PUSH_CHARS, media_category, message_snippet
+
+FIRST = ["Aarav", "Aisha", "Ben", "Chloe", "Diego", "Elena", "Farah", "Gabe", "Hana", "Ivan",
+         "Jia", "Kofi", "Lena", "Mateo", "Nina", "Omar", "Priya", "Quinn", "Rosa", "Sam"]
+LAST = ["Ahmed", "Brown", "Chen", "Das", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Jones",
+        "Khan", "Lopez", "Meyer", "Nair", "Okafor", "Patel", "Rossi", "Singh", "Tanaka", "Wu"]
+PHRASES = ["hey", "hi!", "how are you?", "good, you?", "lol", "ok", "see you soon",
+           "on my way", "did you see this?", "haha yes", "sounds good", "what time?",
+           "running late, sorry", "thanks!", "np", "call me when you're free", "👍",
+           "can't today, tomorrow?", "just landed", "send me the notes please",
+           "that's hilarious 😂", "where are you?", "almost there", "good night"]
+# MIME type, extension, share of attachments
+FILE_TYPES = [("image/jpeg", ".jpg", 0.45), ("image/png", ".png", 0.15), ("video/mp4", ".mp4", 0.12),
+              ("audio/mpeg", ".mp3", 0.08), ("application/pdf", ".pdf", 0.12),
+              ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx", 0.05),
+              ("text/plain", ".txt", 0.03)]
+# Share of conversations starting in each UTC hour, and on each weekday (Mon..Sun)
+DIURNAL = np.array([1, 0.6, 0.4, 0.3, 0.3, 0.4, 0.8, 1.5, 2.2, 2.6, 2.8, 3.0,
+                    3.4, 3.2, 2.9, 2.8, 3.0, 3.3, 3.7, 4.1, 4.4, 4.0, 3.0, 1.8])
+WEEKLY = np.array([1, 1, 1, 1, 1.05, 0.85, 0.8])
+SESSION_MEAN = 20       # messages per conversation
+GAP_MEDIAN_MS = 8000    # between consecutive messages of a conversation
+GAP_SIGMA = 1.3         # lognormal spread: most replies in seconds, some hours later
+RECIPROCATED = 0.8
+DAY_MS = 86400 * 1000
+STATUSES = np.array(["sent", "delivered", "read"], dtype=object)
+# werkzeug scrypt hash of "password", fixed so output doesn't vary with the salt
+PASSWORD_HASH = ("scrypt:32768:8:1$dIWY1CeNGQikIW6P$129f42e7507070bfec2c514ec573a7bd1f89cd7474948169"
+                 "b7630de0e7d041716ee973fffbcfed4938a7f7a0ed23810a7518a933d74a9af2665b71838a426f66")
+
+MESSAGE_SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("pair", pa.string()),
+    ("sender", pa.string()),
+    ("receiver", pa.string()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("message", pa.string()),
+    ("file_type", pa.string()),
+    ("file_url", pa.string()),
+    ("status", pa.string()),
+])
+
+
+def push_ids(ms, rng):
+    """Firebase push ids for epoch-ms times: 8 time chars + 12 random ones."""
+    digits = (ms[:, None] // (64 ** np.arange(7, -1, -1, dtype=np.int64))) % 64
+    codes = np.concatenate([digits, rng.integers(0, 64, (len(ms), 12))], axis=1)
+    chars = np.array(list(PUSH_CHARS))[codes]
+    return np.ascontiguousarray(chars).view("<U20").ravel()
+
+
+def _sanitize(key):
+    return str(key).replace(".", ",")   # as Database._sanitize
+
+
+class Dataset:
+    """Users and the contact/block graph, built eagerly; messages() streams.
+
+    Graph and messages draw from separate seeded generators, so messages()
+    yields the same chunks however often it is iterated.
+    """
+
+    def __init__(self, users=100_000, messages=50_000_000, days=90, contacts=12,
+                 block_rate=0.01, file_rate=0.08, start="2024-01-01", seed=1):
+        self.n, self.total, self.days = users, messages, days
+        self.file_rate, self.seed = file_rate, seed
+        self.start_ms = int(pd.Timestamp(start, tz="UTC").value // 10 ** 6)
+        self.end_ms = self.start_ms + days * DAY_MS
+        rng = np.random.default_rng([seed, 0])
+
+        width = len(str(users - 1))
+        self.ids = np.array([f"user{i:0{width}d}" for i in range(users)], dtype=object)
+        self.names = np.array([f"{FIRST[a]} {LAST[b]}" for a, b in
+                               rng.integers(0, len(FIRST), (users, 2))], dtype=object)
+        self.created_ms = self.start_ms - rng.integers(0, 365 * DAY_MS, users)
+
+        # Pareto out-degree (mean 3x its minimum, before reciprocation adds
+        # its share); targets drawn in proportion to degree, so the
+        # well-connected are also the most often added
+        scale = max(contacts / (3 * (1 + RECIPROCATED)), 1)
+        degree = np.minimum((rng.pareto(1.5, users) + 1) * scale, users - 1).astype(np.int64)
+        src = np.repeat(np.arange(users), degree)
+        dst = rng.choice(users, len(src), p=degree / degree.sum())
+        back = rng.random(len(src)) < RECIPROCATED
+        src, dst = np.concatenate([src, dst[back]]), np.concatenate([dst, src[back]])
+        codes = np.unique(src[src != dst] * users + dst[src != dst])
+        self.contacts = np.stack([codes // users, codes % users], axis=1)
+
+        blocked = rng.random(len(codes)) < block_rate
+        self.blocks = self.contacts[blocked]
+        # Either direction of a block ends the conversation
+        cut = np.isin(self._unordered(self.contacts), self._unordered(self.blocks))
+        talk = self.contacts[~cut]
+        self._partners = talk[:, 1]   # sorted by source: CSR adjacency
+        self._offsets = np.searchsorted(talk[:, 0], np.arange(users + 1))
+        # Zipf-like activity over a random order of users; no partners, no talking
+        activity = (rng.permutation(users) + 1.0) ** -0.9
+        activity[np.diff(self._offsets) == 0] = 0
+        self._activity = activity / activity.sum()
+
+    def _unordered(self, edges):
+        return np.minimum(edges[:, 0], edges[:, 1]) * self.n + np.maximum(edges[:, 0], edges[:, 1])
+
+    def _day(self, rng, day_ms, budget):
+        """(ms, sender, receiver) for `budget` messages in conversations starting that day."""
+        lengths = rng.geometric(1 / SESSION_MEAN, budget // SESSION_MEAN * 2 + 16)
+        while lengths.sum() < budget:
+            lengths = np.concatenate([lengths, rng.geometric(1 / SESSION_MEAN, budget // SESSION_MEAN + 16)])
+        lengths = lengths[:np.searchsorted(np.cumsum(lengths), budget) + 1]
+        lengths[-1] -= lengths.sum() - budget
+        sessions = len(lengths)
+
+        starter = rng.choice(self.n, sessions, p=self._activity)
+        degree = self._offsets[starter + 1] - self._offsets[starter]
+        partner = self._partners[self._offsets[starter] + (rng.random(sessions) * degree).astype(np.int64)]
+        begin = (day_ms + rng.choice(24, sessions, p=DIURNAL / DIURNAL.sum()) * 3_600_000
+                 + rng.integers(0, 3_600_000, sessions))
+
+        session = np.repeat(np.arange(sessions), lengths)
+        first = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        gaps = rng.lognormal(np.log(GAP_MEDIAN_MS), GAP_SIGMA, budget).astype(np.int64)
+        gaps[first] = 0
+        offsets = np.cumsum(gaps)
+        offsets -= np.repeat(offsets[first], lengths)
+        # Turn taking: the speaker changes on ~55% of messages, starter first
+        turns = (rng.random(budget) < 0.55).astype(np.int64)
+        turns[first] = 0
+        turns = np.cumsum(turns)
+        turns = (turns - np.repeat(turns[first], lengths)) % 2
+        sender = np.where(turns == 0, starter[session], partner[session])
+        receiver = np.where(turns == 0, partner[session], starter[session])
+        return begin[session] + offsets, sender, receiver
+
+    def messages(self):
+        """pyarrow Tables (MESSAGE_SCHEMA), one per day, in key order overall.
+
+        A conversation running past midnight is carried into the next day's
+        chunk, so every chunk's keys sort after the previous chunk's.
+        """
+        rng = np.random.default_rng([self.seed, 1])
+        day_ms = self.start_ms + np.arange(self.days, dtype=np.int64) * DAY_MS
+        weights = WEEKLY[np.asarray(pd.to_datetime(day_ms, unit="ms").dayofweek)]
+        budgets = rng.multinomial(self.total, weights / weights.sum())
+        pending = (np.empty(0, np.int64),) * 3
+        for i, (day, budget) in enumerate(zip(day_ms, budgets)):
+            parts = [pending, self._day(rng, day, budget)] if budget else [pending]
+            ms, sender, receiver = (np.concatenate(cols) for cols in zip(*parts))
+            now = ms < day + DAY_MS if i < self.days - 1 else np.ones(len(ms), bool)
+            pending = (ms[~now], sender[~now], receiver[~now])
+            if now.any():
+                yield self._table(rng, ms[now], sender[now], receiver[now])
+
+    def _table(self, rng, ms, sender, receiver):
+        n = len(ms)
+        keys = push_ids(ms, rng)
+        order = np.argsort(keys, kind="stable")
+        keys, ms, sender, receiver = keys[order], ms[order], sender[order], receiver[order]
+
+        has_file = rng.random(n) < self.file_rate
+        kind = rng.choice(len(FILE_TYPES), n, p=[w for _, _, w in FILE_TYPES])
+        mimes = np.array([t for t, _, _ in FILE_TYPES], dtype=object)
+        exts = np.array([e for _, e, _ in FILE_TYPES], dtype=object)
+        file_type = np.where(has_file, mimes[kind], None)
+        file_url = np.where(has_file, "/uploads/gen/" + keys.astype(object) + exts[kind], None)
+        text = np.where(has_file, "", np.array(PHRASES, dtype=object)[rng.integers(0, len(PHRASES), n)])
+
+        # Everything older than a day has been read (a few only delivered);
+        # the last day is still being caught up on
+        age = self.end_ms - ms
+        roll = rng.random(n)
+        status = np.where(age > DAY_MS, np.where(roll < 0.97, 2, 1),
+                          np.where(roll < 0.55, 2, np.where(roll < 0.85, 1, 0)))
+
+        lo, hi = np.minimum(sender, receiver), np.maximum(sender, receiver)
+        ids = pa.array(self.ids, pa.string())
+        return pa.table({
+            "key": pa.array(keys, pa.string()),
+            # Zero-padded ids sort like their numbers: the same pair id as
+            # Database._get_pair_id
+            "pair": pc.binary_join_element_wise(ids.take(lo), ids.take(hi), "-"),
+            "sender": ids.take(sender),
+            "receiver": ids.take(receiver),
+            "timestamp": pa.array(ms, pa.timestamp("ms", tz="UTC")),
+            "message": pa.array(text, pa.string()),
+            "file_type": pa.array(file_type, pa.string()),
+            "file_url": pa.array(file_url, pa.string()),
+            "status": pa.array(STATUSES[status], pa.string()),
+        }, schema=MESSAGE_SCHEMA)
+
+
+# ================== WRITERS ==================
+def _iso(ms):
+    return pd.Timestamp(int(ms), unit="ms").isoformat()
+
+
+def _user_records(ds):
+    by_src = np.searchsorted(ds.contacts[:, 0], np.arange(ds.n + 1))
+    by_blocker = np.searchsorted(ds.blocks[:, 0], np.arange(ds.n + 1))
+    for u in range(ds.n):
+        uid = ds.ids[u]
+        entry = {"user_id": uid, "name": ds.names[u], "avatar": f"https://i.pravatar.cc/150?u={uid}"}
+        added = _iso(ds.created_ms[u])
+        record = {**entry, "password": PASSWORD_HASH, "created_at": added, "login_streak": 0,
+                  "contacts": {_sanitize(ds.ids[c]): {"contact_id": ds.ids[c], "added_at": added}
+                               for c in ds.contacts[by_src[u]:by_src[u + 1], 1]},
+                  "blocked": {_sanitize(ds.ids[b]): True for b in ds.blocks[by_blocker[u]:by_blocker[u + 1], 1]}}
+        yield _sanitize(uid), record, entry
+
+
+def _message_updates(row):
+    """Paths save_message writes for one message (inbox summaries aside)."""
+    key, pair = row["key"], row["pair"]
+    stamp = row["timestamp"].replace(tzinfo=None).isoformat(timespec="microseconds")
+    data = {"sender": row["sender"], "receiver": row["receiver"], "message": row["message"],
+            "timestamp": stamp, "status": row["status"], "is_revoked": False}
+    index = {"pair": pair, "sender": row["sender"], "receiver": row["receiver"]}
+    updates = {}
+    if row["file_url"]:
+        category = media_category(row["file_type"])
+        data.update(file_url=row["file_url"], file_type=row["file_type"])
+        index.update(media=True, file_type=row["file_type"])
+        updates[f"chats/{pair}/media/{key}"] = {
+            "category": category, "cat_key": f"{category}:{key}", "file_url": row["file_url"],
+            "file_type": row["file_type"], "sender": row["sender"], "timestamp": stamp}
+    updates[f"chats/{pair}/messages/{key}"] = data
+    updates[f"message_index/{key}"] = index
+    return updates, data
+
+
+def write_rtdb(ds, root, batch=500, log=print):
+    """Stream the dataset into an RTDB root reference (Database.ref, an
+    Emulator reference or firebase_admin's) as multi-path updates."""
+    updates = {}
+
+    def flush(force=False):
+        if updates and (force or len(updates) >= batch * 3):
+            root.update(dict(updates))
+            updates.clear()
+
+    for key, record, entry in _user_records(ds):
+        updates[f"users/{key}"] = record
+        updates[f"directory/{key}"] = entry
+        flush()
+    flush(True)
+    log(f"users: {ds.n:,}, contacts: {len(ds.contacts):,}, blocks: {len(ds.blocks):,}")
+
+    # Per unordered pair: the last message (for both inbox summaries) and
+    # per receiver the messages not read yet
+    inbox, unread = {}, {}
+    written = 0
+    for table in ds.messages():
+        for row in table.to_pylist():
+            paths, data = _message_updates(row)
+            updates.update(paths)
+            inbox[row["pair"]] = (row["key"], data)
+            if row["status"] != "read":
+                unread[(row["receiver"], row["sender"])] = unread.get((row["receiver"], row["sender"]), 0) + 1
+            flush()
+        written += table.num_rows
+        log(f"messages: {written:,}")
+    flush(True)
+
+    for key, data in inbox.values():
+        summary = {"last_message": message_snippet(data), "last_key": key,
+                   "last_sender": data["sender"], "timestamp": data["timestamp"]}
+        for owner, partner in ((data["sender"], data["receiver"]), (data["receiver"], data["sender"])):
+            updates[f"inbox/{_sanitize(owner)}/{_sanitize(partner)}"] = {
+                **summary, "partner": partner, "unread": unread.get((owner, partner), 0)}
+        flush()
+    flush(True)
+    log(f"inbox pairs: {len(inbox):,}")
+    return written
+
+
+def write_parquet(ds, path, analytics=None, log=print):
+    """Tables under `path`; with `analytics`, also an analytics store there."""
+    os.makedirs(os.path.join(path, "messages"), exist_ok=True)
+    users = pa.table({"user_id": pa.array(ds.ids, pa.string()), "name": pa.array(ds.names, pa.string()),
+                      "created_at": pa.array(ds.created_ms, pa.timestamp("ms", tz="UTC"))})
+    pq.write_table(users, os.path.join(path, "users.parquet"))
+    for name, edges, cols in (("contacts", ds.contacts, ("user_id", "contact_id")),
+                              ("blocks", ds.blocks, ("blocker", "blocked"))):
+        pq.write_table(pa.table({cols[0]: pa.array(ds.ids[edges[:, 0]], pa.string()),
+                                 cols[1]: pa.array(ds.ids[edges[:, 1]], pa.string())}),
+                       os.path.join(path, f"{name}.parquet"))
+    if analytics:
+        import store
+        import rollups
+    written = 0
+    for part, table in enumerate(ds.messages()):
+        pq.write_table(table, os.path.join(path, "messages", f"part-{part:05d}.parquet"), compression="zstd")
+        if analytics:
+            rows = table.select(store.MESSAGE_SCHEMA.names)
+            store.append_messages(rows, analytics)
+            rollups.update(rows, analytics)
+            store.write_state({"watermark": rows["key"][-1].as_py(), "rows": written + rows.num_rows},
+                              analytics)
+        written += table.num_rows
+        log(f"messages: {written:,}")
+    if analytics:
+        store.write_users([{"user_id": u, "name": n} for u, n in zip(ds.ids, ds.names)], analytics)
+    return written
+
+
+def write_json(ds, path, log=print):
+    from rtdb_emulator import Emulator
+    root = Emulator().reference("/")
+    written = write_rtdb(ds, root, batch=5000, log=log)
+    with open(path, "w") as f:
+        json.dump(root.get(), f, ensure_ascii=False)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=50_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--contacts", type=float, default=12, help="mean contacts per user")
+    parser.add_argument("--block-rate", type=float, default=0.01)
+    parser.add_argument("--file-rate", type=float, default=0.08)
+    parser.add_argument("--start", default="2024-01-01", help="first day (UTC)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--to", choices=("parquet", "json", "db"), default="parquet")
+    parser.add_argument("--out", default="dataset", help="directory (parquet) or file (json)")
+    parser.add_argument("--analytics", help="with --to parquet: also build an analytics store here")
+    parser.add_argument("--batch", type=int, default=500, help="messages per update (--to db)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    ds = Dataset(args.users, args.messages, args.days, args.contacts, args.block_rate,
+                 args.file_rate, args.start, args.seed)
+    print(f"graph built in {time.perf_counter() - started:.1f}s")
+    if args.to == "parquet":
+        written = write_parquet(ds, args.out, args.analytics)
+    elif args.to == "json":
+        written = write_json(ds, args.out)
+    else:
+        from database import Database
+        db = Database()
+        if not db.ref:
+            sys.exit("Database has no backend (set STORAGE_BACKEND or Firebase credentials)")
+        written = write_rtdb(ds, db.ref, args.batch)
+    print(f"{written:,} messages for {ds.n:,} users in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end load generator for the Socket.IO chat path.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/loadgen.py [--users 20] [--duration 30] [--out results.json]
+                                 [--compare previous.json --tolerance 0.2]
+
+Starts backend/server.py on a free port with STORAGE_BACKEND=memory (unless
+--url points at a running server), signs up --users users, pairs them off
+and connects one Socket.IO client per user. Each user then loops for
+--duration seconds with exponential think time (--think-ms mean) and picks:
+
+    send_message 55%   typing 30%   read_messages 15%
+
+Receivers answer every receive_message with a delivery_receipt, like the
+web client does. Reported (and written as JSON with --out):
+
+    throughput     confirmed messages per second
+    send_to_confirm  emit -> message_sent_confirm at the sender
+    send_to_receive  emit -> receive_message at the receiver
+    p50/p95/p99/max per latency, plus counts and errors
+
+With --compare, the p95s and throughput are checked against an earlier
+result and the run exits 1 if any is worse by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTIONS = (("send_message", 0.55), ("typing", 0.30), ("read_messages", 0.15))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    env = dict(os.environ, STORAGE_BACKEND="memory", LOG_LEVEL="WARNING")
+    code = ("import server; server.socketio.run(server.app, host='127.0.0.1', "
+            f"port={port}, debug=False, log_output=False)")
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=os.path.join(ROOT, "backend"),
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("server exited during startup")
+        try:
+            requests.get(url + "/metrics", timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not start within 30 s")
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+    return {"count": len(ordered), "p50": pick(50), "p95": pick(95), "p99": pick(99),
+            "max": round(ordered[-1], 3)}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}            # temp_id -> perf_counter at emit
+        self.confirm_ms = []
+        self.receive_ms = []
+        self.actions = {name: 0 for name, _ in ACTIONS}
+        self.errors = 0
+
+    def add(self, bucket, value):
+        with self.lock:
+            bucket.append(value)
+
+
+class VirtualUser:
+    def __init__(self, user_id, partner_id, url, stats, think_ms, transports):
+        self.user_id = user_id
+        self.partner_id = partner_id
+        self.room = "-".join(sorted([user_id, partner_id]))
+        self.url = url
+        self.stats = stats
+        self.think = think_ms / 1000
+        self.transports = transports
+        self.client = socketio.Client(reconnection=False)
+        self.seq = 0
+        self.seen = set()   # the server emits to both pair and personal room
+        self.token = None
+        self._register()
+
+    def _register(self):
+        on = self.client.on
+
+        @on("message_sent_confirm")
+        def confirmed(data):
+            started = self.stats.sent.get(data.get("temp_id"))
+            if started is not None:
+                self.stats.add(self.stats.confirm_ms, (time.perf_counter() - started) * 1000)
+
+        @on("receive_message")
+        def received(data):
+            if data.get("to") != self.user_id or data.get("id") in self.seen:
+                return
+            self.seen.add(data.get("id"))
+            text = data.get("message") or ""
+            if text.startswith("lg:"):
+                started = self.stats.sent.get(text[3:])
+                if started is not None:
+                    self.stats.add(self.stats.receive_ms, (time.perf_counter() - started) * 1000)
+            self.client.emit("delivery_receipt", {
+                "msg_id": data.get("id"), "sender": data.get("from"), "receiver": self.user_id})
+
+        @on("error")
+        def failed(data):
+            with self.stats.lock:
+                self.stats.errors += 1
+
+    def connect(self):
+        login = requests.post(f"{self.url}/login",
+                              json={"userId": self.user_id, "password": "loadgen"}).json()
+        self.token = login.get("access_token")
+        self.client.connect(self.url, auth={"token": self.token} if self.token else None,
+                            transports=self.transports, wait_timeout=10)
+        # Personal room + pair room, as chat.html does on open
+        self.client.emit("join", {"room": self.user_id})
+        self.client.emit("join", {"room": self.room})
+
+    def act(self, action):
+        if action == "send_message":
+            self.seq += 1
+            temp_id = f"{self.user_id}:{self.seq}"
+            self.stats.sent[temp_id] = time.perf_counter()
+            self.client.emit("send_message", {"from": self.user_id, "to": self.partner_id,
+                                              "room": self.room, "text": f"lg:{temp_id}",
+                                              "temp_id": temp_id})
+        elif action == "typing":
+            self.client.emit("typing", {"from": self.user_id, "to": self.partner_id, "typing": True})
+        else:
+            self.client.emit("read_messages", {"sender": self.partner_id, "receiver": self.user_id})
+        with self.stats.lock:
+            self.stats.actions[action] += 1
+
+    def run(self, stop_at, rng):
+        names = [name for name, _ in ACTIONS]
+        weights = [w for _, w in ACTIONS]
+        while time.perf_counter() < stop_at:
+            time.sleep(rng.expovariate(1 / self.think) if self.think > 0 else 0)
+            try:
+                self.act(rng.choices(names, weights)[0])
+            except Exception:
+                with self.stats.lock:
+                    self.stats.errors += 1
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def compare(result, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    failures = []
+    for name in ("send_to_confirm", "send_to_receive"):
+        old = baseline["latency_ms"].get(name, {}).get("p95")
+        new = result["latency_ms"].get(name, {}).get("p95")
+        if old and new and new > old * (1 + tolerance):
+            failures.append(f"{name} p95 {old} -> {new} ms")
+    old_tp, new_tp = baseline.get("throughput_msgs_per_s"), result.get("throughput_msgs_per_s")
+    if old_tp and new_tp is not None and new_tp < old_tp * (1 - tolerance):
+        failures.append(f"throughput {old_tp} -> {new_tp} msg/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="virtual users (paired off)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean think time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--transport", choices=("websocket", "polling"), default=None)
+    parser.add_argument("--out", help="write the result JSON here")
+    parser.add_argument("--compare", help="earlier result JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    proc = None
+    url = args.url
+    if not url:
+        proc, url = start_server(free_port())
+    transports = [args.transport] if args.transport else None
+    rng = random.Random(args.seed)
+    stats = Stats()
+    users = []
+    try:
+        ids = [f"lg{args.seed}_{i}" for i in range(args.users + args.users % 2)]
+        for uid in ids:
+            requests.post(f"{url}/signup", json={"userId": uid, "name": uid, "password": "loadgen",
+                                                 "avatar": None})
+        for a, b in zip(ids[::2], ids[1::2]):
+            users.append(VirtualUser(a, b, url, stats, args.think_ms, transports))
+            users.append(VirtualUser(b, a, url, stats, args.think_ms, transports))
+        for user in users:
+            user.connect()
+
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        threads = [threading.Thread(target=u.run, args=(stop_at, random.Random(rng.random())))
+                   for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        time.sleep(1)   # let in-flight confirms/receives land
+        elapsed = time.perf_counter() - started
+    finally:
+        for user in users:
+            user.close()
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    result = {
+        "config": {"users": len(users), "duration_s": args.duration, "think_ms": args.think_ms,
+                   "seed": args.seed, "transport": args.transport or "default",
+                   "mix": dict(ACTIONS)},
+        "env": {"python": platform.python_version(), "platform": platform.platform()},
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "actions": stats.actions,
+        "sent": len(stats.sent),
+        "confirmed": len(stats.confirm_ms),
+        "received": len(stats.receive_ms),
+        "errors": stats.errors,
+        "throughput_msgs_per_s": round(len(stats.confirm_ms) / elapsed, 2),
+        "latency_ms": {
+            "send_to_confirm": percentiles(stats.confirm_ms),
+            "send_to_receive": percentiles(stats.receive_ms),
+        },
+    }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        failures = compare(result, args.compare, args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Frontend asset build: fingerprint + precompress + manifest.
+
+    python build_assets.py            # writes frontend/dist/
+
+For every file under frontend/css and frontend/js this writes
+    dist/<dir>/<name>.<hash>.<ext>      (content-hashed, cache forever)
+    dist/<dir>/<name>.<hash>.<ext>.gz   (gzip -9)
+    dist/<dir>/<name>.<hash>.<ext>.br   (brotli q11, if `brotli` is installed)
+CSS @import / url() and the <script>/<link> tags in frontend/pages are
+rewritten to the fingerprinted names (pages keep their names so routes don't
+change, but are precompressed too). dist/manifest.json maps logical -> built
+names; backend/assets.py serves from it when present.
+"""
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+
+FINGERPRINT_DIRS = ("css", "js")
+COMPRESSIBLE = (".css", ".js", ".html", ".svg", ".json")
+HASH_LEN = 10
+
+CSS_REF = re.compile(r"""(@import\s+(?:url\()?\s*|url\(\s*)(['"]?)([^'")\s]+)\2""")
+HTML_REF = re.compile(r"""((?:src|href)=)(["'])([^"']+)\2""")
+
+
+def _is_local(ref):
+    return not (ref.startswith(("http:", "https:", "data:", "//", "#")))
+
+
+def _split_query(ref):
+    path, _, _ = ref.partition("?")
+    return path
+
+
+def _write_variants(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    if not path.endswith(COMPRESSIBLE):
+        return []
+    encodings = []
+    with open(path + ".gz", "wb") as f:
+        # mtime=0 keeps builds reproducible
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append("gzip")
+    if BROTLI_AVAILABLE:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+        encodings.append("br")
+    return encodings
+
+
+class AssetBuilder:
+    def __init__(self, frontend_dir=FRONTEND_DIR, dist_dir=DIST_DIR):
+        self.frontend_dir = frontend_dir
+        self.dist_dir = dist_dir
+        self.assets = {}      # logical rel path -> fingerprinted rel path
+        self.encodings = {}   # built rel path -> ["gzip", "br"]
+
+    def build(self):
+        if os.path.isdir(self.dist_dir):
+            shutil.rmtree(self.dist_dir)
+        os.makedirs(self.dist_dir)
+
+        for top in FINGERPRINT_DIRS:
+            root = os.path.join(self.frontend_dir, top)
+            for dirpath, _, files in os.walk(root):
+                for name in sorted(files):
+                    rel = os.path.relpath(os.path.join(dirpath, name), self.frontend_dir)
+                    self._fingerprint(rel.replace(os.sep, "/"))
+
+        pages = os.path.join(self.frontend_dir, "pages")
+        for name in sorted(os.listdir(pages)):
+            if name.endswith(".html"):
+                self._build_page(f"pages/{name}")
+
+        manifest = {"assets": self.assets, "encodings": self.encodings}
+        with open(os.path.join(self.dist_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest
+
+    def _resolve(self, from_rel, ref):
+        base = os.path.dirname(from_rel)
+        return os.path.normpath(os.path.join(base, _split_query(ref))).replace(os.sep, "/")
+
+    def _relative(self, from_rel, target_rel):
+        return os.path.relpath(target_rel, os.path.dirname(from_rel)).replace(os.sep, "/")
+
+    def _fingerprint(self, rel, stack=()):
+        if rel in self.assets:
+            return self.assets[rel]
+        if rel in stack:
+            raise ValueError(f"Circular asset reference: {' -> '.join(stack + (rel,))}")
+
+        with open(os.path.join(self.frontend_dir, rel), "rb") as f:
+            data = f.read()
+
+        if rel.endswith(".css"):
+            # Children first, so a module change also changes style.css's hash
+            def swap(m):
+                prefix, quote, ref = m.groups()
+                if not _is_local(ref):
+                    return m.group(0)
+                target = self._resolve(rel, ref)
+                if target.split("/")[0] not in FINGERPRINT_DIRS or \
+                        not os.path.isfile(os.path.join(self.frontend_dir, target)):
+                    return m.group(0)
+                built = self._fingerprint(target, stack + (rel,))
+                return f"{prefix}{quote}{self._relative(rel, built)}{quote}"
+            data = CSS_REF.sub(swap, data.decode("utf-8")).encode("utf-8")
+
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+        stem, ext = os.path.splitext(rel)
+        built = f"{stem}.{digest}{ext}"
+
+        out = os.path.join(self.dist_dir, built)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        self.encodings[built] = _write_variants(out, data)
+        self.assets[rel] = built
+        return built
+
+    def _build_page(self, rel):
+        with open(os.path.join(self.frontend_dir, rel), encoding="utf-8") as f:
+            html = f.read()
+
+        def swap(m):
+            attr, quote, ref = m.groups()
+            if not _is_local(ref):
+                return m.group(0)
+            target = self._resolve(rel, ref)
+            built = self.assets.get(target)
+            if not built:
+                return m.group(0)
+            return f"{attr}{quote}{self._relative(rel, built)}{quote}"
+
+        html = HTML_REF.sub(swap, html)
+        out = os.path.join(self.dist_dir, rel)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        self.encodings[rel] = _write_variants(out, html.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    manifest = AssetBuilder().build()
+    if not BROTLI_AVAILABLE:
+        print("WARNING: brotli not installed, only gzip variants were written.")
+    print(f"Built {len(manifest['assets'])} assets + {len(manifest['encodings']) - len(manifest['assets'])} pages into {DIST_DIR}")
@@ -35,7 +35,9 @@ function logout() {
 // ================= LOAD USERS (CHAT LIST) =================
 async function loadUsers() {
     try {
-        const r = await fetch(`${API_BASE}/chat-list?user_id=${currentUser.user_id}`);
+        const r = await fetch(`${API_BASE}/chat-list?user_id=${currentUser.user_id}`, {
+            headers: authHeaders()
+        });
         const users = await r.json();
 
         chatList.innerHTML = "";
@@ -93,7 +95,7 @@ async function addContact() {
     try {
         const r = await fetch(`${API_BASE}/contacts/add`, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: authHeaders({ "Content-Type": "application/json" }),
             body: JSON.stringify({
                 user_id: currentUser.user_id,
                 contact_id: contactId
@@ -6,6 +6,13 @@
 const socket = null; // Placeholder to prevent crash in un-migrated files for now
 const API_BASE = ""; // Not needed for Supabase (direct connection)
 
+// Flask backend calls carry the session token from its login response
+// (access_token / refresh_token are stored with currentUser)
+function authHeaders(headers = {}) {
+    const token = currentUser && currentUser.access_token;
+    return token ? { ...headers, Authorization: `Bearer ${token}` } : headers;
+}
+
 // ================= GLOBALS =================
 var currentUser = null;
 var currentChat = null;
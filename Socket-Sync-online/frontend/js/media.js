@@ -7,16 +7,24 @@ function renderMediaContent(msg) {
     // Fix for quoting in inline handlers
     const safeUrl = url.replace(/'/g, "\\'");
 
+    // Prefer the server-generated variants: the bubble shows the small WebP
+    // (blur placeholder behind it) and the original only loads in the modal.
+    const placeholderStyle = msg.placeholder
+        ? ` style="background:url('${msg.placeholder}') center/cover"`
+        : "";
+
     if (msg.file_type && msg.file_type.startsWith("image")) {
+        const thumb = msg.thumb_url ? API_BASE + msg.thumb_url : url;
         return `
-            <div class="media-box" onclick="openImageModal('${safeUrl}')">
-                <img src="${url}" class="chat-image">
+            <div class="media-box" onclick="openImageModal('${safeUrl}')"${placeholderStyle}>
+                <img src="${thumb}" class="chat-image" loading="lazy">
             </div>
         `;
     }
     else if (msg.file_type && msg.file_type.startsWith("video")) {
+        const poster = msg.poster_url ? ` poster="${API_BASE + msg.poster_url}"` : "";
         return `
-            <video class="chat-video" onclick="openVideoModal('${safeUrl}')">
+            <video class="chat-video" preload="none"${poster} onclick="openVideoModal('${safeUrl}')">
                 <source src="${url}">
             </video>
         `;
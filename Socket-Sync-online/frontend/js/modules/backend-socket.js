@@ -0,0 +1,211 @@
+// ================= BACKEND SOCKET (OPTIONAL) =================
+// Live events that only the Flask backend produces (e.g. thumbnails that
+// finish rendering after a message was sent). Supabase Realtime stays the
+// main channel; this connects only when the stored login carries a backend
+// access_token, and only then fetches the Socket.IO client script.
+//
+// Every event the server records carries {seq, epoch}. The last one seen is
+// kept in localStorage; on (re)connect the client asks to "resume" from it
+// and the server replays what was missed, or answers "resync_required" when
+// the gap is too old, and the open views are reloaded instead.
+
+const BACKEND_URL = window.BACKEND_URL || API_BASE;
+const SOCKET_IO_SRC = "https://cdn.socket.io/4.7.5/socket.io.min.js";
+let backendSocket = null;
+let backendConnectedOnce = false;
+
+function loadSocketIo() {
+    if (typeof io === 'function') return Promise.resolve();
+    return new Promise((resolve, reject) => {
+        const script = document.createElement("script");
+        script.src = SOCKET_IO_SRC;
+        script.onload = resolve;
+        script.onerror = reject;
+        document.head.appendChild(script);
+    });
+}
+
+async function setupBackendSocket() {
+    if (!currentUser || !currentUser.access_token || backendSocket) return;
+    try {
+        await loadSocketIo();
+    } catch (e) {
+        console.error("Socket.IO client failed to load", e);
+        return;
+    }
+
+    backendSocket = io(BACKEND_URL || undefined, {
+        auth: { token: currentUser.access_token }
+    });
+
+    backendSocket.on("connect", () => {
+        backendSocket.emit("join", { room: currentUser.user_id });
+        if (currentChat) joinPairRoom(currentChat);
+
+        const pos = loadReplayPosition();
+        backendSocket.emit("resume", {
+            user_id: currentUser.user_id,
+            epoch: pos ? pos.epoch : null,
+            last_seq: pos ? pos.seq : null
+        });
+    });
+
+    // Refused at connect: the access token most likely expired
+    backendSocket.on("connect_error", async () => {
+        if (await refreshBackendSession()) {
+            backendSocket.auth.token = currentUser.access_token;
+            backendSocket.connect();
+        }
+    });
+
+    backendSocket.on("resumed", data => {
+        saveReplayPosition(data);
+        backendConnectedOnce = true;
+    });
+
+    backendSocket.on("resync_required", data => {
+        saveReplayPosition(data);
+        // The first connect of a page load just fetched everything anyway
+        if (backendConnectedOnce) {
+            if (typeof loadUsers === 'function') loadUsers();
+            if (currentChat) loadMessages(currentChat);
+        }
+        backendConnectedOnce = true;
+    });
+
+    // Live and replayed events share the same handlers
+    Object.keys(BACKEND_EVENTS).forEach(event => {
+        backendSocket.on(event, data => {
+            BACKEND_EVENTS[event](data);
+            trackReplayPosition(data);
+        });
+    });
+}
+
+// ---------- session ----------
+async function refreshBackendSession() {
+    if (!currentUser.refresh_token) return false;
+    try {
+        const r = await fetch(`${BACKEND_URL}/auth/refresh`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: currentUser.refresh_token })
+        });
+        if (!r.ok) return false;
+        Object.assign(currentUser, await r.json());
+        localStorage.setItem("currentUser", JSON.stringify(currentUser));
+        return true;
+    } catch (e) {
+        return false;
+    }
+}
+
+// ---------- replay position ----------
+function replayKey() {
+    return `replay:${currentUser.user_id}`;
+}
+
+function loadReplayPosition() {
+    try {
+        return JSON.parse(localStorage.getItem(replayKey()));
+    } catch (e) {
+        return null;
+    }
+}
+
+function saveReplayPosition(data) {
+    localStorage.setItem(replayKey(), JSON.stringify({ epoch: data.epoch, seq: data.seq }));
+}
+
+function trackReplayPosition(data) {
+    if (!data || data.seq === undefined) return;
+    const pos = loadReplayPosition();
+    if (!pos || pos.epoch !== data.epoch || data.seq > pos.seq) saveReplayPosition(data);
+}
+
+// ---------- rooms ----------
+function pairRoom(otherId) {
+    return [currentUser.user_id, otherId].sort().join("-");
+}
+
+function joinPairRoom(otherId) {
+    if (backendSocket && backendSocket.connected) {
+        backendSocket.emit("join", { room: pairRoom(otherId), with: otherId });
+    }
+}
+
+// ---------- handlers ----------
+function findCachedMessage(id) {
+    let found = null;
+    messageCache.forEach(msgs => {
+        found = found || msgs.find(m => m.id == id) || null;
+    });
+    return found;
+}
+
+function updateCachedMessage(id, fields) {
+    const local = findCachedMessage(id);
+    if (!local) return;
+    handleMessageUpdate({
+        id: local.id,
+        is_revoked: fields.is_revoked !== undefined ? fields.is_revoked : local.is_revoked,
+        status: fields.status || local.status
+    });
+}
+
+function forgetMessage(id) {
+    removeMsgFromUI(id);
+    messageCache.forEach(msgs => {
+        const idx = msgs.findIndex(m => m.id == id);
+        if (idx > -1) msgs.splice(idx, 1);
+    });
+}
+
+function handleMessageMedia(data) {
+    // data: { id, thumb_url | poster_url, placeholder }
+    const local = findCachedMessage(data.id);
+    if (!local) return;
+    Object.assign(local, {
+        thumb_url: data.thumb_url || local.thumb_url,
+        poster_url: data.poster_url || local.poster_url,
+        placeholder: data.placeholder || local.placeholder
+    });
+
+    // Swap only the media element so the rest of the bubble keeps its state
+    const el = document.getElementById(`msg-${local.id}`);
+    const media = el && el.querySelector(".media-box, .chat-video");
+    if (media && !local.is_revoked && typeof renderMediaContent === 'function') {
+        media.outerHTML = renderMediaContent(local);
+    }
+}
+
+const BACKEND_EVENTS = {
+    receive_message: data => {
+        handleIncomingMessage({ ...data, sender: data.from, receiver: data.to });
+        if (data.thumb_url || data.poster_url) handleMessageMedia(data);
+    },
+    message_media: handleMessageMedia,
+    message_revoked: data => updateCachedMessage(data.id, { is_revoked: true }),
+    bulk_message_revoked: data => data.ids.forEach(id => updateCachedMessage(id, { is_revoked: true })),
+    message_deleted: data => forgetMessage(data.id),
+    bulk_message_deleted: data => data.ids.forEach(forgetMessage),
+    message_delivered: data => updateCachedMessage(data.id, { status: "delivered" }),
+    messages_read: data => {
+        // Everything read_all_from sent to the reader is now read
+        (messageCache.get(data.by) || []).forEach(m => {
+            if (m.from === data.read_all_from) updateCachedMessage(m.id, { status: "read" });
+        });
+    }
+};
+
+// Pair rooms follow the open chat
+const _openChat = openChat;
+openChat = function (userId, name, avatar) {
+    _openChat(userId, name, avatar);
+    joinPairRoom(userId);
+};
+window.openChat = openChat;
+
+setupBackendSocket();
+
+window.setupBackendSocket = setupBackendSocket;
@@ -0,0 +1,208 @@
+import inspect
+
+import pytest
+
+import database
+import metrics
+from database import ROUND_TRIP_BUDGET
+from rtdb_emulator import Emulator
+
+USERS = ("alice", "bob", "carol")
+
+
+def _seed(emulator):
+    db = database.Database()
+    db._attach(emulator.reference("/"))
+    for uid in USERS:
+        db.create_user({"userId": uid, "name": uid.title(), "password": "pw", "avatar": "a.png"})
+    db.add_contact("alice", "bob")
+    db.add_contact("alice", "carol")
+    media = db.save_message({"sender": "alice", "receiver": "bob", "message": "hi",
+                             "file_url": "uploads/x.png", "file_type": "image/png"})
+    text = db.save_message({"sender": "alice", "receiver": "bob", "message": "yo",
+                            "file_url": None, "file_type": None})
+    db.toggle_block("alice", "carol")
+    db.update_qr_token("bob", "tok")
+    return media, text
+
+
+@pytest.fixture
+def env():
+    """A fresh, instrumented Database (cold caches) over seeded storage."""
+    emulator = Emulator(seed=1)
+    media, text = _seed(emulator)
+    db = database.Database()
+    db._attach(emulator.reference("/"))
+    metrics.instrument_database(db)
+    return db, {"media": media, "text": text}
+
+
+# method -> (call, items); items is the fan-out size the per-item budget scales by
+SCENARIOS = {
+    "get_user_by_id": (lambda db, m: db.get_user_by_id("alice"), 0),
+    "create_user": (lambda db, m: db.create_user(
+        {"userId": "dave", "name": "Dave", "password": "pw", "avatar": "a.png"}), 0),
+    "update_password": (lambda db, m: db.update_password("alice", "hash"), 0),
+    "get_qr_token": (lambda db, m: db.get_qr_token("bob"), 0),
+    "update_qr_token": (lambda db, m: db.update_qr_token("bob", "tok2"), 0),
+    "get_user_by_qr_token": (lambda db, m: db.get_user_by_qr_token("tok"), 0),
+    "update_avatar": (lambda db, m: db.update_avatar("alice", "b.png"), 0),
+    "update_login_streak": (lambda db, m: db.update_login_streak("alice"), 0),
+    "get_profile_stats": (lambda db, m: db.get_profile_stats("alice"), 2),
+    "delete_user_data": (lambda db, m: db.delete_user_data("carol"), 0),
+    "rebuild_user_directory": (lambda db, m: db.rebuild_user_directory(), 0),
+    "search_users": (lambda db, m: db.search_users("al"), 0),
+    "get_all_users": (lambda db, m: db.get_all_users(), 0),
+    "save_message": (lambda db, m: db.save_message(
+        {"sender": "bob", "receiver": "alice", "message": "m",
+         "file_url": "uploads/y.png", "file_type": "image/png"}), 0),
+    "get_message_by_id": (lambda db, m: db.get_message_by_id(m["text"]), 0),
+    "update_message_media": (lambda db, m: db.update_message_media(m["media"], {"thumb_url": "t"}), 0),
+    "get_messages_between": (lambda db, m: db.get_messages_between("alice", "bob"), 0),
+    "delete_message": (lambda db, m: db.delete_message(m["text"]), 0),
+    "delete_message_for_user": (lambda db, m: db.delete_message_for_user(m["media"], "bob"), 0),
+    "bulk_delete_messages": (lambda db, m: db.bulk_delete_messages([m["media"], m["text"]]), 2),
+    "bulk_delete_message_for_user": (
+        lambda db, m: db.bulk_delete_message_for_user([m["media"], m["text"]], "bob"), 2),
+    "mark_messages_read": (lambda db, m: db.mark_messages_read("alice", "bob"), 0),
+    "mark_message_delivered": (lambda db, m: db.mark_message_delivered(m["text"]), 0),
+    "mark_offline_messages_delivered": (lambda db, m: db.mark_offline_messages_delivered("bob"), 0),
+    "get_user_message_counts": (lambda db, m: db.get_user_message_counts(), 0),
+    "get_chat_media": (lambda db, m: db.get_chat_media("alice", "bob"), 0),
+    "clear_chat": (lambda db, m: db.clear_chat("alice", "bob"), 0),
+    "add_contact": (lambda db, m: db.add_contact("bob", "carol"), 0),
+    "remove_contact": (lambda db, m: db.remove_contact("alice", "bob"), 0),
+    "get_contacts": (lambda db, m: db.get_contacts("alice"), 2),
+    "get_chat_list": (lambda db, m: db.get_chat_list("alice"), 0),
+    "toggle_block": (lambda db, m: db.toggle_block("alice", "bob"), 0),
+    "is_blocked": (lambda db, m: db.is_blocked("alice", "carol"), 0),
+    "get_block_state": (lambda db, m: db.get_block_state("alice", "carol"), 0),
+    "scoped": (lambda db, m: db.scoped(), 0),
+    "conversation_etag": (lambda db, m: db.conversation_etag("alice", "bob"), 0),
+    "chat_list_etag": (lambda db, m: db.chat_list_etag("alice"), 0),
+    "contacts_etag": (lambda db, m: db.contacts_etag("alice"), 0),
+}
+
+
+def _allowed(method, items):
+    reads, writes, per_read, per_write = (ROUND_TRIP_BUDGET[method] + (0, 0))[:4]
+    return reads + per_read * items, writes + per_write * items
+
+
+def _describe(call):
+    return "\n".join(f"  {op} {path}" for op, path in call.ops)
+
+
+def test_every_public_method_has_a_budget():
+    public = {name for name, _ in inspect.getmembers(database.Database, inspect.isfunction)
+              if not name.startswith("_")}
+    assert public - set(ROUND_TRIP_BUDGET) == set(), "add these to ROUND_TRIP_BUDGET"
+    assert set(ROUND_TRIP_BUDGET) - public == set(), "stale ROUND_TRIP_BUDGET entries"
+    assert set(SCENARIOS) == set(ROUND_TRIP_BUDGET)
+
+
+@pytest.mark.parametrize("method", sorted(SCENARIOS))
+def test_round_trip_budget(env, method):
+    db, msgs = env
+    call, items = SCENARIOS[method]
+    with metrics.track() as counted:
+        call(db, msgs)
+    reads, writes = _allowed(method, items)
+    assert counted.reads <= reads and counted.writes <= writes, (
+        f"{method}: {counted.reads} reads / {counted.writes} writes, "
+        f"budget {reads} / {writes}\n{_describe(counted)}")
+
+
+# ---------- cheaper paths the budget table doesn't cover ----------
+def test_delete_message_reuses_a_preloaded_record(env):
+    db, msgs = env
+    msg = db.get_message_by_id(msgs["text"])
+    with metrics.track() as counted:
+        assert db.delete_message(msgs["text"], msg=msg)
+    assert (counted.reads, counted.writes) == (1, 1)   # inbox last_key + the update
+
+
+def test_delete_message_refuses_other_senders(env):
+    db, msgs = env
+    with metrics.track() as counted:
+        assert not db.delete_message(msgs["text"], only_sender="bob")
+    assert counted.writes == 0
+
+
+def test_get_message_by_id_uses_hot_window(env):
+    db, msgs = env
+    db.get_messages_between("alice", "bob")
+    with metrics.track() as counted:
+        assert db.get_message_by_id(msgs["text"])["message"] == "yo"
+    assert (counted.reads, counted.writes) == (1, 0)
+
+
+def test_toggle_block_with_explicit_state_skips_the_read(env):
+    db, _ = env
+    with metrics.track() as counted:
+        assert db.toggle_block("alice", "bob", True) is True
+        assert db.toggle_block("alice", "bob", False) is False
+    assert (counted.reads, counted.writes) == (0, 2)
+    assert db.get_block_state("alice", "bob") == "none"
+
+
+def test_create_user_duplicate_answered_by_directory(env):
+    db, _ = env
+    db.search_users()   # loads the directory mirror
+    with metrics.track() as counted:
+        assert db.create_user({"userId": "alice", "name": "A", "password": "pw",
+                               "avatar": "a.png"}) == (False, "User already exists")
+    assert counted.trips == 0
+
+
+def test_nested_tracking_rolls_up(env):
+    db, _ = env
+    with metrics.track() as outer:
+        db.get_user_by_id("alice")
+        with metrics.track() as inner:
+            db.get_contacts("alice")
+    assert inner.reads == 3
+    assert outer.reads == 4
+
+
+def test_chat_list_includes_contacts_without_a_conversation(env):
+    db, _ = env
+    chats = db.get_chat_list("alice")
+    assert [c["user_id"] for c in chats] == ["bob", "carol"]
+    assert chats[1]["last_message"] is None and chats[1]["unread_count"] == 0
+
+
+def test_revoking_a_read_delivered_message_keeps_unread_at_zero(env):
+    db, msgs = env
+    db.mark_message_delivered(msgs["text"])
+    assert db.mark_messages_read("alice", "bob") == 2
+    assert db.delete_message(msgs["text"])
+    assert db.get_chat_list("bob")[0]["unread_count"] == 0
+    assert db.ref.child("inbox").child("bob").child("alice").child("unread").get() == 0
+
+
+def test_fill_that_raced_a_write_is_not_cached(env):
+    db, _ = env
+    pair = db._get_pair_id("alice", "bob")
+    since = db.message_cache.fill_token()
+    stale = db.chats_ref.child(pair).child("messages").get()
+    db.save_message({"sender": "bob", "receiver": "alice", "message": "late",
+                     "file_url": None, "file_type": None})
+    assert not db.message_cache.put(pair, stale, since=since)
+    assert [m["message"] for m in db.get_messages_between("alice", "bob")][-1] == "late"
+
+
+def test_late_delivery_receipt_never_downgrades_a_read_message(env):
+    db, msgs = env
+    db.mark_messages_read("alice", "bob")
+    assert not db.mark_message_delivered(msgs["text"])
+    assert db.get_message_by_id(msgs["text"])["status"] == "read"
+    assert db.delete_message(msgs["text"])
+    assert db.ref.child("inbox").child("bob").child("alice").child("unread").get() == 0
+
+
+def test_only_the_receiver_marks_a_message_delivered(env):
+    db, msgs = env
+    assert not db.mark_message_delivered(msgs["text"], receiver="carol")
+    assert not db.mark_message_delivered(msgs["text"], receiver="alice")
+    assert db.mark_message_delivered(msgs["text"], receiver="bob")
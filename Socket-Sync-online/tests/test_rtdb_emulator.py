@@ -0,0 +1,193 @@
+import time
+
+import pytest
+
+import database
+from rtdb_emulator import Emulator, EmulatorError
+
+
+@pytest.fixture
+def root():
+    return Emulator(seed=1).reference("/")
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    monkeypatch.setattr(database, "STORAGE_BACKEND", "memory")
+    return database.Database()
+
+
+# ---------- tree semantics ----------
+def test_set_get_and_child_paths(root):
+    root.child("users/alice").set({"name": "Alice", "age": 30})
+    assert root.child("users").child("alice/name").get() == "Alice"
+    assert root.child("users/bob").get() is None
+    assert root.child("users/alice").key == "alice"
+    assert root.child("users/alice").parent.path == "/users"
+
+
+def test_get_returns_a_copy(root):
+    root.child("a").set({"b": 1})
+    value = root.child("a").get()
+    value["b"] = 2
+    assert root.child("a/b").get() == 1
+
+
+def test_nulls_and_empty_objects_are_not_stored(root):
+    root.child("a").set({"b": None, "c": {}, "d": 1})
+    assert root.child("a").get() == {"d": 1}
+    root.child("a/d").delete()
+    assert root.get() is None
+
+
+def test_lists_are_stored_as_index_keyed_objects(root):
+    root.child("l").set(["x", "y"])
+    assert root.child("l").get() == {"0": "x", "1": "y"}
+
+
+@pytest.mark.parametrize("key", ["a.b", "a$", "a#", "a[", "a]", "a\x01"])
+def test_invalid_keys_are_rejected(root, key):
+    with pytest.raises(EmulatorError):
+        root.child("x").set({key: 1})
+
+
+def test_server_values(root):
+    emulator = Emulator(now=lambda: 1700000000.0)
+    ref = emulator.reference("/")
+    ref.update({"n": {".sv": {"increment": 2}}, "t": {".sv": "timestamp"}})
+    ref.update({"n": {".sv": {"increment": 3}}})
+    assert ref.child("n").get() == 5
+    assert ref.child("t").get() == 1700000000000
+
+
+# ---------- multi-path update ----------
+def test_multi_path_update_writes_every_path(root):
+    root.child("chats/p/messages/m1").set({"text": "hi", "status": "sent"})
+    root.update({"chats/p/messages/m1/status": "read", "message_index/m1": {"pair": "p"}})
+    assert root.child("chats/p/messages/m1").get() == {"text": "hi", "status": "read"}
+    assert root.child("message_index/m1/pair").get() == "p"
+
+
+def test_update_null_deletes(root):
+    root.child("a").set({"b": 1, "c": 2})
+    root.child("a").update({"b": None})
+    assert root.child("a").get() == {"c": 2}
+
+
+def test_update_rejects_overlapping_paths(root):
+    with pytest.raises(EmulatorError):
+        root.update({"a/b": {"c": 1}, "a/b/c": 2})
+    assert root.get() is None
+
+
+def test_update_rejects_empty_and_invalid(root):
+    with pytest.raises(EmulatorError):
+        root.update({})
+    with pytest.raises(EmulatorError):
+        root.update({"ok": 1, "bad.key": 2})
+    assert root.get() is None
+
+
+# ---------- push ids ----------
+def test_transaction_updates_from_the_current_value(root):
+    root.child("m/status").set("read")
+    assert root.child("m/status").transaction(lambda s: "delivered" if s == "sent" else s) == "read"
+    root.child("n").transaction(lambda v: (v or 0) + 1)
+    root.child("n").transaction(lambda v: (v or 0) + 1)
+    assert root.get() == {"m": {"status": "read"}, "n": 2}
+
+
+def test_push_ids_are_ordered_and_unique():
+    emulator = Emulator(seed=3, now=lambda: 1700000000.0)   # all in one millisecond
+    ids = [emulator.push_id() for _ in range(200)]
+    assert len(set(ids)) == 200
+    assert ids == sorted(ids)
+    assert all(len(i) == 20 for i in ids)
+
+
+def test_push_ids_are_deterministic_with_a_seed():
+    clock = lambda: 1700000000.0
+    assert Emulator(seed=9, now=clock).push_id() == Emulator(seed=9, now=clock).push_id()
+
+
+def test_push_writes_under_generated_key(root):
+    ref = root.child("items").push({"v": 1})
+    assert root.child("items").get() == {ref.key: {"v": 1}}
+
+
+# ---------- ordering and queries ----------
+def test_order_by_key_puts_integer_keys_first(root):
+    root.child("k").set({"b": 1, "10": 1, "a": 1, "2": 1, "-1": 1, "01": 1})
+    assert list(root.child("k").order_by_key().get()) == ["-1", "2", "10", "01", "a", "b"]
+
+
+def test_order_by_child_type_order_and_key_ties(root):
+    root.child("m").set({
+        "e": {"v": "x"}, "d": {"v": 5}, "c": {"v": True},
+        "b": {"w": 1}, "a": {"v": 5}, "f": {"v": {"n": 1}},
+    })
+    assert list(root.child("m").order_by_child("v").get()) == ["b", "c", "a", "d", "e", "f"]
+
+
+def test_equal_to_and_limits(root):
+    users = root.child("users")
+    for uid, phone in (("u1", "111"), ("u2", "222"), ("u3", "111")):
+        users.child(uid).set({"phone": phone})
+    assert list(users.order_by_child("phone").equal_to("111").get()) == ["u1", "u3"]
+    assert list(users.order_by_child("phone").equal_to("111").limit_to_first(1).get()) == ["u1"]
+    assert list(users.order_by_key().limit_to_last(2).get()) == ["u2", "u3"]
+    assert list(users.order_by_key().start_at("u2").end_at("u2").get()) == ["u2"]
+
+
+def test_order_by_value(root):
+    root.child("scores").set({"a": 3, "b": 1, "c": 2})
+    assert list(root.child("scores").order_by_value().get()) == ["b", "c", "a"]
+    assert list(root.child("scores").order_by_value().start_at(2).get()) == ["c", "a"]
+
+
+def test_query_validation(root):
+    query = root.child("x").order_by_key()
+    with pytest.raises(EmulatorError):
+        query.equal_to(1)
+    with pytest.raises(EmulatorError):
+        query.limit_to_first(1).limit_to_last(1)
+
+
+# ---------- latency and accounting ----------
+def test_oplog_counts_every_call(root):
+    emulator = root._emulator
+    root.child("a").set({"b": 1})
+    root.child("a").get()
+    root.child("a").order_by_key().get()
+    assert emulator.counts == {"set": 1, "get": 1, "query": 1}
+    assert [op["path"] for op in emulator.oplog] == ["/a", "/a", "/a"]
+    assert emulator.oplog[0]["bytes"] == len('{"b":1}')
+    emulator.reset_stats()
+    assert emulator.counts == {} and emulator.oplog == []
+
+
+def test_injected_latency():
+    ref = Emulator(latency=0.02, jitter=0.005, seed=1).reference("/")
+    started = time.perf_counter()
+    for _ in range(5):
+        ref.child("a").get()
+    assert time.perf_counter() - started >= 5 * 0.015
+
+
+# ---------- Database on the emulator ----------
+def test_database_message_round_trip(memory_db):
+    for uid in ("alice", "bob"):
+        memory_db.create_user({"userId": uid, "name": uid, "password": "pw", "avatar": "a.png"})
+    key = memory_db.save_message({"sender": "alice", "receiver": "bob", "message": "hi",
+                                  "file_url": None, "file_type": None})
+    assert [m["message"] for m in memory_db.get_messages_between("alice", "bob")] == ["hi"]
+    assert memory_db.get_message_by_id(key)["sender"] == "alice"
+    memory_db.delete_message(key, only_sender="alice")
+    assert memory_db.get_message_by_id(key)["is_revoked"] is True
+
+
+def test_database_runs_with_emulator_storage(memory_db):
+    assert memory_db.emulator is not None
+    memory_db.create_user({"userId": "carol", "name": "Carol", "password": "pw", "avatar": "a.png"})
+    assert memory_db.get_user_by_id("carol")["name"] == "Carol"
+    assert memory_db.emulator.counts.get("get", 0) + memory_db.emulator.counts.get("query", 0) >= 1
@@ -0,0 +1,28 @@
+from user_directory import UserDirectory
+
+
+def _directory(*entries):
+    d = UserDirectory()
+    d.load([{"user_id": uid, "name": name, "avatar": None} for uid, name in entries])
+    return d
+
+
+def _found(d, query):
+    return [e["user_id"] for e in d.search(query)["users"]]
+
+
+def test_search_matches_non_ascii_names():
+    d = _directory(("zoe", "Zoë Müller"), ("ivan", "Иван Петров"), ("mei", "王美"),
+                   ("jo", "Jo Smith"))
+    assert _found(d, "zoë") == ["zoe"]
+    assert _found(d, "MÜL") == ["zoe"]
+    assert _found(d, "иван") == ["ivan"]
+    assert _found(d, "пет") == ["ivan"]
+    assert _found(d, "王") == ["mei"]
+    assert _found(d, "jo sm") == ["jo"]
+
+
+def test_search_casefolds_and_splits_on_underscores():
+    d = _directory(("the_strasse", "Straße Team"))
+    assert _found(d, "STRASSE") == ["the_strasse"]
+    assert _found(d, "strasse team") == ["the_strasse"]